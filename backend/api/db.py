@@ -69,6 +69,13 @@ class TimescaleDatabase:
             return df.reindex(columns=list(columns))
         return df
 
+    async def fetch_row(self, query: str, *params: Any) -> dict[str, Any] | None:
+        """Execute a query and return its first row as a dict (``None`` if empty)."""
+        pool = await self._ensure_pool()
+        async with pool.acquire() as conn:
+            record = await conn.fetchrow(query, *params)
+        return dict(record) if record is not None else None
+
     async def close(self) -> None:
         """Close the connection pool (mostly useful for tests)."""
         if self._pool is not None:
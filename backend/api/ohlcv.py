@@ -2,13 +2,23 @@
 
 from __future__ import annotations
 
+import math
+import os
 from datetime import datetime, timedelta
 from typing import Any, Dict, List
 
 import pandas as pd
 import pytz
-from fastapi import APIRouter, HTTPException, Query
-
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+
+from ..common.http_cache import (
+    NO_CACHE,
+    Validator,
+    historical_cache_control,
+    make_etag,
+    not_modified_response,
+)
+from ..common.session_calendar import get_calendar
 from .db import db
 
 router = APIRouter(prefix="/api", tags=["ohlcv"])
@@ -17,6 +27,7 @@ NY_TZ = pytz.timezone("America/New_York")
 UTC = pytz.UTC
 
 DEFAULT_LOOKBACK = timedelta(days=365)
+HISTORICAL_MAX_AGE_S = int(os.getenv("OHLCV_HISTORICAL_MAX_AGE_S", "3600"))
 EXPECTED_COLUMNS = ("time", "open", "high", "low", "close", "volume")
 
 VIEW_MAP = {
@@ -31,14 +42,20 @@ VIEW_MAP = {
 
 @router.get("/ohlcv/{symbol}")
 async def get_ohlcv_with_live_head(
+    request: Request,
+    response: Response,
     symbol: str,
     timeframe: str = Query(..., pattern=r"^(1m|5m|15m|1h|4h|1d)$"),
     start: datetime | None = None,
     end: datetime | None = None,
-) -> Dict[str, Any]:
+) -> Any:
     """
     Return session-anchored OHLCV candles with the live (incomplete) bar stitched
     onto the historical continuous aggregate output.
+
+    Honours ``If-None-Match``/``If-Modified-Since`` using a validator that is
+    derived from the window and the live bucket only, so unchanged history is
+    answered with ``304`` without running the aggregate query.
     """
     view_name = VIEW_MAP.get(timeframe)
     if view_name is None:
@@ -60,6 +77,19 @@ async def get_ohlcv_with_live_head(
     if historical_end_ny <= start_ny:
         return _empty_response(symbol, timeframe, now_ny)
 
+    live_window_end = end_ny if end_ny and end_ny < now_ny else now_ny
+    validator = await _ohlcv_validator(
+        symbol.upper(),
+        timeframe,
+        start_ny,
+        historical_end_ny,
+        live_bucket_start if include_live else None,
+        live_window_end,
+    )
+    not_modified = not_modified_response(request.headers, validator)
+    if not_modified is not None:
+        return not_modified
+
     historical_df = await db.fetch_df(
         f"""
         SELECT
@@ -84,7 +114,6 @@ async def get_ohlcv_with_live_head(
     historical_df = _prepare_historical_df(historical_df)
 
     live_records: List[Dict[str, Any]] = []
-    live_window_end = end_ny if end_ny and end_ny < now_ny else now_ny
     if include_live and live_window_end > live_bucket_start:
         live_df = await db.fetch_df(
             """
@@ -122,6 +151,7 @@ async def get_ohlcv_with_live_head(
 
     result_df = _stitch_results(historical_df, live_records)
     data = _serialize_records(result_df)
+    validator.apply(response)
 
     return {
         "symbol": symbol.upper(),
@@ -132,34 +162,83 @@ async def get_ohlcv_with_live_head(
     }
 
 
-def get_current_bucket_start(now_ny: datetime, timeframe: str) -> datetime:
-    """Calculate session-anchored bucket start for the provided timeframe."""
-    market_open = now_ny.replace(hour=9, minute=30, second=0, microsecond=0)
-
-    if timeframe == "1m":
-        return now_ny.replace(second=0, microsecond=0)
+async def _ohlcv_validator(
+    symbol: str,
+    timeframe: str,
+    start_ny: datetime,
+    historical_end_ny: datetime,
+    live_bucket_start: datetime | None,
+    live_window_end: datetime,
+) -> Validator:
+    """Build a validator from the window plus a cheap fingerprint of the live bucket."""
+    # Buckets are minute aligned, so rounding ``start`` up keeps a sliding default
+    # lookback from changing the ETag on every request.
+    start_key = math.ceil(start_ny.timestamp() / 60) * 60
+    end_key = int(historical_end_ny.timestamp())
+
+    if live_bucket_start is None:
+        return Validator(
+            etag=make_etag("ohlcv", symbol, timeframe, start_key, end_key),
+            last_modified_s=end_key,
+            cache_control=historical_cache_control(HISTORICAL_MAX_AGE_S),
+        )
 
-    if timeframe in {"5m", "15m"}:
-        interval = 5 if timeframe == "5m" else 15
-        minutes_since_open = max(0, int((now_ny - market_open).total_seconds() // 60))
-        bucket_num = minutes_since_open // interval
-        return market_open + timedelta(minutes=bucket_num * interval)
+    head = await db.fetch_row(
+        """
+        SELECT count(*) AS n, max(time) AS last, sum(volume) AS volume,
+               max(high) AS high, min(low) AS low
+        FROM stock_prices
+        WHERE symbol = $1
+          AND time >= $2
+          AND time < $3
+        """,
+        symbol,
+        live_bucket_start.astimezone(UTC),
+        live_window_end.astimezone(UTC),
+    ) or {}
+    last = head.get("last")
+    last_modified = int(last.timestamp()) if isinstance(last, datetime) else end_key
+    return Validator(
+        etag=make_etag(
+            "ohlcv",
+            symbol,
+            timeframe,
+            start_key,
+            end_key,
+            head.get("n"),
+            last_modified,
+            head.get("volume"),
+            head.get("high"),
+            head.get("low"),
+        ),
+        last_modified_s=max(end_key, last_modified),
+        cache_control=NO_CACHE,
+    )
 
-    if timeframe == "1h":
-        bucket = now_ny.replace(minute=0, second=0, microsecond=0)
-        return bucket if bucket >= market_open else market_open
 
-    if timeframe == "4h":
-        first_bucket = market_open
-        second_bucket = market_open.replace(hour=13, minute=30)
-        if now_ny < second_bucket:
-            return first_bucket
-        return second_bucket
+def get_current_bucket_start(now_ny: datetime, timeframe: str) -> datetime:
+    """Calculate session-anchored bucket start for the provided timeframe."""
+    if timeframe not in VIEW_MAP:
+        raise ValueError(f"Unsupported timeframe '{timeframe}'.")
 
-    if timeframe == "1d":
-        return market_open
+    calendar = get_calendar()
+    now_s = int(now_ny.timestamp())
+    market_open, _ = calendar.open_close(now_s)
 
-    raise ValueError(f"Unsupported timeframe '{timeframe}'.")
+    if timeframe == "1m":
+        bucket = now_s - now_s % 60
+    elif timeframe in {"5m", "15m"}:
+        bucket = calendar.align(now_s, timeframe)
+    elif timeframe == "1h":
+        # The 1h views bucket on clock hours; ET offsets are whole hours.
+        bucket = max(now_s - now_s % 3600, market_open)
+    elif timeframe == "4h":
+        second_bucket = market_open + 4 * 3600
+        bucket = second_bucket if now_s >= second_bucket else market_open
+    else:
+        bucket = market_open
+
+    return datetime.fromtimestamp(bucket, NY_TZ)
 
 
 def _ensure_ny_timezone(dt: datetime | None) -> datetime | None:
@@ -2,20 +2,63 @@
 
 from __future__ import annotations
 
+import os
+import time
 from typing import Literal
 
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 
+from ..common.http_cache import (
+    NO_CACHE,
+    Validator,
+    historical_cache_control,
+    live_heads,
+    make_etag,
+    not_modified_response,
+)
 from .config import ALLOWED_TFS
 from .db_timescale import fetch_latest, fetch_ohlc
+from .sessions import align_bucket_start_ms
 
 router = APIRouter(prefix="/ohlc", tags=["ohlc"])
 
 TF = Literal["1m", "5m", "10m", "15m", "1h", "4h", "1d"]
 
+HISTORICAL_MAX_AGE_S = int(os.getenv("OHLC_HISTORICAL_MAX_AGE_S", "3600"))
+# Without a live feed in this process the live head is versioned by wall-clock quanta.
+LIVE_ETAG_QUANTUM_MS = int(os.getenv("OHLC_LIVE_ETAG_QUANTUM_MS", "5000"))
+
+
+def ohlc_validator(symbol: str, tf: str, start: int, end: int, now_ms: int | None = None) -> Validator:
+    """Build the /ohlc validator from the window and live-head state without querying."""
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+    # Everything strictly before the live bucket is closed.
+    live_start_ms = align_bucket_start_ms(now_ms, tf)
+
+    if end < live_start_ms:
+        return Validator(
+            etag=make_etag("ohlc", symbol, tf, start, end),
+            last_modified_s=end // 1000,
+            cache_control=historical_cache_control(HISTORICAL_MAX_AGE_S),
+        )
+
+    head = live_heads.get(symbol, tf)
+    if head is None:
+        quantum = now_ms // LIVE_ETAG_QUANTUM_MS
+        head = (quantum, quantum * LIVE_ETAG_QUANTUM_MS)
+    version, updated_ms = head
+    return Validator(
+        etag=make_etag("ohlc", symbol, tf, start, end, live_start_ms, version),
+        last_modified_s=max(live_start_ms, updated_ms) // 1000,
+        cache_control=NO_CACHE,
+    )
+
 
 @router.get("")
 async def get_ohlc(
+    request: Request,
+    response: Response,
     symbol: str = Query(..., min_length=1, max_length=16),
     tf: TF = Query(..., description="Timeframe (1m,5m,10m,15m,1h,4h,1d)"),
     start: int = Query(..., description="Start timestamp in UNIX milliseconds"),
@@ -28,7 +71,13 @@ async def get_ohlc(
     if end <= start:
         raise HTTPException(status_code=400, detail="'end' must be greater than 'start'.")
 
+    validator = ohlc_validator(symbol_upper, tf, start, end)
+    not_modified = not_modified_response(request.headers, validator)
+    if not_modified is not None:
+        return not_modified
+
     bars = await fetch_ohlc(symbol_upper, tf, start, end)
+    validator.apply(response)
     return {"symbol": symbol_upper, "tf": tf, "bars": bars}
 
 
@@ -0,0 +1,206 @@
+"""Fixed-capacity NumPy ring buffers of recent bars per (symbol, tf)."""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .core.settings import settings
+from .rollup import BarEvent
+
+BAR_DTYPE = np.dtype(
+    [("ts", "i8"), ("o", "f8"), ("h", "f8"), ("l", "f8"), ("c", "f8"), ("v", "f8")]
+)
+
+Key = Tuple[str, str]
+
+_INITIAL_CAPACITY = 64
+
+
+class RingBuffer:
+    """Most recent bars of one stream, oldest first, in a mirrored structured array.
+
+    Every row is written at ``i`` and ``i + capacity``, so the last ``n`` rows
+    are always one contiguous slice: :meth:`last` returns a view without
+    copying. Views alias the buffer and are only stable until the next write;
+    ``.copy()`` them to keep. Storage starts small and doubles up to
+    ``max_capacity``, after which the oldest row is overwritten.
+    """
+
+    __slots__ = ("data", "capacity", "max_capacity", "head", "size", "last_closed")
+
+    def __init__(self, max_capacity: int, initial: int = _INITIAL_CAPACITY) -> None:
+        self.max_capacity = max(1, max_capacity)
+        self.capacity = min(self.max_capacity, max(1, initial))
+        self.data = np.zeros(2 * self.capacity, dtype=BAR_DTYPE)
+        self.head = 0  # next write position in [0, capacity)
+        self.size = 0
+        self.last_closed = True  # whether the newest row is a finished bar
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    @property
+    def last_ts(self) -> Optional[int]:
+        if not self.size:
+            return None
+        return int(self.data["ts"][(self.head - 1) % self.capacity])
+
+    def _grow(self) -> None:
+        rows = self.last(self.size).copy()
+        self.capacity = min(self.max_capacity, self.capacity * 2)
+        self.data = np.zeros(2 * self.capacity, dtype=BAR_DTYPE)
+        self.data[: self.size] = rows
+        self.data[self.capacity : self.capacity + self.size] = rows
+        self.head = self.size % self.capacity
+
+    def append(self, ts: int, o: float, h: float, low: float, c: float, v: float) -> None:
+        if self.size == self.capacity and self.capacity < self.max_capacity:
+            self._grow()
+        row = (ts, o, h, low, c, v)
+        self.data[self.head] = row
+        self.data[self.head + self.capacity] = row
+        self.head = (self.head + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def update_last(self, ts: int, o: float, h: float, low: float, c: float, v: float) -> None:
+        if not self.size:
+            self.append(ts, o, h, low, c, v)
+            return
+        i = (self.head - 1) % self.capacity
+        row = (ts, o, h, low, c, v)
+        self.data[i] = row
+        self.data[i + self.capacity] = row
+
+    def revise(
+        self, ts: int, o: float, h: float, low: float, c: float, v: float, depth: int = 4
+    ) -> bool:
+        """Overwrite the row starting at ``ts`` among the newest ``depth``; False if absent."""
+        for back in range(1, min(depth, self.size) + 1):
+            i = (self.head - back) % self.capacity
+            row_ts = int(self.data["ts"][i])
+            if row_ts == ts:
+                row = (ts, o, h, low, c, v)
+                self.data[i] = row
+                self.data[i + self.capacity] = row
+                return True
+            if row_ts < ts:
+                break
+        return False
+
+    def last(self, n: Optional[int] = None) -> np.ndarray:
+        """Zero-copy view of the newest ``n`` rows (all rows when ``n`` is None)."""
+        n = self.size if n is None else max(0, min(n, self.size))
+        start = self.head - n
+        if start < 0:
+            start += self.capacity
+        return self.data[start : start + n]
+
+    def clear(self) -> None:
+        self.head = 0
+        self.size = 0
+        self.last_closed = True
+
+
+class BarStore:
+    """Ring buffers keyed by ``(symbol, tf)`` under a total memory cap.
+
+    ``upsert`` is O(1): a bar newer than the last row is appended, the same
+    bucket replaces the last row, an older bar revises one of the last few
+    rows in place (late final bars) or is ignored. When the total
+    size exceeds ``max_bytes`` the least recently written buffers are evicted.
+    """
+
+    def __init__(self, capacity: Optional[int] = None, max_bytes: Optional[int] = None) -> None:
+        self.capacity = capacity or settings.BAR_STORE_CAPACITY
+        self.max_bytes = max_bytes or settings.BAR_STORE_MAX_MB * 1024 * 1024
+        self.buffers: "OrderedDict[Key, RingBuffer]" = OrderedDict()
+        self.nbytes = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.buffers)
+
+    def get(self, symbol: str, tf: str) -> Optional[RingBuffer]:
+        return self.buffers.get((symbol, tf))
+
+    def upsert(
+        self,
+        symbol: str,
+        tf: str,
+        ts: int,
+        o: float,
+        h: float,
+        low: float,
+        c: float,
+        v: float,
+        closed: bool = False,
+    ) -> None:
+        key = (symbol, tf)
+        buf = self.buffers.get(key)
+        if buf is None:
+            buf = self.buffers[key] = RingBuffer(self.capacity)
+            self.nbytes += buf.nbytes
+        else:
+            self.buffers.move_to_end(key)
+        last_ts = buf.last_ts
+        if last_ts is None or ts > last_ts:
+            before = buf.nbytes
+            buf.append(ts, o, h, low, c, v)
+            self.nbytes += buf.nbytes - before
+        elif ts == last_ts:
+            buf.update_last(ts, o, h, low, c, v)
+        else:
+            buf.revise(ts, o, h, low, c, v)  # a late final bar for a recent row
+            return
+        buf.last_closed = closed
+        if self.nbytes > self.max_bytes:
+            self._evict(keep=key)
+
+    def on_event(self, event: BarEvent) -> None:
+        self.upsert(
+            event.symbol,
+            event.tf,
+            event.start_ms,
+            event.o,
+            event.h,
+            event.l,
+            event.c,
+            event.v,
+            closed=event.closed,
+        )
+
+    def last(self, symbol: str, tf: str, n: Optional[int] = None) -> np.ndarray:
+        buf = self.buffers.get((symbol, tf))
+        if buf is None:
+            return np.empty(0, dtype=BAR_DTYPE)
+        return buf.last(n)
+
+    def discard(self, symbol: str, tf: str) -> None:
+        buf = self.buffers.pop((symbol, tf), None)
+        if buf is not None:
+            self.nbytes -= buf.nbytes
+
+    def _evict(self, keep: Key) -> None:
+        while self.nbytes > self.max_bytes and len(self.buffers) > 1:
+            key, buf = next(iter(self.buffers.items()))
+            if key == keep:
+                break
+            del self.buffers[key]
+            self.nbytes -= buf.nbytes
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "buffers": len(self.buffers),
+            "bytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,322 @@
+"""Pub/sub transport that carries rolled-up bars from the ingest process to hub workers.
+
+Demand travels the other way on a control channel: every worker announces
+the ``(symbol, tf)`` keys its clients want, and the hub that runs the feeds
+folds them into one cluster-wide view with :class:`DemandTracker`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .core.settings import settings
+from .rollup import BarEvent
+
+logger = logging.getLogger(__name__)
+
+WILDCARD = "*"
+
+Handler = Callable[[BarEvent], None]
+Key = Tuple[str, str]
+# ``{"w": worker, "add": [symbol, tf]}``, ``{"w": worker, "remove": [...]}`` or
+# ``{"w": worker, "keys": [[symbol, tf], ...]}`` (the worker's whole set).
+DemandMessage = Dict[str, Any]
+DemandHandler = Callable[[DemandMessage], None]
+
+
+def encode_event(event: BarEvent) -> str:
+    # Flags: bit 0 closed, bit 1 gap-fill.
+    flags = int(event.closed) | (2 if event.gapfill else 0)
+    fields = [event.start_ms, event.o, event.h, event.l, event.c, event.v, flags]
+    if event.timing is not None:
+        fields.extend(event.timing)
+    return json.dumps(fields, separators=(",", ":"))
+
+
+def decode_event(symbol: str, tf: str, data: str | bytes) -> BarEvent:
+    fields = json.loads(data)
+    start_ms, o, h, low, c, v, flags = fields[:7]
+    timing = (fields[7], fields[8]) if len(fields) >= 9 else None
+    closed, gapfill = bool(flags & 1), bool(flags & 2)
+    return BarEvent(symbol, tf, int(start_ms), o, h, low, c, v, closed, timing, gapfill)
+
+
+class DemandTracker:
+    """Union of the keys other workers want, from their demand announcements.
+
+    A worker not heard from for ``expire_s`` (it refreshes its whole set
+    periodically) is dropped with its keys. :meth:`apply` and :meth:`expire`
+    return the ``(key, added)`` transitions of the union, so each key counts
+    once however many workers want it.
+    """
+
+    def __init__(self, expire_s: float) -> None:
+        self.expire_s = expire_s
+        # worker -> (last heard from, keys it wants)
+        self.workers: Dict[str, Tuple[float, Set[Key]]] = {}
+        self.counts: Dict[Key, int] = {}
+
+    def keys(self) -> List[Key]:
+        return list(self.counts)
+
+    def apply(self, message: DemandMessage, now: float) -> List[Tuple[Key, bool]]:
+        _, current = self.workers.get(message["w"], (now, set()))
+        wanted = set(current)
+        if "keys" in message:
+            wanted = {(symbol, tf) for symbol, tf in message["keys"]}
+        elif "add" in message:
+            wanted.add(tuple(message["add"]))
+        elif "remove" in message:
+            wanted.discard(tuple(message["remove"]))
+        self.workers[message["w"]] = (now, wanted)
+        return self._diff(current, wanted)
+
+    def expire(self, now: float) -> List[Tuple[Key, bool]]:
+        changes: List[Tuple[Key, bool]] = []
+        for worker, (seen, keys) in list(self.workers.items()):
+            if now - seen > self.expire_s:
+                del self.workers[worker]
+                changes.extend(self._diff(keys, set()))
+        return changes
+
+    def _diff(self, old: Set[Key], new: Set[Key]) -> List[Tuple[Key, bool]]:
+        changes: List[Tuple[Key, bool]] = []
+        for key in new - old:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            if self.counts[key] == 1:
+                changes.append((key, True))
+        for key in old - new:
+            self.counts[key] -= 1
+            if not self.counts[key]:
+                del self.counts[key]
+                changes.append((key, False))
+        return changes
+
+
+class Broker(ABC):
+    """Base class: ``publish`` bars, and receive only the ``(symbol, tf)`` keys subscribed.
+
+    ``subscribe``/``unsubscribe`` are synchronous so the hub can call them from
+    registry callbacks; implementations apply them in the background. Demand
+    announcements go out with ``publish_demand`` and are only received once
+    a demand handler is set.
+    """
+
+    def __init__(self) -> None:
+        self.handler: Optional[Handler] = None
+        self.demand_handler: Optional[DemandHandler] = None
+        self.interest: Set[Tuple[str, str]] = set()
+        self.stats: Dict[str, int] = {"published": 0, "received": 0, "dropped": 0}
+
+    def set_handler(self, handler: Handler) -> None:
+        self.handler = handler
+
+    def set_demand_handler(self, handler: DemandHandler) -> None:
+        self.demand_handler = handler
+
+    def subscribe(self, symbol: str, tf: str) -> None:
+        self.interest.add((symbol, tf))
+
+    def unsubscribe(self, symbol: str, tf: str) -> None:
+        self.interest.discard((symbol, tf))
+
+    def wants(self, symbol: str, tf: str) -> bool:
+        return (symbol, tf) in self.interest or (WILDCARD, tf) in self.interest
+
+    @abstractmethod
+    def publish(self, event: BarEvent) -> None:
+        """Send ``event`` to every broker that wants its key."""
+
+    @abstractmethod
+    def publish_demand(self, message: DemandMessage) -> None:
+        """Send a demand announcement to every broker with a demand handler."""
+
+    def _deliver(self, event: BarEvent) -> None:
+        self.stats["received"] += 1
+        if self.handler is not None:
+            self.handler(event)
+
+    def _deliver_demand(self, message: DemandMessage) -> None:
+        if self.demand_handler is not None:
+            self.demand_handler(message)
+
+    async def start(self) -> None:
+        return None
+
+    async def close(self) -> None:
+        return None
+
+
+class InMemoryBus:
+    """Process-local stand-in for a pub/sub server, shared by several brokers."""
+
+    def __init__(self) -> None:
+        self.brokers: List["InMemoryBroker"] = []
+
+
+class InMemoryBroker(Broker):
+    """Delivers synchronously to every broker on the same bus that wants the key."""
+
+    def __init__(self, bus: Optional[InMemoryBus] = None) -> None:
+        super().__init__()
+        self.bus = bus or InMemoryBus()
+        self.bus.brokers.append(self)
+
+    def publish(self, event: BarEvent) -> None:
+        self.stats["published"] += 1
+        for broker in self.bus.brokers:
+            if broker.wants(event.symbol, event.tf):
+                broker._deliver(event)
+
+    def publish_demand(self, message: DemandMessage) -> None:
+        for broker in self.bus.brokers:
+            broker._deliver_demand(message)
+
+    async def close(self) -> None:
+        if self in self.bus.brokers:
+            self.bus.brokers.remove(self)
+
+
+class RedisBroker(Broker):
+    """Redis pub/sub on ``{prefix}:{tf}:{symbol}`` channels, demand on ``{prefix}:ctl:demand``.
+
+    Outgoing bars (and demand) go through a bounded queue flushed with one pipeline per
+    batch; subscription changes are applied by the reader task so the pubsub
+    connection is only driven from one place.
+    """
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        prefix: Optional[str] = None,
+        max_pending: int = 10_000,
+    ) -> None:
+        super().__init__()
+        self.url = url or settings.REDIS_URL
+        self.prefix = prefix or settings.HUB_BROKER_PREFIX
+        if not self.url:
+            raise ValueError("REDIS_URL is required for the redis hub broker")
+        self._outbox: asyncio.Queue[Tuple[str, str]] = asyncio.Queue(maxsize=max_pending)
+        self._changes: asyncio.Queue[Tuple[bool, str, str]] = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+        self._redis = None
+        self._pubsub = None
+        self.demand_channel = f"{self.prefix}:ctl:demand"
+        self._demand_listening = False
+
+    def channel(self, symbol: str, tf: str) -> str:
+        return f"{self.prefix}:{tf}:{symbol}"
+
+    def subscribe(self, symbol: str, tf: str) -> None:
+        super().subscribe(symbol, tf)
+        self._changes.put_nowait((True, symbol, tf))
+
+    def unsubscribe(self, symbol: str, tf: str) -> None:
+        super().unsubscribe(symbol, tf)
+        self._changes.put_nowait((False, symbol, tf))
+
+    def publish(self, event: BarEvent) -> None:
+        self._enqueue((self.channel(event.symbol, event.tf), encode_event(event)))
+
+    def publish_demand(self, message: DemandMessage) -> None:
+        self._enqueue((self.demand_channel, json.dumps(message, separators=(",", ":"))))
+
+    def _enqueue(self, item: Tuple[str, str]) -> None:
+        if self._outbox.full():
+            self._outbox.get_nowait()
+            self.stats["dropped"] += 1
+        self._outbox.put_nowait(item)
+
+    async def start(self) -> None:
+        import redis.asyncio as aioredis
+
+        self._redis = aioredis.from_url(self.url)
+        self._pubsub = self._redis.pubsub()
+        self._tasks = [
+            asyncio.create_task(self._writer()),
+            asyncio.create_task(self._reader()),
+        ]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._pubsub is not None:
+            await self._pubsub.close()
+        if self._redis is not None:
+            await self._redis.close()
+
+    async def _writer(self) -> None:
+        while True:
+            batch = [await self._outbox.get()]
+            while not self._outbox.empty() and len(batch) < 500:
+                batch.append(self._outbox.get_nowait())
+            try:
+                pipe = self._redis.pipeline(transaction=False)
+                for channel, data in batch:
+                    pipe.publish(channel, data)
+                await pipe.execute()
+                self.stats["published"] += len(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self.stats["dropped"] += len(batch)
+                logger.warning("Hub broker publish failed: %s", exc)
+                await asyncio.sleep(0.5)
+
+    async def _apply_changes(self) -> None:
+        if self.demand_handler is not None and not self._demand_listening:
+            await self._pubsub.subscribe(self.demand_channel)
+            self._demand_listening = True
+        while not self._changes.empty():
+            add, symbol, tf = self._changes.get_nowait()
+            if add != ((symbol, tf) in self.interest):
+                continue  # superseded by a later change to the same key
+            channel = self.channel(symbol, tf)
+            if symbol == WILDCARD:
+                await (self._pubsub.psubscribe if add else self._pubsub.punsubscribe)(channel)
+            else:
+                await (self._pubsub.subscribe if add else self._pubsub.unsubscribe)(channel)
+
+    async def _reader(self) -> None:
+        offset = len(self.prefix) + 1
+        while True:
+            try:
+                await self._apply_changes()
+                if not self._pubsub.subscribed:
+                    await asyncio.sleep(0.05)
+                    continue
+                msg = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=0.05)
+                if msg is None or msg.get("type") not in {"message", "pmessage"}:
+                    continue
+                channel = msg["channel"]
+                if isinstance(channel, bytes):
+                    channel = channel.decode()
+                if channel == self.demand_channel:
+                    self._deliver_demand(json.loads(msg["data"]))
+                    continue
+                tf, _, symbol = channel[offset:].partition(":")
+                if msg["type"] == "message" and (WILDCARD, tf) in self.interest:
+                    continue  # the pattern subscription delivers this one too
+                self._deliver(decode_event(symbol, tf, msg["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # pragma: no cover - network hiccups
+                logger.warning("Hub broker read failed: %s", exc)
+                await asyncio.sleep(1.0)
+
+
+def make_broker(kind: Optional[str] = None) -> Optional[Broker]:
+    """Build the broker named by ``HUB_BROKER`` (``local`` means no broker)."""
+    kind = (kind or settings.HUB_BROKER).lower()
+    if kind in {"", "local", "none"}:
+        return None
+    if kind == "memory":
+        return InMemoryBroker()
+    if kind == "redis":
+        return RedisBroker()
+    raise ValueError(f"Unknown HUB_BROKER '{kind}'")
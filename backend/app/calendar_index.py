@@ -0,0 +1,239 @@
+"""In-memory index of calendar events over a rolling window, kept current by delta syncs.
+
+:class:`EventIndex` holds every event of the synced window in ``ts`` order
+with one bitset (a Python ``int``) per country and per impact level, so a
+range plus filter query is two bisects and a few ``&`` operations.
+
+:class:`CalendarSync` fills it: the first pass fetches the whole window, later
+passes only the "hot" span around now (where ``actual`` values land) and the
+days that newly entered the window, with a full pass every ``full_every``
+syncs to pick up reschedules and removals. Each pass after the first reports
+the events that actually changed, and those that were withdrawn, to its
+listeners.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from bisect import bisect_left, bisect_right
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+Event = Dict[str, Any]
+# (start, end, countries, min_impact) -> events with ``start <= ts <= end``,
+# shaped like ``clients.forexfactory.fetch_calendar`` results.
+EventSource = Callable[[int, int, Optional[List[str]], Optional[str]], Awaitable[List[Event]]]
+# (new or changed events, events withdrawn upstream)
+ChangeListener = Callable[[List[Event], List[Event]], Any]
+
+IMPACT_ORDER = {"low": 0, "medium": 1, "high": 2}
+
+
+def _positions(mask: int) -> List[int]:
+    out = []
+    while mask:
+        low = mask & -mask
+        out.append(low.bit_length() - 1)
+        mask ^= low
+    return out
+
+
+class EventIndex:
+    """Events by id plus a ``ts``-sorted array with country and impact bitsets."""
+
+    def __init__(self) -> None:
+        self.events: Dict[str, Event] = {}
+        # ``[lo, hi]`` epoch seconds that every event is known for, if any.
+        self.coverage: Optional[Tuple[int, int]] = None
+        self._ts: List[int] = []
+        self._rows: List[Event] = []
+        self._country: Dict[str, int] = {}
+        self._impact: List[int] = [0] * len(IMPACT_ORDER)
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def covers(self, start: int, end: int) -> bool:
+        return self.coverage is not None and self.coverage[0] <= start and end <= self.coverage[1]
+
+    def apply(self, events: List[Event], lo: int, hi: int) -> Tuple[List[Event], List[Event]]:
+        """Merge a fetch of ``[lo, hi]``; returns the new or changed and the removed events.
+
+        The fetch is authoritative for its range, so known events in it that
+        did not come back (rescheduled or withdrawn) are dropped.
+        """
+        changed = [e for e in events if self.events.get(e["id"]) != e]
+        seen = {e["id"] for e in events}
+        removed = [e for e in self.events.values() if lo <= e["ts"] <= hi and e["id"] not in seen]
+        for event in changed:
+            self.events[event["id"]] = event
+        for event in removed:
+            del self.events[event["id"]]
+        dropped = self._extend(lo, hi)
+        if changed or removed or dropped:
+            self._rebuild()
+        return changed, removed
+
+    def trim(self, before: int) -> None:
+        """Forget events (and coverage) older than ``before``."""
+        old = [i for i, e in self.events.items() if e["ts"] < before]
+        for event_id in old:
+            del self.events[event_id]
+        if self.coverage is not None:
+            lo, hi = self.coverage
+            self.coverage = (max(lo, before), hi) if hi >= before else None
+        if old:
+            self._rebuild()
+
+    def query(
+        self,
+        start: int,
+        end: int,
+        countries: Optional[List[str]] = None,
+        min_impact: Optional[str] = None,
+    ) -> List[Event]:
+        """Events in ``[start, end]`` in ``ts`` order, filtered like ``/v1/calendar``."""
+        first = bisect_left(self._ts, start)
+        last = bisect_right(self._ts, end)
+        if first >= last:
+            return []
+        if countries is None and not min_impact:
+            return self._rows[first:last]
+        mask = (1 << last) - (1 << first)
+        if countries is not None:
+            wanted = 0
+            for country in countries:
+                wanted |= self._country.get(country.upper(), 0)
+            mask &= wanted
+        if min_impact:
+            floor = IMPACT_ORDER.get(min_impact, 0)
+            levels = 0
+            for bits in self._impact[floor:]:
+                levels |= bits
+            mask &= levels
+        return [self._rows[i] for i in _positions(mask)]
+
+    def _extend(self, lo: int, hi: int) -> bool:
+        """Add ``[lo, hi]`` to the coverage; True if events outside it were dropped."""
+        if self.coverage is None:
+            self.coverage = (lo, hi)
+            return False
+        cur_lo, cur_hi = self.coverage
+        if lo <= cur_hi + 1 and hi >= cur_lo - 1:
+            self.coverage = (min(lo, cur_lo), max(hi, cur_hi))
+            return False
+        # Disjoint: only the newest span is whole, so keep just that.
+        self.coverage = (lo, hi)
+        before = len(self.events)
+        self.events = {i: e for i, e in self.events.items() if lo <= e["ts"] <= hi}
+        return len(self.events) != before
+
+    def _rebuild(self) -> None:
+        rows = sorted(self.events.values(), key=lambda e: (e["ts"], e["id"]))
+        country: Dict[str, int] = {}
+        impact = [0] * len(IMPACT_ORDER)
+        for i, event in enumerate(rows):
+            bit = 1 << i
+            key = str(event.get("country") or "").upper()
+            country[key] = country.get(key, 0) | bit
+            impact[IMPACT_ORDER.get(event.get("impact") or "", 0)] |= bit
+        self._rows = rows
+        self._ts = [e["ts"] for e in rows]
+        self._country = country
+        self._impact = impact
+
+
+class CalendarSync:
+    """Keeps an :class:`EventIndex` current over ``[now - back_s, now + ahead_s]``."""
+
+    def __init__(
+        self,
+        index: EventIndex,
+        source: EventSource,
+        back_s: int = 7 * 86_400,
+        ahead_s: int = 14 * 86_400,
+        hot_s: int = 6 * 3_600,
+        interval_s: float = 60.0,
+        full_every: int = 30,
+    ) -> None:
+        self.index = index
+        self.source = source
+        self.back_s = back_s
+        self.ahead_s = ahead_s
+        self.hot_s = hot_s
+        self.interval_s = interval_s
+        self.full_every = max(1, full_every)
+        self.listeners: List[ChangeListener] = []
+        self.syncs = 0
+        self.failures = 0
+        self.last_sync: Optional[float] = None
+
+    def add_listener(self, listener: ChangeListener) -> None:
+        """Call ``listener(changed, removed)`` after each sync that changed something.
+
+        The pass that first fills the index only sets the baseline and is not
+        reported, so listeners never receive the whole window at once.
+        """
+        self.listeners.append(listener)
+
+    def _spans(self, now: int) -> List[Tuple[int, int]]:
+        lo, hi = now - self.back_s, now + self.ahead_s
+        coverage = self.index.coverage
+        if coverage is None or coverage[0] > lo or self.syncs % self.full_every == 0:
+            return [(lo, hi)]
+        spans = [(max(lo, now - self.hot_s), min(hi, now + self.hot_s))]
+        if hi > coverage[1]:
+            spans.append((coverage[1] + 1, hi))
+        return spans
+
+    async def sync_once(self, now: Optional[int] = None) -> List[Event]:
+        """One delta pass; reports the changed and removed events, returns the changed."""
+        now = int(time.time()) if now is None else now
+        changed: List[Event] = []
+        removed: List[Event] = []
+        baseline = self.index.coverage is not None
+        for lo, hi in self._spans(now):
+            events = await self.source(lo, hi, None, None)
+            new, gone = self.index.apply([e for e in events if lo <= e["ts"] <= hi], lo, hi)
+            changed.extend(new)
+            removed.extend(gone)
+        self.index.trim(now - self.back_s)
+        self.syncs += 1
+        self.last_sync = time.time()
+        if (changed or removed) and baseline:
+            for listener in self.listeners:
+                try:
+                    result = listener(changed, removed)
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception:
+                    logger.exception("Calendar change listener failed")
+        return changed
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.sync_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                self.failures += 1
+                logger.warning("Calendar index sync failed: %s", exc)
+            await asyncio.sleep(self.interval_s)
+
+    def collect_metrics(self) -> List[metrics.Family]:
+        coverage = self.index.coverage
+        span = float(coverage[1] - coverage[0]) if coverage else 0.0
+        age = time.time() - self.last_sync if self.last_sync is not None else -1.0
+        series = [
+            ("calendar_index_events", "gauge", "Events in the calendar index.", len(self.index)),
+            ("calendar_index_coverage_seconds", "gauge", "Width of the synced window.", span),
+            ("calendar_index_sync_age_seconds", "gauge", "Seconds since the last sync.", age),
+            ("calendar_index_sync_failures", "counter", "Failed calendar syncs.", self.failures),
+        ]
+        return [(name, kind, help, [((), float(value))]) for name, kind, help, value in series]
@@ -2,12 +2,25 @@
 
 from __future__ import annotations
 
+import asyncio
+import importlib.util
+import logging
+import random
+import time
 from datetime import datetime
 from typing import Any, Dict, List, Optional, TypedDict
 
 import httpx
 
 from ..core.settings import settings
+from ..metrics import upstream_latency
+
+logger = logging.getLogger(__name__)
+
+# Shared by every request; opened with the app (``open_client``) or on first use.
+_client: Optional[httpx.AsyncClient] = None
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
 
 
 class RawEvent(TypedDict, total=False):
@@ -54,11 +67,88 @@ def _headers() -> Dict[str, str]:
     }
 
 
+def _http2_available() -> bool:
+    return settings.CALENDAR_HTTP2 and importlib.util.find_spec("h2") is not None
+
+
+def _new_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=settings.CALENDAR_HTTP_TIMEOUT_S,
+        limits=httpx.Limits(
+            max_connections=settings.CALENDAR_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.CALENDAR_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.CALENDAR_HTTP_KEEPALIVE_S,
+        ),
+        http2=_http2_available(),
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    """The pooled keep-alive client (HTTP/2 when ``h2`` is installed)."""
+    global _client
+    if _client is None or getattr(_client, "is_closed", False):
+        _client = _new_client()
+    return _client
+
+
+def set_client(client: Optional[httpx.AsyncClient]) -> None:
+    """Install ``client`` (e.g. a test double) as the shared client; ``None`` resets."""
+    global _client
+    _client = client
+
+
+async def open_client() -> None:
+    """App startup: create the pool up front."""
+    get_client()
+
+
+async def close_client() -> None:
+    """App shutdown: close pooled connections."""
+    global _client
+    client, _client = _client, None
+    if client is not None and hasattr(client, "aclose"):
+        await client.aclose()
+
+
+async def _get_with_retry(
+    client: httpx.AsyncClient,
+    url: str,
+    params: Dict[str, Any],
+) -> Any:
+    """GET with full-jitter exponential backoff on transport errors, 429 and 5xx."""
+    attempts = max(1, settings.CALENDAR_HTTP_RETRIES + 1)
+    for attempt in range(attempts):
+        started = time.perf_counter()
+        try:
+            resp = await client.get(url, params=params, headers=_headers())
+        except httpx.TransportError as exc:
+            upstream_latency.labels("forexfactory", "error").observe(
+                time.perf_counter() - started
+            )
+            if attempt + 1 >= attempts:
+                raise
+            logger.info("Calendar upstream transport error (attempt %d): %s", attempt + 1, exc)
+        else:
+            status = getattr(resp, "status_code", 200)
+            outcome = "ok" if status < 400 else str(status)
+            upstream_latency.labels("forexfactory", outcome).observe(
+                time.perf_counter() - started
+            )
+            if status not in RETRY_STATUS or attempt + 1 >= attempts:
+                resp.raise_for_status()
+                return resp
+            logger.info("Calendar upstream returned %s (attempt %d)", status, attempt + 1)
+        backoff = min(settings.CALENDAR_HTTP_BACKOFF_MAX_S, 0.2 * 2**attempt)
+        await asyncio.sleep(random.uniform(0, backoff))
+    raise RuntimeError("unreachable")  # pragma: no cover
+
+
 async def fetch_calendar(
     start: int,
     end: int,
     countries: List[str] | None = None,
     min_impact: str | None = None,
+    client: Optional[httpx.AsyncClient] = None,
 ) -> List[Dict[str, Any]]:
     params: Dict[str, Any] = {
         "start": start,
@@ -70,10 +160,8 @@ async def fetch_calendar(
         params["min_impact"] = min_impact
 
     url = f"{settings.JBLANKED_BASE_URL}/calendar"
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        resp = await client.get(url, params=params, headers=_headers())
-        resp.raise_for_status()
-        data: List[RawEvent] = resp.json()
+    resp = await _get_with_retry(client or get_client(), url, params)
+    data: List[RawEvent] = resp.json()
 
     events: List[Dict[str, Any]] = []
     for ev in data:
@@ -10,7 +10,55 @@ class Settings(BaseSettings):
     JBLANKED_BASE_URL: AnyHttpUrl = "https://www.jblanked.com/news/api"
     REDIS_URL: str | None = "redis://localhost:6379/0"
     CALENDAR_CACHE_TTL_S: int = 60
+    CALENDAR_STALE_TTL_S: int = 600  # served past the TTL while refreshing in the background
+    CALENDAR_LOCAL_CACHE_SIZE: int = 1024  # partitions kept in the in-process LRU
+    CALENDAR_PARTITION_DAYS: int = 1  # cache partition span: 1 (UTC days) or 7 (weeks)
+    CALENDAR_MAX_PARTITIONS: int = 120  # widest window one request may assemble
+    CALENDAR_INDEX: bool = True  # keep a rolling window of events in memory
+    CALENDAR_INDEX_BACK_DAYS: int = 7
+    CALENDAR_INDEX_AHEAD_DAYS: int = 14
+    CALENDAR_INDEX_HOT_S: int = 6 * 3600  # re-fetched every sync either side of now
+    CALENDAR_INDEX_SYNC_S: float = 60.0
+    CALENDAR_INDEX_FULL_EVERY: int = 30  # syncs between full-window refreshes
+    CALENDAR_PUSH: bool = True  # push index changes to /ws "calendar" subscribers
+    CALENDAR_REDIS_LOCK: bool = False  # single-flight across workers via a Redis lock
+    CALENDAR_LOCK_TTL_S: float = 10.0
+    CALENDAR_LOCK_WAIT_S: float = 5.0  # then load anyway
+    CALENDAR_HTTP_TIMEOUT_S: float = 15.0
+    CALENDAR_HTTP_MAX_CONNECTIONS: int = 20
+    CALENDAR_HTTP_MAX_KEEPALIVE: int = 10
+    CALENDAR_HTTP_KEEPALIVE_S: float = 30.0
+    CALENDAR_HTTP2: bool = True  # used when the h2 package is installed
+    CALENDAR_HTTP_RETRIES: int = 2  # on transport errors, 429 and 5xx
+    CALENDAR_HTTP_BACKOFF_MAX_S: float = 2.0
     NEWS_CACHE_TTL_S: int = 60
+    WS_SEND_QUEUE_SIZE: int = 256
+    WS_SLOW_CONSUMER_POLICY: str = "drop_oldest"  # drop_oldest | conflate | disconnect
+    WS_PER_MESSAGE_DEFLATE: bool = True  # offered to clients that negotiate it
+    WS_THROTTLE_TICK_MS: int = 10  # timer wheel resolution for maxRate subscriptions
+    WS_HISTORY_BARS: int = 500  # default snapshot size when a resume falls back
+    WS_REPLAY_EVENTS: int = 2048  # events kept per (symbol, tf) for resume-by-seq
+    WS_REPLAY_BUDGET_EVENTS: int = 200_000  # across every stream's log
+    WS_REPLAY_IDLE_S: float = 300.0  # resume window after a stream's last subscriber left
+    WS_SNAPSHOT_MAX_BARS: int = 2000
+    WS_METRICS_TOP_CONNECTIONS: int = 10  # per-connection queue depth series on /metrics
+    WS_BATCH_WINDOW_MS: int = 25  # flush window for subscribers that opt into batching
+    WS_BATCH_MAX_WINDOW_MS: int = 250
+    WS_BATCH_MAX_FRAMES: int = 1000  # updates per batched frame
+    WS_INDICATOR_WARMUP_BARS: int = 1000  # history fed to a new live indicator state
+    WS_INDICATOR_MAX_BARS: int = 2000  # bars kept per live indicator state (snapshots)
+    BAR_STORE_CAPACITY: int = 2000  # ring buffer rows per (symbol, tf)
+    BAR_STORE_MAX_MB: int = 256  # total cap; least recently written buffers are evicted
+    HUB_BROKER: str = "local"  # local | memory | redis
+    HUB_BROKER_PREFIX: str = "bars"
+    HUB_RUN_FEEDS: bool = True  # disable in API workers when a separate ingest process runs
+    HUB_DEMAND_REFRESH_S: float = 10.0  # workers re-announce their subscribed keys this often
+    PERSIST_BARS: bool = False  # write closed live 1m bars into ohlcv (where feeds run)
+    PERSIST_BATCH_ROWS: int = 5000  # flush when this many bars are buffered
+    PERSIST_FLUSH_MS: int = 1000  # ... or at least this often
+    PERSIST_SPOOL_ROWS: int = 500_000  # buffered while the DB is down; oldest dropped
+    PERSIST_REFRESH_S: int = 30  # continuous aggregate refresh of dirty ranges
+    PERSIST_RETRY_MAX_S: int = 30
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,121 @@
+"""Market data feeds that publish into a Hub (shared by the API app and ingest process)."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+from datetime import datetime, timezone
+from typing import List, Optional
+
+import httpx
+
+from .core.settings import settings
+from .hub import Hub
+from .metrics import REGISTRY
+from .persistence import BarWriter
+from .providers.alpaca_rest import AlpacaHistory, new_client
+from .providers.alpaca_ws import AlpacaStreamClient
+from .replay import replay_feed
+from .sharding import IngestSupervisor, read_universe
+
+# Pooled client behind Alpaca backfills; opened by ``start_feeds``, closed by ``close_feeds``.
+_history_client: Optional[httpx.AsyncClient] = None
+
+
+async def demo_feed(hub: Hub):
+    symbol = "AAPL"
+    c = 270.0
+    while True:
+        now_ms = int(datetime.now(tz=timezone.utc).timestamp() * 1000)
+        c = max(0.01, c + random.uniform(-0.4, 0.4))
+        v = random.randint(100, 5000)
+        # Trades are rolled up into every timeframe by the hub.
+        await hub.publish_trade(symbol, now_ms, c, v)
+        await asyncio.sleep(1.0)
+
+
+async def bar_close_timer(hub: Hub):
+    """Close buckets for symbols that stopped trading before the bucket ended."""
+    while True:
+        await asyncio.sleep(1.0)
+        hub.flush_bars()
+
+
+def _history() -> AlpacaHistory:
+    global _history_client
+    if _history_client is None or _history_client.is_closed:
+        _history_client = new_client()
+    return AlpacaHistory(client=_history_client)
+
+
+async def close_feeds() -> None:
+    """Release what ``start_feeds`` opened beyond its tasks (the backfill HTTP client)."""
+    global _history_client
+    if _history_client is not None:
+        await _history_client.aclose()
+        _history_client = None
+
+
+def start_feeds(hub: Hub) -> List[asyncio.Task]:
+    """Start the configured feeds (demo, replay and/or Alpaca) publishing into ``hub``."""
+    tasks = [asyncio.create_task(bar_close_timer(hub))]
+
+    if settings.PERSIST_BARS:
+        # Imported here: the DB config is only required once persistence is on.
+        from .db_timescale import get_pool
+
+        writer = BarWriter(get_pool)
+        hub.add_bar_sink(writer.offer, writer.wait_for_room)
+        tasks.append(asyncio.create_task(writer.run()))
+
+    if os.getenv("ENABLE_DEMO_FEED", "false").lower() in {"1", "true", "yes"}:
+        tasks.append(asyncio.create_task(demo_feed(hub)))
+
+    if os.getenv("ENABLE_REPLAY_FEED", "false").lower() in {"1", "true", "yes"}:
+        feed = replay_feed(
+            hub,
+            path=os.getenv("REPLAY_FILE") or None,
+            symbols=int(os.getenv("REPLAY_SYMBOLS", "1000")),
+            speed=float(os.getenv("REPLAY_SPEED", "60")),
+            updates_per_bar=int(os.getenv("REPLAY_UPDATES_PER_BAR", "4")),
+        )
+        tasks.append(asyncio.create_task(feed))
+
+    alpaca_key = os.getenv("ALPACA_KEY_ID")
+    alpaca_secret = os.getenv("ALPACA_SECRET_KEY")
+    if alpaca_key and alpaca_secret:
+        # LIVE_SYMBOLS stay subscribed; others follow this hub's client demand.
+        symbols = os.getenv("LIVE_SYMBOLS", "AAPL").split(",")
+        timeframe = os.getenv("LIVE_TF", "1m")
+        backfill = os.getenv("ALPACA_BACKFILL", "true").lower() in {"1", "true", "yes"}
+        follow_demand = os.getenv("ALPACA_FOLLOW_DEMAND", "true").lower() in {"1", "true", "yes"}
+        options = dict(
+            timeframe=timeframe,
+            channels=os.getenv("ALPACA_CHANNELS", "bars,trades").split(","),
+            debounce_s=float(os.getenv("ALPACA_SUBSCRIBE_DEBOUNCE_MS", "250")) / 1000,
+            linger_s=float(os.getenv("ALPACA_UNSUBSCRIBE_LINGER_S", "30")),
+            history=_history() if backfill else None,
+            max_gap_bars=int(os.getenv("ALPACA_BACKFILL_MAX_BARS", "1440")),
+        )
+        universe_file = os.getenv("ALPACA_UNIVERSE_FILE")
+        shards = int(os.getenv("ALPACA_SHARDS", "1"))
+        processes = os.getenv("ALPACA_SHARD_PROCESSES", "false").lower() in {"1", "true", "yes"}
+        if shards > 1 or universe_file:
+            # Large universes: one connection (optionally one process) per shard.
+            supervisor = IngestSupervisor(
+                hub,
+                read_universe(universe_file) if universe_file else symbols,
+                shards=shards,
+                processes=processes,
+                follow_demand=follow_demand,
+                **options,
+            )
+            REGISTRY.register_collector(supervisor.collect_metrics)
+            tasks.append(asyncio.create_task(supervisor.run()))
+            if universe_file:
+                tasks.append(asyncio.create_task(supervisor.watch_universe(universe_file)))
+        else:
+            client = AlpacaStreamClient(hub, symbols, follow_demand=follow_demand, **options)
+            tasks.append(asyncio.create_task(client.run()))
+    return tasks
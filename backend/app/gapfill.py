@@ -0,0 +1,116 @@
+"""Detect bars a live feed missed while disconnected and backfill only that range.
+
+A feed records the newest bar start it saw per symbol in a :class:`GapTracker`.
+After reconnecting it asks for :meth:`GapTracker.gaps` and hands them to
+:func:`backfill`, which fetches each missing range from a pluggable
+:data:`GapSource` and merges it into the hub with ``Hub.publish_gapfill``.
+
+Any ``(symbol, tf, start_ms, end_ms) -> rows`` coroutine is a source: the
+Alpaca REST client in ``providers.alpaca_rest``, ``db_timescale.fetch_ohlc``
+when something else keeps the database current, or :class:`StaticHistory`
+for tests and replays.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from .sessions import TF_STEP_SEC
+
+logger = logging.getLogger(__name__)
+
+# (symbol, tf, start_ms, end_ms) -> bars with ``start_ms <= time < end_ms``, shaped
+# like ``db_timescale.fetch_ohlc`` rows (time/open/high/low/close/volume).
+GapSource = Callable[[str, str, int, int], Awaitable[List[Dict[str, Any]]]]
+
+
+class Gap(NamedTuple):
+    symbol: str
+    start_ms: int  # first missing bar start (inclusive)
+    end_ms: int  # bar start the live stream resumes at (exclusive)
+
+
+class StaticHistory:
+    """In-memory :data:`GapSource` over fixed rows per symbol (tests, replays, demos)."""
+
+    def __init__(self, rows: Optional[Dict[str, Iterable[Dict[str, Any]]]] = None) -> None:
+        self.rows: Dict[str, List[Dict[str, Any]]] = {
+            symbol: sorted(bars, key=lambda r: int(r["time"]))
+            for symbol, bars in (rows or {}).items()
+        }
+        self.calls: List[Gap] = []
+
+    async def __call__(
+        self, symbol: str, tf: str, start_ms: int, end_ms: int
+    ) -> List[Dict[str, Any]]:
+        self.calls.append(Gap(symbol, start_ms, end_ms))
+        return [r for r in self.rows.get(symbol, ()) if start_ms <= int(r["time"]) < end_ms]
+
+
+class GapTracker:
+    """Newest bar start seen per symbol for one feed timeframe."""
+
+    def __init__(self, tf: str = "1m", max_gap_bars: int = 24 * 60) -> None:
+        self.tf = tf
+        self.step_ms = TF_STEP_SEC.get(tf, 60) * 1000
+        # Longer outages are left to clients' own history reloads.
+        self.max_gap_bars = max_gap_bars
+        self.last: Dict[str, int] = {}
+
+    def seen(self, symbol: str, ts_ms: int) -> None:
+        start = ts_ms // self.step_ms * self.step_ms
+        if start > self.last.get(symbol, -1):
+            self.last[symbol] = start
+
+    def gaps(self, now_ms: int, symbols: Optional[Iterable[str]] = None) -> List[Gap]:
+        """Ranges with at least one whole bar missing between the last bar seen and now.
+
+        The last seen bar is refetched too, since the outage may have cut it
+        short. ``symbols`` restricts the result (e.g. to those still wanted).
+        """
+        current = now_ms // self.step_ms * self.step_ms
+        wanted = self.last if symbols is None else [s for s in symbols if s in self.last]
+        out: List[Gap] = []
+        for symbol in wanted:
+            last = self.last[symbol]
+            if current - last <= self.step_ms:
+                continue  # at most the bar in progress was missed; live data covers it
+            start = max(last, current - self.max_gap_bars * self.step_ms)
+            out.append(Gap(symbol, start, current))
+        return out
+
+
+async def backfill(
+    hub,
+    source: GapSource,
+    tf: str,
+    gaps: Iterable[Gap],
+    concurrency: int = 8,
+    timeout_s: float = 10.0,
+) -> Dict[str, int]:
+    """Fetch every gap (``concurrency`` at a time) and merge it into ``hub``.
+
+    Returns the number of bars merged per symbol; a failed or slow fetch is
+    logged and skipped, since live data must not wait on it for long.
+    """
+    limit = asyncio.Semaphore(max(1, concurrency))
+    merged: Dict[str, int] = {}
+
+    async def fill(gap: Gap) -> None:
+        async with limit:
+            try:
+                rows = await asyncio.wait_for(
+                    source(gap.symbol, tf, gap.start_ms, gap.end_ms), timeout_s
+                )
+            except Exception as exc:
+                logger.warning("Backfill of %s %s failed: %s", gap.symbol, tf, exc)
+                return
+        rows = [r for r in rows if gap.start_ms <= int(r["time"]) < gap.end_ms]
+        if rows:
+            hub.publish_gapfill(gap.symbol, tf, rows)
+        merged[gap.symbol] = len(rows)
+
+    await asyncio.gather(*(fill(gap) for gap in gaps))
+    return merged
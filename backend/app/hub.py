@@ -0,0 +1,1191 @@
+"""WebSocket subscription hub with per-connection bounded send queues."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import deque
+from enum import Enum
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from fastapi import WebSocket
+
+from ..common.http_cache import live_heads
+from .bar_store import BarStore
+from .calendar_index import IMPACT_ORDER
+from . import metrics
+from . import protocol as wire
+from .broker import Broker, DemandMessage, DemandTracker
+from .core.settings import settings
+from .live_indicators import LiveIndicator, LiveIndicators
+from .live_indicators import normalize as normalize_indicator
+from .rollup import BASE_TF, BarEvent, BarRollup, bucket_bounds
+from .sessions import TF_STEP_SEC
+from .streams import StreamStore
+from .subscriptions import WILDCARD, CalendarSubscription, Subscription, SubscriptionRegistry
+from .timer_wheel import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+# Encoded frame: JSON text, or bytes for the binary protocols.
+Frame = str | bytes
+
+# (symbol, tf, limit) -> most recent rows shaped like ``db_timescale.fetch_latest``.
+HistoryLoader = Callable[[str, str, int], Awaitable[List[Dict[str, Any]]]]
+
+# Called with a (symbol, tf) key and True when it gains its first local
+# subscriber, False when it loses its last one.
+DemandListener = Callable[[Tuple[str, str], bool], None]
+
+# Sees every bar event this hub's feeds publish (e.g. ``persistence.BarWriter``).
+BarSink = Callable[[BarEvent], None]
+
+
+class BarUpdate(NamedTuple):
+    """A bar from a feed, as taken by :meth:`Hub.publish_tick`."""
+
+    symbol: str
+    tf: str
+    tick: Dict[str, Any]
+    final: bool = False
+    upstream_ms: Optional[int] = None
+
+
+class TradeUpdate(NamedTuple):
+    """A trade (or quote midpoint, with ``size`` 0) from a feed."""
+
+    symbol: str
+    ts_ms: int
+    price: float
+    size: float = 0.0
+
+
+class SlowConsumerPolicy(str, Enum):
+    """What to do when a connection's send queue is full."""
+
+    DROP_OLDEST = "drop_oldest"
+    CONFLATE = "conflate"
+    DISCONNECT = "disconnect"
+
+
+# (upstream event time or 0.0, encoded time) in epoch seconds.
+Stamp = Tuple[float, float]
+
+
+class _Pending:
+    __slots__ = ("key", "data", "stamp", "control", "hoist")
+
+    def __init__(
+        self,
+        key: Optional[Hashable],
+        data: Frame,
+        stamp: Optional[Stamp] = None,
+        control: bool = False,
+        hoist: bool = False,
+    ) -> None:
+        self.key = key
+        self.data = data
+        self.stamp = stamp
+        self.control = control or hoist
+        # A control message that may go out ahead of the batch it was queued in.
+        self.hoist = hoist
+
+
+class _RateState:
+    __slots__ = ("last_sent", "pending", "stamp", "scheduled")
+
+    def __init__(self) -> None:
+        self.last_sent = float("-inf")
+        self.pending: Optional[Frame] = None
+        self.stamp: Optional[Stamp] = None
+        self.scheduled = False
+
+
+def _join(batch: List[_Pending]) -> Frame:
+    """One frame for several: a JSON ``batch`` envelope, or concatenated binary records."""
+    first = batch[0].data
+    if isinstance(first, bytes):
+        # Fixed-size structs and msgpack objects both decode from a concatenated stream.
+        return b"".join(p.data for p in batch)
+    return '{"type":"batch","messages":[' + ",".join(p.data for p in batch) + "]}"
+
+
+class ClientConnection:
+    """Bounded outbound queue for one socket, drained by its own sender task.
+
+    ``offer`` never awaits, so a slow client only ever fills its own queue.
+    Messages carrying a ``key`` (e.g. the open bar of a ``(symbol, tf)``) may
+    be replaced in place under the ``conflate`` policy; keyless messages are
+    never conflated. With a ``batch_window`` the sender waits that long after
+    the first queued update and sends everything queued by then as one
+    frame. Control messages are never batched and keep their order, except
+    ``hoist`` ones (symbol dictionaries), which are sent just before the batch.
+    """
+
+    def __init__(
+        self,
+        hub: "Hub",
+        ws: WebSocket,
+        maxsize: int,
+        policy: SlowConsumerPolicy,
+        protocol: str = wire.JSON,
+    ) -> None:
+        self.hub = hub
+        self.ws = ws
+        self.id = uuid.uuid4().hex[:8]
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.protocol = protocol
+        # Symbol ids already announced to this client (binary protocols only).
+        self.known_symbols: Set[int] = set()
+        self.queue: Deque[_Pending] = deque()
+        self.latest: Dict[Hashable, _Pending] = {}
+        self.dropped = 0
+        self.conflated = 0
+        self.sent = 0
+        self.closed = False
+        # Rate-limited subscriptions: subscribed key -> min seconds between updates.
+        self.throttle: Dict[Tuple[str, str], float] = {}
+        self.rate_state: Dict[Tuple[str, str], _RateState] = {}
+        # Seconds to collect updates into one frame; 0 sends each frame on its own.
+        self.batch_window = 0.0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        return len(self.queue)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._sender())
+
+    def offer(
+        self,
+        data: Frame,
+        key: Optional[Hashable] = None,
+        *,
+        control: bool = False,
+        stamp: Optional[Stamp] = None,
+        hoist: bool = False,
+        final: bool = False,
+    ) -> bool:
+        """Queue an already-encoded frame; return ``False`` if it was not accepted.
+
+        Under the conflate policy a frame replaces the queued one of the same
+        ``key``. A ``final`` frame (a barClose) is never replaced and ends
+        conflation for its key, so later updates queue behind it in order.
+        """
+        if self.closed:
+            return False
+        if key is not None and self.policy is SlowConsumerPolicy.CONFLATE and not final:
+            pending = self.latest.get(key)
+            if pending is not None:
+                pending.data = data
+                pending.stamp = stamp
+                self.conflated += 1
+                self.hub.stats["conflated"] += 1
+                return True
+        if not (control or hoist) and len(self.queue) >= self.maxsize:
+            # Control frames are never evicted; with nothing else to drop the client goes.
+            if self.policy is SlowConsumerPolicy.DISCONNECT or not self._drop_oldest():
+                self.hub.stats["slow_disconnects"] += 1
+                self.hub.disconnect(self.ws)
+                asyncio.create_task(self._close(code=1013))
+                return False
+        pending = _Pending(key, data, stamp, control, hoist)
+        self.queue.append(pending)
+        if key is not None:
+            if final:
+                self.latest.pop(key, None)
+            else:
+                self.latest[key] = pending
+        self._wakeup.set()
+        return True
+
+    def _drop_oldest(self) -> bool:
+        """Evict the oldest bar frame, skipping control ones; ``False`` if there is none."""
+        for i, old in enumerate(self.queue):
+            if not old.control:
+                break
+        else:
+            return False
+        del self.queue[i]
+        if old.key is not None and self.latest.get(old.key) is old:
+            del self.latest[old.key]
+        self.dropped += 1
+        self.hub.stats["dropped"] += 1
+        return True
+
+    async def _sender(self) -> None:
+        try:
+            while not self.closed:
+                if not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                head = self.queue[0]
+                if self.batch_window and (head.hoist or not head.control):
+                    await asyncio.sleep(self.batch_window)
+                    if self.closed or not self.queue:
+                        continue
+                    hoisted, batch = self._take_batch()
+                    for pending in hoisted:
+                        await self._send(pending.data, (pending,))
+                    if len(batch) > 1:
+                        await self._send(_join(batch), batch)
+                        self.hub.stats["batches"] += 1
+                    elif batch:
+                        await self._send(batch[0].data, batch)
+                    continue
+                pending = self._take()
+                await self._send(pending.data, (pending,))
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            # Starlette raises WebSocketDisconnect / RuntimeError once the peer is gone.
+            logger.debug("WebSocket send failed: %s", exc)
+            self.hub.stats["send_errors"] += 1
+            self.hub.disconnect(self.ws)
+
+    def _take(self) -> _Pending:
+        pending = self.queue.popleft()
+        if pending.key is not None and self.latest.get(pending.key) is pending:
+            del self.latest[pending.key]
+        return pending
+
+    def _take_batch(self) -> Tuple[List[_Pending], List[_Pending]]:
+        """Pop the leading run of non-control frames of one kind (text or bytes).
+
+        Returns the hoisted control messages found inside the run and the run.
+        """
+        hoisted: List[_Pending] = []
+        batch: List[_Pending] = []
+        limit = settings.WS_BATCH_MAX_FRAMES
+        while self.queue and len(batch) < limit:
+            head = self.queue[0]
+            if head.hoist:
+                hoisted.append(self._take())
+            elif head.control or (batch and type(head.data) is not type(batch[0].data)):
+                break
+            else:
+                batch.append(self._take())
+        return hoisted, batch
+
+    async def _send(self, data: Frame, pendings: Iterable[_Pending]) -> None:
+        if isinstance(data, bytes):
+            await self.ws.send_bytes(data)
+        else:
+            await self.ws.send_text(data)
+        self.sent += 1
+        now = time.time()
+        for pending in pendings:
+            if pending.stamp is not None:
+                upstream, encoded = pending.stamp
+                metrics.LATENCY_ENCODED_TO_SENT.observe(now - encoded)
+                if upstream:
+                    metrics.LATENCY_UPSTREAM_TO_SENT.observe(now - upstream)
+
+    async def _close(self, code: int = 1000) -> None:
+        try:
+            await self.ws.close(code=code)
+        except Exception:  # pragma: no cover - socket already gone
+            pass
+
+    def stop(self) -> None:
+        self.closed = True
+        self.queue.clear()
+        self.latest.clear()
+        self.rate_state.clear()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+
+class Hub:
+    def __init__(
+        self,
+        queue_size: Optional[int] = None,
+        policy: Optional[SlowConsumerPolicy | str] = None,
+        broker: Optional[Broker] = None,
+        history_loader: Optional[HistoryLoader] = None,
+    ):
+        self.clients: Dict[WebSocket, ClientConnection] = {}
+        self.registry = SubscriptionRegistry()
+        # Calendar update subscriptions per connection, by id (see ``publish_calendar``).
+        self.calendar_subs: Dict[WebSocket, Dict[str, CalendarSubscription]] = {}
+        # Called on each calendar subscription while there were none, so the
+        # shared calendar sync only starts once a client wants pushes.
+        self.calendar_demand: Optional[Callable[[], None]] = None
+        self.rollup = BarRollup()
+        self.streams = StreamStore()
+        self.symbols = wire.SymbolTable()
+        # Recent bars per (symbol, tf) for snapshots and in-process readers.
+        self.bars = BarStore()
+        # Server-side indicator states shared per (symbol, tf, params).
+        self.indicators = LiveIndicators(self.bars, history_loader)
+        # Tops up subscribe snapshots when memory holds fewer bars than asked for.
+        self.history_loader = history_loader
+        self.wheel = TimerWheel(self._flush_throttled, tick_s=settings.WS_THROTTLE_TICK_MS / 1000)
+        # With a broker, bars published here go out through it and this hub only
+        # receives the (symbol, tf) channels its own clients subscribed to.
+        self.broker = broker
+        if broker is not None:
+            broker.set_handler(self.fan_out)
+        # Upstream feeds follow demand through these (see ``add_demand_listener``).
+        self.demand_listeners: List[DemandListener] = []
+        # Keys other workers' clients want, announced over the broker.
+        self.remote_demand = DemandTracker(3 * settings.HUB_DEMAND_REFRESH_S)
+        self._demand_task: Optional[asyncio.Task] = None
+        self.registry.on_key_added = self._on_key_added
+        self.registry.on_key_removed = self._on_key_removed
+        self.sinks: List[BarSink] = []
+        self._sink_waits: List[Callable[[], Awaitable[None]]] = []
+        self.session_id = str(uuid.uuid4())
+        self.queue_size = queue_size or settings.WS_SEND_QUEUE_SIZE
+        self.policy = SlowConsumerPolicy(policy or settings.WS_SLOW_CONSUMER_POLICY)
+        self.stats: Dict[str, int] = {
+            "published": 0,
+            "enqueued": 0,
+            "dropped": 0,
+            "conflated": 0,
+            "slow_disconnects": 0,
+            "send_errors": 0,
+            "connects": 0,
+            "disconnects": 0,
+            "batches": 0,
+            "gapfills": 0,
+            "calendar_pushes": 0,
+        }
+        # Backfilled bars per (symbol, tf) awaiting their gapfill frame, by bar start.
+        self._gapfill: Dict[Tuple[str, str], Dict[int, Tuple[int, BarEvent]]] = {}
+        self._gapfill_scheduled = False
+
+    async def start(self) -> None:
+        if self.broker is not None:
+            await self.broker.start()
+            self._demand_task = asyncio.create_task(self._refresh_demand())
+
+    async def close(self) -> None:
+        self.wheel.stop()
+        if self._demand_task is not None:
+            self._demand_task.cancel()
+            self._demand_task = None
+        if self.broker is not None:
+            await self.broker.close()
+
+    async def connect(self, ws: WebSocket, protocol: Optional[str] = None):
+        """Accept ``ws`` and greet it; ``protocol`` picks the bar encoding (JSON if unknown)."""
+        await ws.accept()
+        try:
+            protocol = wire.negotiate(protocol)
+        except ValueError:
+            protocol = wire.JSON
+        conn = ClientConnection(self, ws, self.queue_size, self.policy, protocol)
+        self.clients[ws] = conn
+        self.stats["connects"] += 1
+        conn.offer(json.dumps(self._hello(protocol)), control=True)
+        conn.start()
+
+    def _hello(self, protocol: str) -> Dict[str, Any]:
+        return {
+            "type": "hello",
+            "sessionId": self.session_id,
+            "protocol": protocol,
+            "protocols": wire.available(),
+            "timeframes": wire.TIMEFRAMES,
+        }
+
+    def set_protocol(self, ws: WebSocket, protocol: Optional[str]) -> str:
+        """Switch the bar encoding of ``ws``; raises ``ValueError`` for unknown protocols."""
+        protocol = wire.negotiate(protocol)
+        conn = self.clients.get(ws)
+        if conn is not None and conn.protocol != protocol:
+            conn.protocol = protocol
+            conn.known_symbols.clear()
+            # Conflated/throttled frames already encoded in the old protocol stay as they are.
+            conn.rate_state.clear()
+        return protocol
+
+    @staticmethod
+    def parse_batch(batch: Any) -> int:
+        """Window in ms for a subscribe ``batch`` option (0 = off).
+
+        ``True`` picks ``WS_BATCH_WINDOW_MS``; a number asks for that many ms,
+        up to ``WS_BATCH_MAX_WINDOW_MS``. Raises ``ValueError`` otherwise.
+        """
+        if batch is True:
+            return settings.WS_BATCH_WINDOW_MS
+        if batch is False or batch is None:
+            return 0
+        if isinstance(batch, (int, float)) and 0 <= batch <= settings.WS_BATCH_MAX_WINDOW_MS:
+            return int(batch)
+        raise ValueError(f"batch must be true/false or 0-{settings.WS_BATCH_MAX_WINDOW_MS} ms")
+
+    def set_batch(self, ws: WebSocket, window_ms: int) -> None:
+        """Collect every bar frame of ``ws`` for ``window_ms`` into one frame (0 = off)."""
+        conn = self.clients.get(ws)
+        if conn is not None:
+            conn.batch_window = max(0, window_ms) / 1000
+
+    def disconnect(self, ws: WebSocket):
+        conn = self.clients.pop(ws, None)
+        if conn is not None:
+            self.stats["disconnects"] += 1
+            conn.stop()
+        self.registry.remove_conn(ws)
+        self.calendar_subs.pop(ws, None)
+        self.indicators.detach(ws)
+
+    def send_json(self, ws: WebSocket, message: Dict[str, Any]) -> None:
+        """Queue a control message for one client (never dropped or conflated)."""
+        conn = self.clients.get(ws)
+        if conn is not None:
+            conn.offer(json.dumps(message), control=True)
+
+    def add_demand_listener(self, listener: DemandListener) -> None:
+        """Register ``listener`` and replay the keys that already have subscribers.
+
+        With a broker, the listener also hears the demand of every other
+        worker on it (each key once), so feeds running in a separate ingest
+        process follow the clients of all API workers.
+        """
+        if self.broker is not None and self.broker.demand_handler is None:
+            self.broker.set_demand_handler(self._on_remote_demand)
+        self.demand_listeners.append(listener)
+        for key in list(self.registry.forward) + self.remote_demand.keys():
+            listener(key, True)
+
+    def add_bar_sink(
+        self,
+        sink: BarSink,
+        wait_for_room: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> None:
+        """Hand every published event to ``sink`` before fan-out or the broker.
+
+        Sinks run where the feeds run (the ingest process with a broker), so
+        each event reaches them once. ``wait_for_room`` is awaited by
+        :meth:`drain` to slow feeds down while the sink catches up.
+        """
+        self.sinks.append(sink)
+        if wait_for_room is not None:
+            self._sink_waits.append(wait_for_room)
+
+    async def drain(self) -> None:
+        """Backpressure point for feeds: returns once every sink has room."""
+        for wait in self._sink_waits:
+            await wait()
+
+    def _on_key_added(self, key: Tuple[str, str]) -> None:
+        if self.broker is not None:
+            self.broker.subscribe(*key)
+            self.broker.publish_demand({"w": self.session_id, "add": list(key)})
+        for listener in self.demand_listeners:
+            listener(key, True)
+
+    def _on_key_removed(self, key: Tuple[str, str]) -> None:
+        for listener in self.demand_listeners:
+            listener(key, False)
+        symbol, tf = key
+        keys = [key] if symbol != WILDCARD else [k for k in self.streams.streams if k[1] == tf]
+        for stream_key in keys:
+            if not self.registry.has_subscribers(*stream_key):
+                self.streams.release(*stream_key)
+        if self.broker is not None:
+            self._on_broker_key_removed(key)
+
+    def _on_remote_demand(self, message: DemandMessage) -> None:
+        if message.get("w") == self.session_id:
+            return  # our own keys reach the listeners through the registry
+        for key, added in self.remote_demand.apply(message, time.monotonic()):
+            for listener in self.demand_listeners:
+                listener(key, added)
+
+    async def _refresh_demand(self) -> None:
+        """Re-announce this worker's keys and drop workers that went quiet.
+
+        Announcements are fire-and-forget, so the periodic full set repairs
+        lost ones and tells a restarted ingest process what is wanted.
+        """
+        while True:
+            self.broker.publish_demand(
+                {"w": self.session_id, "keys": [list(key) for key in self.registry.forward]}
+            )
+            for key, added in self.remote_demand.expire(time.monotonic()):
+                for listener in self.demand_listeners:
+                    listener(key, added)
+            await asyncio.sleep(settings.HUB_DEMAND_REFRESH_S)
+
+    def _on_broker_key_removed(self, key: Tuple[str, str]) -> None:
+        self.broker.unsubscribe(*key)
+        self.broker.publish_demand({"w": self.session_id, "remove": list(key)})
+        # Events stop arriving for keys nobody here subscribes to, so their
+        # buffers can no longer serve snapshots or resumes without a gap.
+        symbol, tf = key
+        keys = [key] if symbol != WILDCARD else [k for k in self.streams.streams if k[1] == tf]
+        for stream_symbol, stream_tf in keys:
+            if not self.registry.has_subscribers(stream_symbol, stream_tf):
+                self.streams.invalidate(stream_symbol, stream_tf)
+                self.bars.discard(stream_symbol, stream_tf)
+
+    @staticmethod
+    def _validate(
+        symbol: str | Iterable[str],
+        tf: str,
+        max_rate: Optional[float],
+    ) -> Tuple[List[str], Optional[float]]:
+        if tf not in TF_STEP_SEC:
+            raise ValueError(f"Unsupported tf '{tf}'.")
+        if max_rate is not None:
+            max_rate = float(max_rate)
+            if not max_rate > 0:
+                raise ValueError("maxRate must be positive")
+        symbols = [symbol] if isinstance(symbol, str) else list(symbol)
+        symbols = [s for s in symbols if isinstance(s, str) and s.strip()]
+        if not symbols:
+            raise ValueError("subscribe requires at least one symbol")
+        return symbols, max_rate
+
+    def subscribe(
+        self,
+        ws: WebSocket,
+        symbol: str | Iterable[str],
+        tf: str,
+        sub_id: Optional[str] = None,
+        max_rate: Optional[float] = None,
+    ) -> Subscription:
+        """Subscribe ``ws`` to one symbol, several symbols or ``"*"`` under one id.
+
+        ``max_rate`` caps open-bar updates per second for this subscription; only
+        the latest state of each open bar is kept in between, and barClose is
+        always delivered immediately.
+        """
+        symbols, max_rate = self._validate(symbol, tf, max_rate)
+        previous = self.registry.get(ws, sub_id) if sub_id is not None else None
+        sub = self.registry.add(ws, symbols, tf, sub_id, max_rate=max_rate)
+        if previous is not None:
+            # Replacing an id may lift a rate limit on keys the new one drops.
+            self._refresh_throttle(ws, previous)
+            self.indicators.detach(ws, sub.id)
+        self._refresh_throttle(ws, sub)
+        return sub
+
+    async def subscribe_stream(
+        self,
+        ws: WebSocket,
+        symbol: str | Iterable[str],
+        tf: str,
+        sub_id: Optional[str] = None,
+        max_rate: Optional[float] = None,
+        *,
+        snapshot: int = 0,
+        resume: Optional[Mapping[str, int]] = None,
+        session_id: Optional[str] = None,
+        indicator: Any = None,
+    ) -> Tuple[Subscription, Dict[str, str]]:
+        """Subscribe with catch-up first, then live deltas.
+
+        ``resume`` maps symbols to the last ``seq`` the client saw from the hub
+        session ``session_id``; only the missed events are replayed. Where that
+        is impossible (other session, events already evicted), or with no
+        resume and ``snapshot > 0``, a snapshot of the most recent bars is sent
+        instead, topped up from ``history_loader`` when memory is short. Catch-up
+        is queued and the subscription registered without yielding in between,
+        so live deltas continue exactly after the catch-up ``seq``.
+
+        ``indicator`` (e.g. ``{"name": "supertrend_ai", "params": {...}}``)
+        additionally streams that indicator: an ``indicatorSnapshot`` per
+        symbol now, then one ``indicator`` point after every barClose, computed
+        once per distinct parameter set for all subscribers.
+
+        Returns the subscription and, per symbol, ``resumed``, ``snapshot`` or
+        ``live``.
+        """
+        symbols, max_rate = self._validate(symbol, tf, max_rate)
+        spec = None
+        if indicator is not None:
+            spec = normalize_indicator(indicator)
+            if any(s.strip() == WILDCARD for s in symbols):
+                raise ValueError("indicator subscriptions need explicit symbols")
+        limit = min(max(0, int(snapshot or 0)), settings.WS_SNAPSHOT_MAX_BARS)
+        if resume is not None and not isinstance(resume, Mapping):
+            raise ValueError("resume must map symbols to their last seq")
+        resume = {str(k).upper(): int(v) for k, v in (resume or {}).items()}
+        same_session = session_id == self.session_id
+        fallback = limit or settings.WS_HISTORY_BARS
+        wanted = [s.strip().upper() for s in symbols if s.strip() != WILDCARD]
+
+        def plan(sym: str) -> Tuple[Optional[List[Tuple[int, BarEvent]]], int]:
+            if sym in resume:
+                if same_session:
+                    missed = self.streams.missed(sym, tf, resume[sym])
+                    if missed is not None:
+                        return missed, 0
+                return None, fallback
+            return None, limit
+
+        loaded: Dict[str, List[Dict[str, Any]]] = {}
+        if self.history_loader is not None:
+            short = []
+            for sym in wanted:
+                _, size = plan(sym)
+                if size and len(self.bars.last(sym, tf, size)) < size:
+                    short.append((sym, size))
+            results = await asyncio.gather(
+                *(self.history_loader(sym, tf, size) for sym, size in short),
+                return_exceptions=True,
+            )
+            for (sym, _), rows in zip(short, results):
+                if isinstance(rows, BaseException):
+                    logger.warning("Snapshot history for %s %s failed: %s", sym, tf, rows)
+                    continue
+                loaded[sym] = rows
+        live: List[LiveIndicator] = []
+        if spec is not None:
+            live = list(
+                await asyncio.gather(
+                    *(self.indicators.prepare(sym, tf, *spec) for sym in wanted)
+                )
+            )
+
+        # From here on nothing awaits: catch-up and registration are atomic.
+        conn = self.clients.get(ws)
+        modes: Dict[str, str] = {}
+        for sym in wanted:
+            missed, size = plan(sym)
+            if missed is not None:
+                modes[sym] = "resumed"
+                if conn is not None:
+                    for seq, event in missed:
+                        self._announce_symbol(conn, event.symbol)
+                        conn.offer(self._encode(event, seq, conn.protocol), control=True)
+            elif size:
+                modes[sym] = "snapshot"
+                if conn is not None:
+                    frame = self._snapshot(sym, tf, size, loaded.get(sym, []), sub_id)
+                    conn.offer(frame, control=True)
+            else:
+                modes[sym] = "live"
+        sub = self.subscribe(ws, symbols, tf, sub_id, max_rate=max_rate)
+        for entry in live:
+            if conn is not None and not conn.closed:
+                conn.offer(self.indicators.attach(entry, ws, sub.id), control=True)
+            else:
+                self.indicators.release(entry)
+        return sub, modes
+
+    def _snapshot(
+        self,
+        symbol: str,
+        tf: str,
+        limit: int,
+        rows: List[Dict[str, Any]],
+        sub_id: Optional[str],
+    ) -> str:
+        stream = self.streams.open(symbol, tf)
+        recent = self.bars.last(symbol, tf, limit)
+        oldest = int(recent["ts"][0]) if len(recent) else None
+        bars = [
+            {
+                "tsStart": int(row["time"]),
+                "o": row["open"],
+                "h": row["high"],
+                "l": row["low"],
+                "c": row["close"],
+                "v": int(row["volume"]),
+                "barClose": True,
+            }
+            for row in rows
+            if oldest is None or int(row["time"]) < oldest
+        ]
+        for ts, o, h, low, c, v in recent.tolist():
+            bars.append(
+                {"tsStart": ts, "o": o, "h": h, "l": low, "c": c, "v": int(v), "barClose": True}
+            )
+        buf = self.bars.get(symbol, tf)
+        if bars and len(recent) and buf is not None and not buf.last_closed:
+            bars[-1]["barClose"] = False
+        return json.dumps(
+            {
+                "type": "snapshot",
+                "sessionId": self.session_id,
+                "id": sub_id,
+                "symbol": symbol,
+                "tf": tf,
+                "seq": stream.seq,
+                "bars": bars[-limit:],
+            }
+        )
+
+    def unsubscribe(self, ws: WebSocket, sub_id: str) -> Optional[Subscription]:
+        sub = self.registry.remove(ws, sub_id)
+        if sub is not None:
+            self._refresh_throttle(ws, sub)
+            self.indicators.detach(ws, sub_id)
+        return sub
+
+    def subscribe_calendar(
+        self,
+        ws: WebSocket,
+        sub_id: Optional[str] = None,
+        countries: Optional[str | Iterable[str]] = None,
+        min_impact: Optional[str] = None,
+    ) -> CalendarSubscription:
+        """Push calendar events of ``countries`` (CSV or list; all if None) and impact.
+
+        Only changes reach the client, so it should subscribe before loading
+        its window from ``/v1/calendar``. Re-using an id replaces the filter.
+        """
+        if min_impact is not None and min_impact not in IMPACT_ORDER:
+            raise ValueError(f"minImpact must be one of {', '.join(IMPACT_ORDER)}")
+        wanted: Optional[frozenset[str]] = None
+        if countries is not None:
+            listed = countries.split(",") if isinstance(countries, str) else list(countries)
+            names = [c.strip().upper() for c in listed if isinstance(c, str) and c.strip()]
+            if not names:
+                raise ValueError("countries must name at least one country")
+            wanted = frozenset(names)
+        sub = CalendarSubscription(sub_id or uuid.uuid4().hex[:12], wanted, min_impact)
+        if not self.calendar_subs and self.calendar_demand is not None:
+            self.calendar_demand()
+        self.calendar_subs.setdefault(ws, {})[sub.id] = sub
+        return sub
+
+    def unsubscribe_calendar(self, ws: WebSocket, sub_id: str) -> bool:
+        owned = self.calendar_subs.get(ws)
+        if not owned or owned.pop(sub_id, None) is None:
+            return False
+        if not owned:
+            del self.calendar_subs[ws]
+        return True
+
+    def publish_calendar(
+        self,
+        events: List[Dict[str, Any]],
+        removed: Iterable[Dict[str, Any]] = (),
+    ) -> int:
+        """Send new or changed calendar events, and ids of withdrawn ones, to each subscription.
+
+        Meant as a ``CalendarSync`` listener: one upstream poll per process
+        fans out here instead of every client polling. Returns frames queued.
+        """
+        removed = list(removed)
+        sent = 0
+        for ws, subs in self.calendar_subs.items():
+            conn = self.clients.get(ws)
+            if conn is None:
+                continue
+            for sub in subs.values():
+                matched = [e for e in events if sub.matches(e)]
+                gone = [e["id"] for e in removed if sub.matches(e)]
+                if matched or gone:
+                    message: Dict[str, Any] = {"type": "calendar", "id": sub.id, "events": matched}
+                    if gone:
+                        message["removed"] = gone
+                    conn.offer(json.dumps(message), control=True)
+                    sent += 1
+        self.stats["calendar_pushes"] += sent
+        return sent
+
+    def _refresh_throttle(self, ws: WebSocket, sub: Subscription) -> None:
+        conn = self.clients.get(ws)
+        if conn is None:
+            return
+        for key in sub.keys:
+            interval = self.registry.min_interval(ws, key)
+            if interval:
+                conn.throttle[key] = interval
+            else:
+                conn.throttle.pop(key, None)
+
+    def _depth_total(self) -> int:
+        return sum(conn.depth for conn in self.clients.values())
+
+    def queue_depths(self) -> Dict[str, int]:
+        depths = [conn.depth for conn in self.clients.values()]
+        return {
+            "connections": len(depths),
+            "total": sum(depths),
+            "max": max(depths, default=0),
+        }
+
+    def snapshot_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "broker": dict(self.broker.stats) if self.broker is not None else None,
+            "subscriptions": len(self.registry),
+            "calendar_subscriptions": sum(len(subs) for subs in self.calendar_subs.values()),
+            "streams": len(self.streams),
+            "replay_events": self.streams.events,
+            "symbols": len(self.symbols),
+            "bars": self.bars.stats(),
+            "indicators": {"states": len(self.indicators), **self.indicators.stats},
+            "keys": len(self.registry.forward),
+            "queue": self.queue_depths(),
+            "policy": self.policy.value,
+        }
+
+    def collect_metrics(self) -> List[metrics.Family]:
+        """Scrape-time families for ``/metrics`` (register with ``REGISTRY.register_collector``)."""
+        counters = [
+            ("hub_events_published", "published", "Bar events fanned out by this hub."),
+            ("hub_frames_enqueued", "enqueued", "Frames queued to client connections."),
+            ("hub_frames_dropped", "dropped", "Frames dropped from full send queues."),
+            ("hub_frames_conflated", "conflated", "Open-bar frames replaced by a newer one."),
+            ("hub_slow_disconnects", "slow_disconnects", "Clients disconnected for a full queue."),
+            ("hub_send_errors", "send_errors", "Failed WebSocket sends."),
+            ("hub_ws_connects", "connects", "Accepted WebSocket connections."),
+            ("hub_ws_disconnects", "disconnects", "Closed WebSocket connections."),
+            ("hub_batches_sent", "batches", "Batched frames carrying several updates."),
+            ("hub_gapfills_sent", "gapfills", "Gap-fill frames after feed outages."),
+            ("hub_calendar_pushes", "calendar_pushes", "Calendar update frames sent."),
+        ]
+        families: List[metrics.Family] = [
+            (name, "counter", help, [((), float(self.stats[stat]))])
+            for name, stat, help in counters
+        ]
+        conns = list(self.clients.values())
+        gauges = [
+            ("hub_ws_connections", "Open WebSocket connections.", len(conns)),
+            ("hub_subscriptions", "Active subscriptions.", len(self.registry)),
+            ("hub_send_queue_depth_total", "Frames queued, all connections.", self._depth_total()),
+            ("hub_live_indicators", "Shared live indicator states.", len(self.indicators)),
+            ("hub_replay_events", "Events held for resume-by-seq.", self.streams.events),
+        ]
+        families.extend((name, "gauge", help, [((), value)]) for name, help, value in gauges)
+        # Per-connection depth for the deepest queues only, to bound label cardinality.
+        deepest = sorted(conns, key=lambda c: c.depth, reverse=True)
+        del deepest[settings.WS_METRICS_TOP_CONNECTIONS :]
+        families.append(
+            (
+                "hub_send_queue_depth",
+                "gauge",
+                "Send queue depth of the deepest connections.",
+                [((("conn", conn.id),), conn.depth) for conn in deepest],
+            )
+        )
+        if self.broker is not None:
+            families.append(
+                (
+                    "hub_broker_messages",
+                    "counter",
+                    "Broker messages by outcome.",
+                    [((("outcome", k),), float(v)) for k, v in self.broker.stats.items()],
+                )
+            )
+        return families
+
+    async def publish_tick(
+        self,
+        symbol: str,
+        tf: str,
+        tick: dict,
+        final: bool = False,
+        *,
+        upstream_ms: Optional[int] = None,
+        received_s: Optional[float] = None,
+    ):
+        """Publish a bar update from a feed.
+
+        ``tick = {"ts": epoch_ms, "o","h","l","c","v"}`` (raw or partial). 1m
+        input is rolled up into every timeframe; other timeframes are relabelled
+        onto their bucket and forwarded as-is. ``upstream_ms`` (when the feed
+        says when the update happened) and ``received_s`` feed latency metrics.
+        """
+        events = self._tick_events(symbol, tf, tick, final)
+        self.publish_events(self._stamp(events, upstream_ms, received_s))
+
+    def _tick_events(self, symbol: str, tf: str, tick: dict, final: bool) -> List[BarEvent]:
+        if tf == BASE_TF:
+            return self.rollup.on_bar(symbol, tick, final=final)
+        start_ms, _ = bucket_bounds(int(tick["ts"]), tf)
+        return [
+            BarEvent(
+                symbol,
+                tf,
+                start_ms,
+                float(tick["o"]),
+                float(tick["h"]),
+                float(tick["l"]),
+                float(tick["c"]),
+                float(tick.get("v", 0) or 0),
+                final,
+            )
+        ]
+
+    async def publish_trade(
+        self,
+        symbol: str,
+        ts_ms: int,
+        price: float,
+        size: float = 0,
+        *,
+        received_s: Optional[float] = None,
+    ):
+        events = self.rollup.on_trade(symbol, ts_ms, price, size)
+        self.publish_events(self._stamp(events, ts_ms, received_s))
+
+    def publish_batch(
+        self,
+        updates: Iterable[BarUpdate | TradeUpdate],
+        *,
+        received_s: Optional[float] = None,
+    ) -> int:
+        """Publish every update of one feed frame in order, without awaiting in between.
+
+        Returns the number of bar events produced.
+        """
+        if received_s is None:
+            received_s = time.time()
+        events: List[BarEvent] = []
+        for update in updates:
+            if isinstance(update, TradeUpdate):
+                produced = self.rollup.on_trade(
+                    update.symbol, update.ts_ms, update.price, update.size
+                )
+                upstream_ms: Optional[int] = update.ts_ms
+            else:
+                produced = self._tick_events(update.symbol, update.tf, update.tick, update.final)
+                upstream_ms = update.upstream_ms
+            events.extend(self._stamp(produced, upstream_ms, received_s))
+        self.publish_events(events)
+        return len(events)
+
+    @staticmethod
+    def _stamp(
+        events: List[BarEvent],
+        upstream_ms: Optional[int],
+        received_s: Optional[float],
+    ) -> List[BarEvent]:
+        received = received_s if received_s is not None else time.time()
+        upstream = upstream_ms / 1000 if upstream_ms else 0.0
+        if upstream:
+            metrics.LATENCY_UPSTREAM_TO_RECEIVED.observe(received - upstream)
+        timing = (upstream, received)
+        for event in events:
+            event.timing = timing
+        return events
+
+    def publish_gapfill(self, symbol: str, tf: str, rows: Iterable[Dict[str, Any]]) -> int:
+        """Merge bars a feed missed (rows shaped like ``db_timescale.fetch_ohlc``) in order.
+
+        The bars go through the rollup, ring buffers, seq logs and sinks like live
+        closed bars, but subscribers get one ``gapfill`` frame per stream instead
+        of a bar frame each. Returns the number of bar events produced.
+        """
+        events: List[BarEvent] = []
+        for row in sorted(rows, key=lambda r: int(r["time"])):
+            tick = {
+                "ts": int(row["time"]),
+                "o": row["open"],
+                "h": row["high"],
+                "l": row["low"],
+                "c": row["close"],
+                "v": row.get("volume", 0),
+            }
+            events.extend(self._tick_events(symbol, tf, tick, True))
+        for event in events:
+            event.gapfill = True
+        self.publish_events(events)
+        self._flush_gapfill()
+        return len(events)
+
+    def flush_bars(self, now_ms: Optional[int] = None) -> None:
+        """Emit barClose for buckets that ended without a closing input."""
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        self.publish_events(self.rollup.flush(now_ms))
+
+    def publish_events(self, events: Iterable[BarEvent]) -> None:
+        for event in events:
+            for sink in self.sinks:
+                sink(event)
+            if self.broker is not None:
+                self.broker.publish(event)
+            else:
+                self.fan_out(event)
+
+    def fan_out(self, event: BarEvent) -> None:
+        """Encode ``event`` once and queue it for every local subscriber."""
+        live_heads.bump(event.symbol, event.tf, int(time.time() * 1000))
+        self.stats["published"] += 1
+        sockets = self.registry.subscribers(event.symbol, event.tf)
+        seq = self.streams.record(event, subscribed=bool(sockets))
+        self.bars.on_event(event)
+        if event.gapfill:
+            self._queue_gapfill(event, seq, bool(sockets))
+            return
+        metrics.fanout_size.observe(len(sockets))
+        if not sockets:
+            return
+        now = time.time()
+        stamp: Optional[Stamp] = None
+        if event.timing is not None:
+            metrics.LATENCY_RECEIVED_TO_ENCODED.observe(now - event.timing[1])
+            stamp = (event.timing[0], now)
+        # Encode once per protocol; each connection's sender task does the actual I/O.
+        frames: Dict[str, Frame] = {}
+        key = (event.symbol, event.tf)
+        for ws in sockets:
+            conn = self.clients.get(ws)
+            if conn is None:
+                continue
+            data = frames.get(conn.protocol)
+            if data is None:
+                data = frames[conn.protocol] = self._encode(event, seq, conn.protocol)
+            if conn.protocol != wire.JSON:
+                self._announce_symbol(conn, event.symbol)
+            if conn.throttle:
+                interval = self._interval(ws, conn, event.symbol, event.tf)
+                if interval:
+                    self._offer_throttled(
+                        conn, (event.symbol, event.tf), data, event.closed, interval, stamp
+                    )
+                    continue
+            if conn.offer(data, key, stamp=stamp, final=event.closed):
+                self.stats["enqueued"] += 1
+        if event.closed and self.indicators.by_stream:
+            # Indicator points follow the barClose they were computed from.
+            self._push_indicator_points(event)
+
+    def _queue_gapfill(self, event: BarEvent, seq: int, subscribed: bool) -> None:
+        if subscribed:
+            key = (event.symbol, event.tf)
+            self._gapfill.setdefault(key, {})[event.start_ms] = (seq, event)
+            if not self._gapfill_scheduled:
+                # Broker-delivered backfills arrive one event at a time; group
+                # whatever arrived in this loop iteration.
+                self._gapfill_scheduled = True
+                try:
+                    asyncio.get_running_loop().call_soon(self._flush_gapfill)
+                except RuntimeError:
+                    self._gapfill_scheduled = False
+        if event.closed and self.indicators.by_stream:
+            self._push_indicator_points(event)
+
+    def _push_indicator_points(self, event: BarEvent) -> None:
+        for point, subscribers in self.indicators.on_close(event):
+            for ws in subscribers:
+                conn = self.clients.get(ws)
+                if conn is not None and conn.offer(point):
+                    self.stats["enqueued"] += 1
+
+    def _flush_gapfill(self) -> None:
+        """Send each stream's pending backfilled bars to its subscribers as one frame."""
+        self._gapfill_scheduled = False
+        pending, self._gapfill = self._gapfill, {}
+        for (symbol, tf), by_start in pending.items():
+            entries = [by_start[start] for start in sorted(by_start)]
+            bars = [
+                {
+                    "tsStart": e.start_ms,
+                    "o": e.o,
+                    "h": e.h,
+                    "l": e.l,
+                    "c": e.c,
+                    "v": int(e.v),
+                    "barClose": e.closed,
+                }
+                for _, e in entries
+            ]
+            frame = json.dumps(
+                {
+                    "type": "gapfill",
+                    "sessionId": self.session_id,
+                    "symbol": symbol,
+                    "tf": tf,
+                    "seq": max(seq for seq, _ in entries),
+                    "bars": bars,
+                }
+            )
+            self.stats["gapfills"] += 1
+            for ws in self.registry.subscribers(symbol, tf):
+                conn = self.clients.get(ws)
+                if conn is not None and conn.offer(frame, control=True):
+                    self.stats["enqueued"] += 1
+
+    def _encode(self, event: BarEvent, seq: int, protocol: str = wire.JSON) -> Frame:
+        if protocol == wire.BINARY:
+            return wire.encode_binary(event, seq, self.symbols.id(event.symbol))
+        if protocol == wire.MSGPACK:
+            return wire.encode_msgpack(event, seq, self.symbols.id(event.symbol))
+        return wire.encode_json(event, seq, self.session_id)
+
+    def _announce_symbol(self, conn: ClientConnection, symbol: str) -> None:
+        """Send the symbol-id dictionary entry ahead of the first binary frame using it."""
+        if conn.protocol == wire.JSON:
+            return
+        sid = self.symbols.id(symbol)
+        if sid not in conn.known_symbols:
+            conn.known_symbols.add(sid)
+            conn.offer(json.dumps({"type": "symbols", "symbols": {symbol: sid}}), hoist=True)
+
+    def _interval(self, ws: WebSocket, conn: ClientConnection, symbol: str, tf: str) -> float:
+        # An unthrottled match (exact or wildcard) wins over a throttled one.
+        intervals = [
+            conn.throttle.get(key, 0.0)
+            for key in ((symbol, tf), (WILDCARD, tf))
+            if ws in self.registry.forward.get(key, ())
+        ]
+        return min(intervals, default=0.0)
+
+    def _offer_throttled(
+        self,
+        conn: ClientConnection,
+        key: Tuple[str, str],
+        data: Frame,
+        closed: bool,
+        interval: float,
+        stamp: Optional[Stamp] = None,
+    ) -> None:
+        state = conn.rate_state.get(key)
+        if state is None:
+            state = conn.rate_state[key] = _RateState()
+        if closed:
+            if state.pending is not None:
+                state.pending = None  # the close supersedes the held update
+                self.stats["conflated"] += 1
+            if conn.offer(data, key, stamp=stamp, final=True):
+                self.stats["enqueued"] += 1
+            return
+
+        now = time.monotonic()
+        if not state.scheduled and now - state.last_sent >= interval:
+            state.last_sent = now
+            if conn.offer(data, key, stamp=stamp):
+                self.stats["enqueued"] += 1
+            return
+        if state.pending is not None:
+            self.stats["conflated"] += 1
+        state.pending = data
+        state.stamp = stamp
+        if not state.scheduled:
+            state.scheduled = True
+            self.wheel.schedule(state.last_sent + interval - now, (conn, key))
+
+    def _flush_throttled(self, item: Tuple[ClientConnection, Tuple[str, str]]) -> None:
+        conn, key = item
+        state = conn.rate_state.get(key)
+        if conn.closed or state is None:
+            return
+        state.scheduled = False
+        if state.pending is not None:
+            data, state.pending = state.pending, None
+            state.last_sent = time.monotonic()
+            if conn.offer(data, key, stamp=state.stamp):
+                self.stats["enqueued"] += 1
@@ -0,0 +1,44 @@
+"""Standalone ingest process: runs the market data feeds once and publishes via the broker.
+
+Run one of these next to ``uvicorn backend.app.main:app --workers N`` with
+``HUB_BROKER=redis`` and ``HUB_RUN_FEEDS=false`` on the API workers, so only a
+single upstream stream is opened and every worker's hub receives the bars its
+clients subscribed to::
+
+    HUB_BROKER=redis python -m backend.app.ingest
+
+The workers announce the keys their clients subscribe to over the broker, so
+with ``ALPACA_FOLLOW_DEMAND`` this process subscribes those symbols upstream.
+
+For large universes set ``ALPACA_SHARDS`` (connections), optionally
+``ALPACA_SHARD_PROCESSES=true`` (one process per shard) and
+``ALPACA_UNIVERSE_FILE`` (reloaded and rebalanced on change); see
+:mod:`.sharding`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from .broker import make_broker
+from .feeds import close_feeds, start_feeds
+from .hub import Hub
+
+
+async def main() -> None:
+    broker = make_broker()
+    if broker is None:
+        raise SystemExit("HUB_BROKER must name a cross-process broker (e.g. redis) for ingest")
+    hub = Hub(broker=broker)
+    await hub.start()
+    try:
+        await asyncio.gather(*start_feeds(hub))
+    finally:
+        await hub.close()
+        await close_feeds()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
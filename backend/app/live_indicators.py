@@ -0,0 +1,322 @@
+"""Server-side indicator streams shared by every /ws subscriber with the same parameters.
+
+One :class:`IncrementalSuperTrendAI` is kept per ``(symbol, tf, indicator,
+params)``. It is warmed up from history once, advanced by one bar on every
+barClose the hub fans out, and its newest point is encoded once and queued
+to all attached subscriptions, so CPU scales with distinct parameter sets
+rather than with clients.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Set, Tuple
+
+from fastapi import WebSocket
+
+from ..indicators import IncrementalSuperTrendAI, SuperTrendAI
+from .bar_store import BarStore
+from .core.settings import settings
+from .rollup import BarEvent
+from .sessions import align_bucket_start_ms
+
+logger = logging.getLogger(__name__)
+
+SUPERTREND_AI = "supertrend_ai"
+
+# Same defaults and bounds as ``GET /api/indicators/{symbol}``.
+SUPERTREND_AI_DEFAULTS: Dict[str, Any] = {
+    "atr_length": 14,
+    "atr_mode": "EMA",
+    "factor_min": 1.5,
+    "factor_max": 5.0,
+    "factor_steps": 5,
+    "k": 3,
+    "perf_alpha": 10.0,
+    "denom_span": 10.0,
+    "from_cluster": "Best",
+    "use_ama": True,
+}
+
+Params = Tuple[Tuple[str, Any], ...]
+Key = Tuple[str, str, str, Params]
+
+HistoryLoader = Callable[[str, str, int], Awaitable[List[Dict[str, Any]]]]
+
+
+def build_supertrend_ai(params: Mapping[str, Any]) -> IncrementalSuperTrendAI:
+    model = SuperTrendAI(
+        perf_alpha=params["perf_alpha"],
+        denom_span=params["denom_span"],
+        from_cluster=params["from_cluster"],
+        use_ama=params["use_ama"],
+    )
+    return IncrementalSuperTrendAI(
+        model,
+        atr_length=params["atr_length"],
+        atr_mode=params["atr_mode"],
+        factor_min=params["factor_min"],
+        factor_max=params["factor_max"],
+        factor_steps=params["factor_steps"],
+        k_clusters=params["k"],
+    )
+
+
+def normalize(spec: Any) -> Tuple[str, Dict[str, Any]]:
+    """Validate a subscribe ``indicator`` spec; raises ``ValueError`` when it is unusable.
+
+    Accepts ``"supertrend_ai"`` or ``{"name": "supertrend_ai", "params": {...}}``
+    with the same parameter names as the REST endpoint.
+    """
+    if isinstance(spec, str):
+        spec = {"name": spec}
+    if not isinstance(spec, Mapping):
+        raise ValueError("indicator must be a name or {name, params}")
+    name = str(spec.get("name", "")).lower().replace("-", "_")
+    if name != SUPERTREND_AI:
+        raise ValueError(f"Unsupported indicator '{spec.get('name')}'")
+    raw = spec.get("params") or {}
+    if not isinstance(raw, Mapping):
+        raise ValueError("indicator params must be an object")
+    unknown = set(raw) - set(SUPERTREND_AI_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown indicator params: {sorted(unknown)}")
+
+    params = {**SUPERTREND_AI_DEFAULTS, **raw}
+    try:
+        params["atr_length"] = int(params["atr_length"])
+        params["factor_steps"] = int(params["factor_steps"])
+        params["k"] = int(params["k"])
+        for field in ("factor_min", "factor_max", "perf_alpha", "denom_span"):
+            params[field] = float(params[field])
+    except (TypeError, ValueError):
+        raise ValueError("indicator params must be numbers") from None
+    params["atr_mode"] = str(params["atr_mode"]).upper()
+    params["use_ama"] = bool(params["use_ama"])
+    if not 1 <= params["atr_length"] <= 500:
+        raise ValueError("atr_length must be between 1 and 500")
+    if params["atr_mode"] not in ("EMA", "RMA"):
+        raise ValueError("atr_mode must be EMA or RMA")
+    if not 1 <= params["factor_steps"] <= 50:
+        raise ValueError("factor_steps must be between 1 and 50")
+    if not 1 <= params["k"] <= 3:
+        raise ValueError("k must be between 1 and 3")
+    if min(params["factor_min"], params["perf_alpha"], params["denom_span"]) <= 0:
+        raise ValueError("factor_min, perf_alpha and denom_span must be positive")
+    if params["factor_max"] < params["factor_min"]:
+        raise ValueError("'factor_max' must be >= 'factor_min'.")
+    if params["from_cluster"] not in ("Best", "Average", "Worst"):
+        raise ValueError("from_cluster must be Best, Average or Worst")
+    return name, params
+
+
+def _json_safe(result: Dict[str, Any]) -> Dict[str, Any]:
+    if result.get("factor") != result.get("factor"):
+        result["factor"] = None  # empty history; NaN is not valid JSON
+    return result
+
+
+class LiveIndicator:
+    """One shared indicator state and the (connection, subscription id) pairs reading it."""
+
+    def __init__(self, symbol: str, tf: str, name: str, params: Dict[str, Any]) -> None:
+        self.symbol = symbol
+        self.tf = tf
+        self.name = name
+        self.params = params
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        # Stable across reconnects, so clients can match frames to their series.
+        self.id = f"{name}:{digest[:12]}"
+        self.state = build_supertrend_ai(params)
+        self.subscribers: Dict[WebSocket, Set[str]] = {}
+        self.lock = asyncio.Lock()
+        # False while warm-up runs in a worker thread; live closes are then
+        # picked up from the bar store once it finishes.
+        self.ready = False
+
+    def catch_up(self, bars: BarStore) -> int:
+        """Feed closed bars from the hub's ring buffer that the state has not seen yet."""
+        buf = bars.get(self.symbol, self.tf)
+        if buf is None or not len(buf):
+            return 0
+        rows = buf.last()
+        if not buf.last_closed:
+            rows = rows[:-1]
+        last = self.state.last_time
+        if last is not None:
+            rows = rows[rows["ts"] > last]
+        bars = [
+            {"time": ts, "high": h, "low": low, "close": c}
+            for ts, _, h, low, c, _ in rows.tolist()
+        ]
+        return self.state.update(bars)
+
+    def snapshot(self, sub_id: Optional[str]) -> str:
+        return json.dumps(
+            {
+                "type": "indicatorSnapshot",
+                "id": sub_id,
+                "key": self.id,
+                "symbol": self.symbol,
+                "tf": self.tf,
+                "name": self.name,
+                "params": self.params,
+                **_json_safe(self.state.to_dict()),
+            }
+        )
+
+    def point(self) -> Optional[str]:
+        latest = self.state.latest()
+        if latest is None:
+            return None
+        return json.dumps(
+            {
+                "type": "indicator",
+                "key": self.id,
+                "symbol": self.symbol,
+                "tf": self.tf,
+                "name": self.name,
+                **latest,
+            }
+        )
+
+
+class LiveIndicators:
+    """Registry of :class:`LiveIndicator` states keyed by ``(symbol, tf, name, params)``.
+
+    States are created by :meth:`prepare` (which may await history), bound to
+    subscriptions by :meth:`attach` and dropped with their last subscriber.
+    """
+
+    def __init__(self, bars: BarStore, history_loader: Optional[HistoryLoader] = None) -> None:
+        self.bars = bars
+        self.history_loader = history_loader
+        self.entries: Dict[Key, LiveIndicator] = {}
+        self.by_stream: Dict[Tuple[str, str], Set[Key]] = {}
+        # ws -> sub_id -> keys it is attached to, so detaching touches only those.
+        self.by_conn: Dict[WebSocket, Dict[str, Set[Key]]] = {}
+        self.stats: Dict[str, int] = {"updates": 0, "warmups": 0}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def key(symbol: str, tf: str, name: str, params: Mapping[str, Any]) -> Key:
+        return symbol, tf, name, tuple(sorted(params.items()))
+
+    async def prepare(
+        self, symbol: str, tf: str, name: str, params: Dict[str, Any]
+    ) -> LiveIndicator:
+        """Return the shared state for these parameters, warming it up on first use."""
+        key = self.key(symbol, tf, name, params)
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = LiveIndicator(symbol, tf, name, params)
+            self.by_stream.setdefault((symbol, tf), set()).add(key)
+        async with entry.lock:
+            if not entry.ready:
+                await self._warm_up(entry)
+        return entry
+
+    async def _warm_up(self, entry: LiveIndicator) -> None:
+        rows: List[Dict[str, Any]] = []
+        if self.history_loader is not None:
+            try:
+                rows = await self.history_loader(
+                    entry.symbol, entry.tf, settings.WS_INDICATOR_WARMUP_BARS
+                )
+            except Exception as exc:
+                logger.warning(
+                    "Indicator warm-up for %s %s failed: %s", entry.symbol, entry.tf, exc
+                )
+        # The ring buffer holds the newest bars (and the open one); history only
+        # contributes closed bars older than that.
+        buf = self.bars.get(entry.symbol, entry.tf)
+        if buf is not None and len(buf):
+            cutoff = int(buf.last()["ts"][0])
+        else:
+            cutoff = align_bucket_start_ms(int(time.time() * 1000), entry.tf)
+        bars = [row for row in rows if int(row["time"]) < cutoff]
+        if bars:
+            await asyncio.to_thread(entry.state.update, bars)
+        entry.catch_up(self.bars)
+        entry.ready = True
+        self.stats["warmups"] += 1
+
+    def attach(self, entry: LiveIndicator, ws: WebSocket, sub_id: str) -> str:
+        """Bind a subscription to ``entry`` and return its snapshot frame.
+
+        Does not await, so no barClose can slip in between the snapshot and
+        the first live point.
+        """
+        key = self.key(entry.symbol, entry.tf, entry.name, entry.params)
+        if self.entries.get(key) is not entry:  # dropped while warming up; reinstate
+            self.entries[key] = entry
+            self.by_stream.setdefault((entry.symbol, entry.tf), set()).add(key)
+        entry.catch_up(self.bars)
+        entry.subscribers.setdefault(ws, set()).add(sub_id)
+        self.by_conn.setdefault(ws, {}).setdefault(sub_id, set()).add(key)
+        return entry.snapshot(sub_id)
+
+    def release(self, entry: LiveIndicator) -> None:
+        """Forget ``entry`` if it ended up with no subscribers (e.g. the client left)."""
+        if not entry.subscribers:
+            self._drop(self.key(entry.symbol, entry.tf, entry.name, entry.params))
+
+    def detach(self, ws: WebSocket, sub_id: Optional[str] = None) -> None:
+        """Drop ``sub_id`` of ``ws`` (every subscription of ``ws`` when ``None``)."""
+        owned = self.by_conn.get(ws)
+        if not owned:
+            return
+        if sub_id is None:
+            detached = owned
+            del self.by_conn[ws]
+        else:
+            keys = owned.pop(sub_id, None)
+            if keys is None:
+                return
+            detached = {sub_id: keys}
+            if not owned:
+                del self.by_conn[ws]
+        for sid, keys in detached.items():
+            for key in keys:
+                entry = self.entries.get(key)
+                ids = entry.subscribers.get(ws) if entry is not None else None
+                if ids is None:
+                    continue
+                ids.discard(sid)
+                if not ids:
+                    del entry.subscribers[ws]
+                if not entry.subscribers and entry.ready:
+                    self._drop(key)
+
+    def _drop(self, key: Key) -> None:
+        if self.entries.pop(key, None) is None:
+            return
+        stream = self.by_stream.get(key[:2])
+        if stream is not None:
+            stream.discard(key)
+            if not stream:
+                del self.by_stream[key[:2]]
+
+    def on_close(self, event: BarEvent) -> List[Tuple[str, List[WebSocket]]]:
+        """Advance every state of the event's stream; return ``(frame, sockets)`` to queue."""
+        out: List[Tuple[str, List[WebSocket]]] = []
+        for key in self.by_stream.get((event.symbol, event.tf), ()):
+            entry = self.entries[key]
+            if not entry.ready or not entry.subscribers:
+                continue
+            bar = {"time": event.start_ms, "high": event.h, "low": event.l, "close": event.c}
+            if not entry.state.update([bar]):
+                continue  # repeated close of a bar already counted
+            self.stats["updates"] += 1
+            if len(entry.state) > 2 * settings.WS_INDICATOR_MAX_BARS:
+                entry.state.trim(settings.WS_INDICATOR_MAX_BARS)
+            frame = entry.point()
+            if frame is not None:
+                out.append((frame, list(entry.subscribers)))
+        return out
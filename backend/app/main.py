@@ -1,128 +1,25 @@
-import asyncio
 import json
-import os
-import uuid
-from datetime import datetime, timezone, timedelta
-from typing import Dict, Set, Tuple
 
 import uvicorn
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response
 from fastapi.middleware.cors import CORSMiddleware
-from zoneinfo import ZoneInfo
 
 from .api_ohlc import router as ohlc_router
+from .broker import make_broker
+from .clients import forexfactory
 from .config import OHLC_DB_URL  # noqa: F401 (import ensures env validation)
-from .providers.alpaca_ws import AlpacaBarsClient
+from .core.settings import settings
+from .db_timescale import fetch_latest
+from .feeds import close_feeds, start_feeds
+from .hub import Hub
+from .metrics import CONTENT_TYPE, REGISTRY
 from .routers import calendar as calendar_router
+from .routers import indicators as indicators_router
+from .sessions import TF_STEP_SEC, align_bucket_start, nyse_open_close  # noqa: F401
 
-NY = ZoneInfo("America/New_York")
-
-TF_STEP_SEC = {
-    "1m": 60,
-    "5m": 300,
-    "15m": 900,
-    "1h": 3600,
-    "4h": 14400,
-    "1d": 86400,
-}
-
-
-def nyse_open_close(dt_utc: datetime) -> Tuple[datetime, datetime]:
-    """Return current NYSE regular session (UTC) for given UTC timestamp."""
-    et = dt_utc.astimezone(NY)
-    d = et.date()
-    open_et = datetime(d.year, d.month, d.day, 9, 30, tzinfo=NY)
-    close_et = datetime(d.year, d.month, d.day, 16, 0, tzinfo=NY)
-    return open_et.astimezone(timezone.utc), close_et.astimezone(timezone.utc)
-
-
-def align_bucket_start(ts_utc: datetime, tf: str) -> datetime:
-    """Align to NYSE anchor (intraday) or ET midnight for daily bars."""
-    step = TF_STEP_SEC[tf]
-    if tf == "1d":
-        et_midnight = ts_utc.astimezone(NY).replace(
-            hour=0,
-            minute=0,
-            second=0,
-            microsecond=0,
-        )
-        epoch = et_midnight.astimezone(timezone.utc)
-    else:
-        open_utc, _ = nyse_open_close(ts_utc)
-        # number of seconds since today's open.
-        # if before open, use previous business day open
-        if ts_utc < open_utc:
-            prev = ts_utc - timedelta(days=1)
-            open_utc, _ = nyse_open_close(prev)
-        delta = int((ts_utc - open_utc).total_seconds())
-        buckets = max(0, delta // step)
-        epoch = open_utc + timedelta(seconds=buckets * step)
-    return epoch
-
-# --- Subscription manager ---
-
-
-class Hub:
-    def __init__(self):
-        self.clients: Dict[WebSocket, str] = {}
-        # (symbol, timeframe) -> sockets
-        self.subs: Dict[Tuple[str, str], Set[WebSocket]] = {}
-        self.session_id = str(uuid.uuid4())
-
-    async def connect(self, ws: WebSocket):
-        await ws.accept()
-        self.clients[ws] = self.session_id
-        await ws.send_json({"type": "hello", "sessionId": self.session_id})
-
-    def disconnect(self, ws: WebSocket):
-        self.clients.pop(ws, None)
-        for key in list(self.subs.keys()):
-            self.subs[key].discard(ws)
-            if not self.subs[key]:
-                self.subs.pop(key, None)
-
-    def subscribe(self, ws: WebSocket, symbol: str, tf: str):
-        key = (symbol, tf)
-        self.subs.setdefault(key, set()).add(ws)
-
-    def unsubscribe(self, ws: WebSocket, _id: str):
-        # client holds its id; remove ws from all sets for simplicity
-        for key in list(self.subs.keys()):
-            self.subs[key].discard(ws)
-            if not self.subs[key]:
-                self.subs.pop(key, None)
-
-    async def publish_tick(self, symbol: str, tf: str, tick: dict):
-        # tick = { "ts": epoch_ms, "o","h","l","c","v" } (raw or partial)
-        ts = datetime.fromtimestamp(tick["ts"] / 1000, tz=timezone.utc)
-        tstart = align_bucket_start(ts, tf)
-        # we consider barClose when tick ts exceeds bucket start + step
-        step = TF_STEP_SEC[tf]
-        next_start = tstart + timedelta(seconds=step)
-        bar_close = ts >= next_start
-
-        payload = {
-            "type": "bar",
-            "sessionId": self.session_id,
-            "symbol": symbol,
-            "tf": tf,
-            "tsStart": int(tstart.timestamp() * 1000),
-            "o": float(tick["o"]),
-            "h": float(tick["h"]),
-            "l": float(tick["l"]),
-            "c": float(tick["c"]),
-            "v": int(tick.get("v", 0)),
-            "barClose": bool(bar_close),
-        }
-        sockets = self.subs.get((symbol, tf), set())
-        for ws in list(sockets):
-            try:
-                await ws.send_text(json.dumps(payload))
-            except WebSocketDisconnect:
-                self.disconnect(ws)
-
-
-hub = Hub()
+hub = Hub(broker=make_broker(), history_loader=fetch_latest)
+REGISTRY.register_collector(hub.collect_metrics)
 
 
 app = FastAPI()
@@ -135,65 +32,121 @@ app.add_middleware(
 )
 app.include_router(ohlc_router)
 app.include_router(calendar_router.router)
+app.include_router(indicators_router.router)
+
+
+@app.get("/ws/stats")
+async def ws_stats():
+    return hub.snapshot_stats()
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
 
 
 @app.websocket("/ws")
 async def ws_endpoint(ws: WebSocket):
-    await hub.connect(ws)
+    await hub.connect(ws, ws.query_params.get("protocol"))
     try:
         while True:
             msg = await ws.receive_text()
             data = json.loads(msg)
             t = data.get("type")
-            if t == "subscribe":
-                hub.subscribe(ws, data["symbol"], data["tf"])
+            if t == "hello":
+                try:
+                    protocol = hub.set_protocol(ws, data.get("protocol"))
+                except ValueError as exc:
+                    hub.send_json(ws, {"type": "error", "message": str(exc)})
+                    continue
+                hub.send_json(ws, {"type": "protocol", "protocol": protocol})
+            elif t == "subscribe" and data.get("channel") == "calendar":
+                try:
+                    cal = hub.subscribe_calendar(
+                        ws, data.get("id"), data.get("countries"), data.get("minImpact")
+                    )
+                except (TypeError, ValueError) as exc:
+                    hub.send_json(ws, {"type": "error", "id": data.get("id"), "message": str(exc)})
+                    continue
+                hub.send_json(
+                    ws,
+                    {
+                        "type": "subscribed",
+                        "id": cal.id,
+                        "channel": "calendar",
+                        "countries": sorted(cal.countries) if cal.countries else None,
+                        "minImpact": cal.min_impact,
+                    },
+                )
+            elif t == "subscribe":
+                try:
+                    batch_ms = hub.parse_batch(data["batch"]) if "batch" in data else None
+                    sub, catch_up = await hub.subscribe_stream(
+                        ws,
+                        data.get("symbols") or data.get("symbol") or [],
+                        data.get("tf", ""),
+                        data.get("id"),
+                        max_rate=data.get("maxRate"),
+                        snapshot=data.get("snapshot") or 0,
+                        resume=data.get("resume"),
+                        session_id=data.get("sessionId"),
+                        indicator=data.get("indicator"),
+                    )
+                except (TypeError, ValueError) as exc:
+                    hub.send_json(ws, {"type": "error", "id": data.get("id"), "message": str(exc)})
+                    continue
+                if batch_ms is not None:
+                    hub.set_batch(ws, batch_ms)
+                hub.send_json(
+                    ws,
+                    {
+                        "type": "subscribed",
+                        "id": sub.id,
+                        "symbols": sub.symbols,
+                        "tf": sub.tf,
+                        "catchUp": catch_up,
+                        **({"batchMs": batch_ms} if batch_ms is not None else {}),
+                    },
+                )
             elif t == "unsubscribe":
-                hub.unsubscribe(ws, data.get("id", ""))
+                sub_id = data.get("id", "")
+                ok = hub.unsubscribe_calendar(ws, sub_id)
+                ok = hub.unsubscribe(ws, sub_id) is not None or ok
+                hub.send_json(ws, {"type": "unsubscribed", "id": sub_id, "ok": ok})
     except WebSocketDisconnect:
         hub.disconnect(ws)
 
-# --- Demo publisher (replace with your market stream) ---
-
-
-async def demo_feed():
-    import random
-    symbol, tf = "AAPL", "1m"
-    c = 270.0
-    while True:
-        now_ms = int(datetime.now(tz=timezone.utc).timestamp() * 1000)
-        o = c
-        h = c + random.uniform(0, 0.4)
-        low = c - random.uniform(0, 0.4)
-        c = low + (h - low) * random.random()
-        v = random.randint(100, 5000)
-        await hub.publish_tick(
-            symbol,
-            tf,
-            {
-                "ts": now_ms,
-                "o": o,
-                "h": h,
-                "l": low,
-                "c": c,
-                "v": v,
-            },
-        )
-        await asyncio.sleep(1.0)
+
+def start_calendar_push() -> None:
+    """Feed ``/ws`` calendar subscribers from the shared sync, starting it if needed."""
+    sync = calendar_router.start_index_sync(push=True)
+    if sync is not None and hub.publish_calendar not in sync.listeners:
+        sync.add_listener(hub.publish_calendar)
 
 
 @app.on_event("startup")
-async def start_demo():
-    if os.getenv("ENABLE_DEMO_FEED", "false").lower() in {"1", "true", "yes"}:
-        asyncio.create_task(demo_feed())
+async def start_feeds_and_broker():
+    await forexfactory.open_client()
+    calendar_router.start_index_sync()
+    if settings.CALENDAR_PUSH:
+        hub.calendar_demand = start_calendar_push
+    await hub.start()
+    if settings.HUB_RUN_FEEDS:
+        start_feeds(hub)
+
 
-    alpaca_key = os.getenv("ALPACA_KEY_ID")
-    alpaca_secret = os.getenv("ALPACA_SECRET_KEY")
-    if alpaca_key and alpaca_secret:
-        symbols = os.getenv("LIVE_SYMBOLS", "AAPL").split(",")
-        timeframe = os.getenv("LIVE_TF", "1m")
-        client = AlpacaBarsClient(hub, symbols, timeframe=timeframe)
-        asyncio.create_task(client.run())
+@app.on_event("shutdown")
+async def stop_hub():
+    await hub.close()
+    await close_feeds()
+    await calendar_router.stop_index_sync()
+    await forexfactory.close_client()
 
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8001,
+        ws_per_message_deflate=settings.WS_PER_MESSAGE_DEFLATE,
+    )
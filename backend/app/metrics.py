@@ -0,0 +1,250 @@
+"""Dependency-free counters, gauges and histograms rendered in Prometheus text format.
+
+Updates are plain attribute/list arithmetic on the event loop thread (no
+locks, no label lookups on the hot path: label children are resolved once
+with :meth:`labels` and kept by the caller), so the instrumentation can stay
+on in production.
+"""
+
+from __future__ import annotations
+
+import math
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+SIZE_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+Labels = Tuple[Tuple[str, str], ...]
+# A collector returns ``(name, type, help, [(labels, value), ...])`` families at scrape time.
+Family = Tuple[str, str, str, List[Tuple[Labels, float]]]
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+class _Metric(ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Labels, "_Metric"] = {}
+
+    def labels(self, *values: str) -> "_Metric":
+        key = tuple(zip(self.labelnames, (str(v) for v in values)))
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._child()
+        return child
+
+    @abstractmethod
+    def _child(self) -> "_Metric":
+        """A fresh unlabelled metric of the same kind, for one label set."""
+
+    def _series(self) -> Iterable[Tuple[Labels, "_Metric"]]:
+        if self.labelnames:
+            return self._children.items()
+        return [((), self)]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for labels, metric in self._series():
+            lines.extend(metric._samples(self.name, labels))
+        return lines
+
+    @abstractmethod
+    def _samples(self, name: str, labels: Labels) -> List[str]:
+        """Exposition lines of this series."""
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self.value = 0.0
+
+    def _child(self) -> "Counter":
+        return Counter(self.name, self.help)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def _samples(self, name: str, labels: Labels) -> List[str]:
+        return [f"{name}_total{_labels(labels)} {_fmt(self.value)}"]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self.value = 0.0
+
+    def _child(self) -> "Gauge":
+        return Gauge(self.name, self.help)
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def _samples(self, name: str, labels: Labels) -> List[str]:
+        return [f"{name}{_labels(labels)} {_fmt(self.value)}"]
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; ``observe`` is one bisect and two additions."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def _child(self) -> "Histogram":
+        return Histogram(self.name, self.help, buckets=self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def _samples(self, name: str, labels: Labels) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(labels, ('le', _fmt(bound)))} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {_fmt(self.sum)}")
+        lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: Dict[str, _Metric] = {}
+        self.collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def _add(self, metric: _Metric) -> _Metric:
+        existing = self.metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))  # type: ignore[return-value]
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labelnames))  # type: ignore[return-value]
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))  # type: ignore[return-value]
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]) -> None:
+        """Add a callback that reports values (e.g. queue depths) only at scrape time."""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            for name, kind, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                suffix = "_total" if kind == "counter" else ""
+                for labels, value in samples:
+                    lines.append(f"{name}{suffix}{_labels(labels)} {_fmt(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+bar_latency = REGISTRY.histogram(
+    "hub_bar_latency_seconds",
+    "Bar pipeline latency by stage (upstream event time -> received -> encoded -> sent).",
+    ["stage"],
+)
+LATENCY_UPSTREAM_TO_RECEIVED = bar_latency.labels("upstream_to_received")
+LATENCY_RECEIVED_TO_ENCODED = bar_latency.labels("received_to_encoded")
+LATENCY_ENCODED_TO_SENT = bar_latency.labels("encoded_to_sent")
+LATENCY_UPSTREAM_TO_SENT = bar_latency.labels("upstream_to_sent")
+
+fanout_size = REGISTRY.histogram(
+    "hub_fanout_size",
+    "Local subscriber connections per fanned-out bar event.",
+    buckets=SIZE_BUCKETS,
+)
+
+feed_reconnects = REGISTRY.counter(
+    "hub_feed_reconnects",
+    "Upstream market-data feed reconnect attempts.",
+    ["feed"],
+)
+
+writer_rows = REGISTRY.counter(
+    "bar_writer_rows",
+    "Live bars handled by the ohlcv write-behind writer, by outcome.",
+    ["outcome"],
+)
+writer_flushes = REGISTRY.counter(
+    "bar_writer_flushes",
+    "ohlcv write-behind flush batches, by outcome.",
+    ["outcome"],
+)
+writer_flush_seconds = REGISTRY.histogram(
+    "bar_writer_flush_seconds",
+    "Time to COPY and upsert one write-behind batch.",
+)
+
+upstream_latency = REGISTRY.histogram(
+    "upstream_request_seconds",
+    "Upstream HTTP request latency per attempt, by upstream and outcome.",
+    ["upstream", "outcome"],
+)
@@ -0,0 +1,308 @@
+"""Write-behind persistence of closed live 1m bars into the ``ohlcv`` hypertable.
+
+:class:`BarWriter` is a hub bar sink: closed base-timeframe bars are buffered
+in memory (keyed by ``(symbol, start)``, so corrections overwrite rather
+than duplicate) and flushed when ``batch_rows`` accumulate or every
+``flush_interval_s``. A flush COPYs the batch into a per-connection temp
+staging table and upserts it into ``ohlcv`` with one ``INSERT ... SELECT
+... ON CONFLICT``, in one transaction.
+
+While the database is unavailable, rows stay in the buffer (bounded by
+``spool_rows``, oldest dropped first) and flushes are retried with jittered
+exponential backoff. Each written row widens a dirty ``[start, end)`` range
+per continuous aggregate, and :meth:`BarWriter.refresh_dirty` refreshes only
+those ranges instead of whole policy windows.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from . import metrics
+from .core.settings import settings
+from .rollup import BASE_TF, BarEvent
+
+logger = logging.getLogger(__name__)
+
+# Bucket width of every continuous aggregate over ``ohlcv`` (see db/timescale-migrations).
+CA_BUCKET_MS: Dict[str, int] = {
+    "ca_1m": 60_000,
+    "ca_5m": 5 * 60_000,
+    "ca_15m": 15 * 60_000,
+    "ca_1h": 3_600_000,
+    "ca_4h": 4 * 3_600_000,
+    "ca_1d": 86_400_000,
+}
+
+COLUMNS = ("symbol", "ts", "open", "high", "low", "close", "volume")
+
+STAGING_DDL = """
+    CREATE TEMP TABLE IF NOT EXISTS ohlcv_staging
+      (LIKE ohlcv INCLUDING DEFAULTS) ON COMMIT DELETE ROWS
+"""
+
+UPSERT_SQL = """
+    INSERT INTO ohlcv (symbol, ts, open, high, low, close, volume)
+    SELECT symbol, ts, open, high, low, close, volume FROM ohlcv_staging
+    ON CONFLICT (symbol, ts) DO UPDATE SET
+      open = EXCLUDED.open,
+      high = EXCLUDED.high,
+      low = EXCLUDED.low,
+      close = EXCLUDED.close,
+      volume = EXCLUDED.volume
+"""
+
+REFRESH_SQL = "CALL refresh_continuous_aggregate($1::regclass, $2, $3);"
+
+Row = Tuple[str, int, float, float, float, float, int]
+PoolFactory = Callable[[], Awaitable[Any]]
+
+
+def _ts(ms: int) -> datetime:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+
+
+class DirtyRanges:
+    """Smallest bucket-aligned ``[start_ms, end_ms)`` per aggregate covering written bars."""
+
+    def __init__(self, buckets: Dict[str, int] = CA_BUCKET_MS) -> None:
+        self.buckets = buckets
+        self.ranges: Dict[str, Tuple[int, int]] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.ranges)
+
+    def add(self, start_ms: int, end_ms: int) -> None:
+        for ca, width in self.buckets.items():
+            lo = start_ms // width * width
+            hi = -(-end_ms // width) * width
+            current = self.ranges.get(ca)
+            if current is not None:
+                lo, hi = min(lo, current[0]), max(hi, current[1])
+            self.ranges[ca] = (lo, hi)
+
+    def take(self) -> Dict[str, Tuple[int, int]]:
+        ranges, self.ranges = self.ranges, {}
+        return ranges
+
+    def restore(self, ranges: Dict[str, Tuple[int, int]]) -> None:
+        for ca, (lo, hi) in ranges.items():
+            current = self.ranges.get(ca)
+            if current is not None:
+                lo, hi = min(lo, current[0]), max(hi, current[1])
+            self.ranges[ca] = (lo, hi)
+
+
+class BarWriter:
+    """Buffer closed 1m bars from the hub and upsert them into ``ohlcv`` in batches.
+
+    ``pool_factory`` returns an asyncpg-style pool (``db_timescale.get_pool``).
+    Register :meth:`offer` with ``Hub.add_bar_sink`` and run :meth:`run` as a task.
+    """
+
+    def __init__(
+        self,
+        pool_factory: PoolFactory,
+        batch_rows: Optional[int] = None,
+        flush_interval_s: Optional[float] = None,
+        spool_rows: Optional[int] = None,
+        refresh_interval_s: Optional[float] = None,
+        retry_max_s: Optional[float] = None,
+    ) -> None:
+        self.pool_factory = pool_factory
+        self.batch_rows = batch_rows or settings.PERSIST_BATCH_ROWS
+        self.flush_interval_s = (
+            flush_interval_s if flush_interval_s is not None else settings.PERSIST_FLUSH_MS / 1000
+        )
+        self.spool_rows = max(self.batch_rows, spool_rows or settings.PERSIST_SPOOL_ROWS)
+        self.refresh_interval_s = (
+            refresh_interval_s if refresh_interval_s is not None else settings.PERSIST_REFRESH_S
+        )
+        self.retry_max_s = retry_max_s if retry_max_s is not None else settings.PERSIST_RETRY_MAX_S
+        self.pending: "OrderedDict[Tuple[str, int], Row]" = OrderedDict()
+        self.dirty = DirtyRanges()
+        # False after a failed flush until the next one succeeds; producers are
+        # only held back (see ``wait_for_room``) while the database keeps up.
+        self.healthy = True
+        self.failures = 0
+        self._wake = asyncio.Event()
+        self._room = asyncio.Event()
+        self._room.set()
+        self._flush_lock = asyncio.Lock()
+        self.stats: Dict[str, int] = {
+            "offered": 0,
+            "written": 0,
+            "dropped": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    # -- producer side -------------------------------------------------------
+
+    def offer(self, event: BarEvent) -> None:
+        """Hub bar sink: keep closed base-timeframe bars, newest version per bar."""
+        if not event.closed or event.tf != BASE_TF:
+            return
+        key = (event.symbol, event.start_ms)
+        row = (
+            event.symbol,
+            event.start_ms,
+            event.o,
+            event.h,
+            event.l,
+            event.c,
+            int(event.v),
+        )
+        self.pending[key] = row
+        self.pending.move_to_end(key)
+        self.stats["offered"] += 1
+        self._trim()
+        if len(self.pending) >= self.batch_rows:
+            self._room.clear()
+            self._wake.set()
+
+    def _trim(self) -> None:
+        while len(self.pending) > self.spool_rows:
+            self.pending.popitem(last=False)
+            self.stats["dropped"] += 1
+            metrics.writer_rows.labels("dropped").inc()
+
+    async def wait_for_room(self, timeout: float = 1.0) -> None:
+        """Backpressure for feeds: wait (up to ``timeout``) while a full batch is pending.
+
+        Never blocks while the database is failing; the bounded spool absorbs
+        (and eventually drops) bars then, so live fan-out keeps flowing.
+        """
+        if self._room.is_set() or not self.healthy:
+            return
+        try:
+            await asyncio.wait_for(self._room.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    # -- flushing ------------------------------------------------------------
+
+    async def run(self) -> None:
+        last_refresh = time.monotonic()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.flush_interval_s)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                try:
+                    await self.flush()
+                except Exception as exc:
+                    delay = min(self.retry_max_s, 0.5 * 2 ** min(self.failures, 10))
+                    delay *= random.uniform(0.5, 1.0)
+                    logger.warning(
+                        "Bar flush failed (%d pending, retry in %.1fs): %s",
+                        len(self.pending),
+                        delay,
+                        exc,
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+                if self.dirty and time.monotonic() - last_refresh >= self.refresh_interval_s:
+                    last_refresh = time.monotonic()
+                    try:
+                        await self.refresh_dirty()
+                    except Exception as exc:
+                        logger.warning("Continuous aggregate refresh failed: %s", exc)
+        finally:
+            if self.pending:
+                try:
+                    await asyncio.wait_for(self.flush(), timeout=5.0)
+                except Exception as exc:
+                    logger.warning("Final bar flush lost %d rows: %s", len(self.pending), exc)
+
+    async def flush(self) -> int:
+        """Write everything pending, ``batch_rows`` at a time; returns the rows written.
+
+        A failing batch is put back (behind any newer version of the same bar)
+        and the error re-raised for the caller to back off.
+        """
+        written = 0
+        async with self._flush_lock:
+            while self.pending:
+                batch: List[Tuple[Tuple[str, int], Row]] = []
+                while self.pending and len(batch) < self.batch_rows:
+                    batch.append(self.pending.popitem(last=False))
+                started = time.monotonic()
+                try:
+                    await self._write([row for _, row in batch])
+                except Exception:
+                    self._requeue(batch)
+                    self.healthy = False
+                    self.failures += 1
+                    self.stats["flush_errors"] += 1
+                    metrics.writer_flushes.labels("error").inc()
+                    self._room.set()
+                    raise
+                metrics.writer_flush_seconds.observe(time.monotonic() - started)
+                metrics.writer_flushes.labels("ok").inc()
+                metrics.writer_rows.labels("written").inc(len(batch))
+                self.healthy = True
+                self.failures = 0
+                self.stats["flushes"] += 1
+                self.stats["written"] += len(batch)
+                written += len(batch)
+                starts = [row[1] for _, row in batch]
+                self.dirty.add(min(starts), max(starts) + 60_000)
+            self._room.set()
+        return written
+
+    def _requeue(self, batch: List[Tuple[Tuple[str, int], Row]]) -> None:
+        # Older than anything offered meanwhile: goes back to the front, and a
+        # newer version of the same bar wins.
+        for key, row in reversed(batch):
+            if key not in self.pending:
+                self.pending[key] = row
+                self.pending.move_to_end(key, last=False)
+        self._trim()
+
+    async def _write(self, rows: List[Row]) -> None:
+        records = [(s, _ts(ms), o, h, low, c, v) for s, ms, o, h, low, c, v in rows]
+        pool = await self.pool_factory()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(STAGING_DDL)
+                await conn.copy_records_to_table(
+                    "ohlcv_staging", records=records, columns=list(COLUMNS)
+                )
+                await conn.execute(UPSERT_SQL)
+
+    async def refresh_dirty(self) -> int:
+        """Refresh each continuous aggregate over its dirty range only; returns the count."""
+        ranges = self.dirty.take()
+        if not ranges:
+            return 0
+        done = 0
+        try:
+            pool = await self.pool_factory()
+            async with pool.acquire() as conn:
+                # Finer aggregates first: they are the ones charts poll most.
+                for ca in sorted(ranges, key=lambda name: CA_BUCKET_MS[name]):
+                    lo, hi = ranges[ca]
+                    await conn.execute(REFRESH_SQL, ca, _ts(lo), _ts(hi))
+                    del ranges[ca]
+                    done += 1
+        except Exception:
+            self.dirty.restore(ranges)
+            self.stats["refresh_errors"] += 1
+            raise
+        finally:
+            self.stats["refreshes"] += done
+        return done
@@ -0,0 +1,134 @@
+"""Wire encodings for /ws bar frames: JSON (default), struct-packed binary and msgpack.
+
+Control messages (hello, subscribed, snapshot, errors, symbol dictionaries)
+are always JSON text frames; only bar frames change with the protocol.
+Binary and msgpack frames refer to symbols by a numeric id that the hub
+announces once per connection with a ``{"type": "symbols"}`` message, and to
+timeframes by their index in ``TIMEFRAMES`` (sent in ``hello``).
+"""
+
+from __future__ import annotations
+
+import json
+import struct
+from typing import Dict, List, Optional
+
+from .rollup import BarEvent
+from .sessions import TF_STEP_SEC
+
+try:  # optional dependency
+    import msgpack
+except ImportError:  # pragma: no cover - depends on the environment
+    msgpack = None
+
+JSON = "json"
+BINARY = "binary"
+MSGPACK = "msgpack"
+
+TIMEFRAMES: List[str] = list(TF_STEP_SEC)
+TF_IDS: Dict[str, int] = {tf: i for i, tf in enumerate(TIMEFRAMES)}
+
+FRAME_BAR = 1
+# kind, symbol id, tf id, seq, tsStart, o, h, l, c, v, flags (bit 0 = barClose): 63 bytes.
+BAR_STRUCT = struct.Struct("<BIBQqdddddB")
+
+
+def available() -> List[str]:
+    protocols = [JSON, BINARY]
+    if msgpack is not None:
+        protocols.append(MSGPACK)
+    return protocols
+
+
+def negotiate(requested: Optional[str]) -> str:
+    """Return ``requested`` if this server speaks it, else raise ``ValueError``."""
+    protocol = (requested or JSON).lower()
+    if protocol not in available():
+        raise ValueError(f"Unsupported protocol '{requested}'; choose from {available()}")
+    return protocol
+
+
+class SymbolTable:
+    """Hub-wide symbol -> id map, so a binary frame is encoded once for every client."""
+
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def id(self, symbol: str) -> int:
+        sid = self.ids.get(symbol)
+        if sid is None:
+            sid = self.ids[symbol] = len(self.ids) + 1
+        return sid
+
+
+def encode_json(event: BarEvent, seq: int, session_id: str) -> str:
+    return json.dumps(
+        {
+            "type": "bar",
+            "sessionId": session_id,
+            "symbol": event.symbol,
+            "tf": event.tf,
+            "seq": seq,
+            "tsStart": event.start_ms,
+            "o": event.o,
+            "h": event.h,
+            "l": event.l,
+            "c": event.c,
+            "v": int(event.v),
+            "barClose": event.closed,
+        }
+    )
+
+
+def encode_binary(event: BarEvent, seq: int, symbol_id: int) -> bytes:
+    return BAR_STRUCT.pack(
+        FRAME_BAR,
+        symbol_id,
+        TF_IDS[event.tf],
+        seq,
+        event.start_ms,
+        event.o,
+        event.h,
+        event.l,
+        event.c,
+        event.v,
+        int(event.closed),
+    )
+
+
+def encode_msgpack(event: BarEvent, seq: int, symbol_id: int) -> bytes:
+    return msgpack.packb(
+        [
+            FRAME_BAR,
+            symbol_id,
+            TF_IDS[event.tf],
+            seq,
+            event.start_ms,
+            event.o,
+            event.h,
+            event.l,
+            event.c,
+            event.v,
+            event.closed,
+        ]
+    )
+
+
+def decode_binary(data: bytes) -> Dict[str, object]:
+    """Inverse of :func:`encode_binary` (symbol left as its id); used by tests and tools."""
+    _, sid, tf_id, seq, ts, o, h, low, c, v, flags = BAR_STRUCT.unpack(data)
+    return {
+        "symbolId": sid,
+        "tf": TIMEFRAMES[tf_id],
+        "seq": seq,
+        "tsStart": ts,
+        "o": o,
+        "h": h,
+        "l": low,
+        "c": c,
+        "v": v,
+        "barClose": bool(flags & 1),
+    }
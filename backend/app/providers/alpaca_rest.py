@@ -0,0 +1,100 @@
+"""Alpaca Market Data REST bars, used to backfill what the stream missed."""
+
+from __future__ import annotations
+
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from .alpaca_ws import parse_timestamp_ms
+
+TIMEFRAMES = {
+    "1m": "1Min",
+    "5m": "5Min",
+    "10m": "10Min",
+    "15m": "15Min",
+    "1h": "1Hour",
+    "4h": "4Hour",
+    "1d": "1Day",
+}
+
+
+def new_client() -> httpx.AsyncClient:
+    """A keep-alive client for backfills, shared by every :class:`AlpacaHistory` of a process."""
+    return httpx.AsyncClient(
+        timeout=10.0,
+        limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+    )
+
+
+def _rfc3339(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class AlpacaHistory:
+    """``GapSource`` over ``GET /v2/stocks/{symbol}/bars``, following page tokens.
+
+    Pass a pooled ``client`` (see :func:`new_client`); without one every call
+    opens and closes its own connection.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        feed: Optional[str] = None,
+        client: Optional[httpx.AsyncClient] = None,
+    ) -> None:
+        self.base_url = (
+            base_url or os.getenv("ALPACA_DATA_URL", "https://data.alpaca.markets")
+        ).rstrip("/")
+        self.feed = feed or os.getenv("ALPACA_FEED", "sip")
+        self.headers = {
+            "APCA-API-KEY-ID": os.getenv("ALPACA_KEY_ID") or "",
+            "APCA-API-SECRET-KEY": os.getenv("ALPACA_SECRET_KEY") or "",
+        }
+        self.client = client
+
+    async def __call__(
+        self, symbol: str, tf: str, start_ms: int, end_ms: int
+    ) -> List[Dict[str, Any]]:
+        timeframe = TIMEFRAMES.get(tf)
+        if timeframe is None:
+            raise ValueError(f"Unsupported timeframe '{tf}'.")
+        params: Dict[str, Any] = {
+            "timeframe": timeframe,
+            "start": _rfc3339(start_ms),
+            # ``end`` is inclusive upstream; stop just before the resumed bar.
+            "end": _rfc3339(end_ms - 1000),
+            "limit": 10000,
+            "adjustment": "raw",
+            "feed": self.feed,
+        }
+        url = f"{self.base_url}/v2/stocks/{symbol}/bars"
+        client = self.client or httpx.AsyncClient(timeout=10.0)
+        rows: List[Dict[str, Any]] = []
+        try:
+            while True:
+                resp = await client.get(url, params=params, headers=self.headers)
+                resp.raise_for_status()
+                body = resp.json()
+                for bar in body.get("bars") or []:
+                    rows.append(
+                        {
+                            "time": parse_timestamp_ms(bar["t"]),
+                            "open": float(bar["o"]),
+                            "high": float(bar["h"]),
+                            "low": float(bar["l"]),
+                            "close": float(bar["c"]),
+                            "volume": int(bar.get("v", 0)),
+                        }
+                    )
+                token = body.get("next_page_token")
+                if not token:
+                    break
+                params["page_token"] = token
+        finally:
+            if self.client is None:
+                await client.aclose()
+        return rows
@@ -4,74 +4,335 @@ from __future__ import annotations
 
 import asyncio
 import json
+import logging
 import os
-from datetime import datetime, timezone
-from typing import Iterable, List
+import time
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 import websockets
 
+from ..gapfill import GapSource, GapTracker, backfill
+from ..hub import BarUpdate, TradeUpdate
+from ..metrics import feed_reconnects
+from ..sessions import TF_STEP_SEC
+from ..subscriptions import WILDCARD
 
-class AlpacaBarsClient:
-    """Connects to Alpaca's streaming API and publishes ticks into the hub."""
+try:  # optional dependency: several times faster than json on market data frames
+    import orjson
 
-    def __init__(self, hub, symbols: Iterable[str], timeframe: str = "1m") -> None:
+    _loads = orjson.loads
+except ImportError:  # pragma: no cover - depends on the environment
+    _loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+CHANNELS = ("bars", "trades", "quotes")
+
+
+@lru_cache(maxsize=64)
+def _day_ms(date: str) -> int:
+    """Epoch ms of ``YYYY-MM-DD`` 00:00 UTC (days-from-civil, no datetime objects)."""
+    y, m, d = int(date[0:4]), int(date[5:7]), int(date[8:10])
+    y -= m <= 2
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * (m + (-3 if m > 2 else 9)) + 2) // 5 + d - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return (era * 146097 + doe - 719468) * 86_400_000
+
+
+def parse_timestamp_ms(value: str) -> int:
+    """Epoch ms of an RFC 3339 timestamp such as ``2024-01-02T15:04:05.123456789Z``.
+
+    Integer slicing only; the date part is cached since a stream rarely spans
+    more than one day. Raises ``ValueError`` on malformed input.
+    """
+    if len(value) < 20 or value[10] not in "Tt ":
+        raise ValueError(f"bad timestamp {value!r}")
+    ms = (
+        _day_ms(value[:10])
+        + int(value[11:13]) * 3_600_000
+        + int(value[14:16]) * 60_000
+        + int(value[17:19]) * 1000
+    )
+    i = 19
+    if value[i] == ".":
+        j = i + 1
+        while j < len(value) and value[j].isdigit():
+            j += 1
+        ms += int((value[i + 1 : j] + "00")[:3])
+        i = j
+    tz = value[i:]
+    if tz in ("Z", "z"):
+        return ms
+    if len(tz) == 6 and tz[0] in "+-" and tz[3] == ":":
+        offset = int(tz[1:3]) * 3_600_000 + int(tz[4:6]) * 60_000
+        return ms - offset if tz[0] == "+" else ms + offset
+    raise ValueError(f"bad timestamp {value!r}")
+
+
+class AlpacaStreamClient:
+    """Connects to Alpaca's streaming API and publishes bars and trades into the hub.
+
+    Trades build the open minute between bars and Alpaca's final minute bar
+    then replaces that trade-built minute. Quotes only update :attr:`quotes`.
+
+    Upstream subscriptions follow hub demand: every local ``(symbol, tf)`` key
+    counts as one reference on its symbol (``"*"`` subscribes to everything),
+    on top of the always-on ``symbols``. Changes are debounced into one
+    subscribe/unsubscribe message, and a symbol that lost its last reference
+    stays subscribed for ``linger_s`` in case a client comes straight back.
+
+    With a ``history`` source, bars missed while reconnecting are fetched and
+    merged into the hub (see :mod:`..gapfill`) before live frames resume.
+    """
+
+    def __init__(
+        self,
+        hub,
+        symbols: Iterable[str] = (),
+        timeframe: str = "1m",
+        channels: Iterable[str] = ("bars", "trades"),
+        follow_demand: bool = True,
+        debounce_s: float = 0.25,
+        linger_s: float = 30.0,
+        history: Optional[GapSource] = None,
+        max_gap_bars: int = 24 * 60,
+        shard: Optional[str] = None,
+    ) -> None:
         self.hub = hub
+        # Set when an IngestSupervisor owns this connection; it assigns the
+        # symbols and routes hub demand itself.
+        self.shard = shard
         self.timeframe = timeframe
         self.symbols: List[str] = [s.strip().upper() for s in symbols if s.strip()]
+        self.channels = [c for c in CHANNELS if c in {ch.strip().lower() for ch in channels}]
         self.endpoint = os.getenv("ALPACA_WS", "wss://stream.data.alpaca.markets/v2/sip")
         self.key = os.getenv("ALPACA_KEY_ID") or ""
         self.secret = os.getenv("ALPACA_SECRET_KEY") or ""
+        self.debounce_s = debounce_s
+        self.linger_s = linger_s
+        self.history = history
+        self.gaps = GapTracker(timeframe, max_gap_bars)
 
-        if not self.symbols:
-            raise ValueError("AlpacaBarsClient requires at least one symbol")
+        if not self.symbols and not follow_demand and shard is None:
+            raise ValueError("AlpacaStreamClient requires symbols or follow_demand")
+        if not self.channels:
+            raise ValueError(f"AlpacaStreamClient needs at least one of {CHANNELS}")
         if not self.key or not self.secret:
             raise ValueError("ALPACA_KEY_ID/ALPACA_SECRET_KEY are required")
 
+        # symbol -> number of hub (symbol, tf) keys wanting it
+        self.refs: Dict[str, int] = {}
+        # symbol -> monotonic time its last reference went away
+        self.idle_since: Dict[str, float] = {}
+        self.active: Set[str] = set()
+        self.stats: Dict[str, int] = {
+            "frames": 0,
+            "messages": 0,
+            "subscribes": 0,
+            "unsubscribes": 0,
+            "backfilled": 0,
+            "reconnects": 0,
+        }
+        # Receive time minus upstream event time of the newest update in the last frame.
+        self.lag_ms = 0.0
+        # Latest (bid, ask, ts_ms) per symbol from the quotes channel.
+        self.quotes: Dict[str, Tuple[float, float, int]] = {}
+        self.connected = False
+        self._ws: Any = None
+        self._sync_task: Optional[asyncio.Task] = None
+        self._sync_lock = asyncio.Lock()
+        if follow_demand:
+            hub.add_demand_listener(self.on_demand)
+
+    # -- demand ------------------------------------------------------------
+
+    def on_demand(self, key: Tuple[str, str], added: bool) -> None:
+        symbol = key[0]
+        count = self.refs.get(symbol, 0) + (1 if added else -1)
+        if count > 0:
+            self.refs[symbol] = count
+            self.idle_since.pop(symbol, None)
+        else:
+            self.refs.pop(symbol, None)
+            self.idle_since[symbol] = time.monotonic()
+        self._schedule_sync(self.debounce_s)
+
+    def set_symbols(self, symbols: Iterable[str]) -> None:
+        """Replace the always-on symbols; the upstream change is debounced like demand."""
+        self.symbols = [s.strip().upper() for s in symbols if s.strip()]
+        self._schedule_sync(self.debounce_s)
+
+    def desired(self) -> Set[str]:
+        wanted = set(self.symbols) | set(self.refs)
+        now = time.monotonic()
+        wanted |= {s for s, t in self.idle_since.items() if now - t < self.linger_s}
+        if WILDCARD in wanted:
+            return {WILDCARD}
+        return wanted
+
+    def _schedule_sync(self, delay: float) -> None:
+        if self._sync_task is None or self._sync_task.done():
+            try:
+                self._sync_task = asyncio.get_running_loop().create_task(self._sync_later(delay))
+            except RuntimeError:  # no loop yet; the first connect subscribes everything
+                pass
+
+    async def _sync_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._sync_task = None
+        await self.sync()
+        if self.idle_since:
+            # Wake up again when the earliest lingering symbol expires.
+            now = time.monotonic()
+            expiry = min(self.idle_since.values()) + self.linger_s - now
+            self._schedule_sync(max(self.debounce_s, expiry))
+
+    async def sync(self) -> None:
+        """Send one subscribe/unsubscribe for the difference between desired and active."""
+        now = time.monotonic()
+        for symbol, since in list(self.idle_since.items()):
+            if now - since >= self.linger_s:
+                del self.idle_since[symbol]
+        async with self._sync_lock:
+            if self._ws is None:
+                return
+            wanted = self.desired()
+            added = sorted(wanted - self.active)
+            removed = sorted(self.active - wanted)
+            if removed:
+                await self._send("unsubscribe", removed)
+                self.stats["unsubscribes"] += 1
+                for symbol in removed:
+                    self.quotes.pop(symbol, None)
+            if added:
+                await self._send("subscribe", added)
+                self.stats["subscribes"] += 1
+            self.active = wanted
+
+    async def _send(self, action: str, symbols: List[str]) -> None:
+        payload: Dict[str, Any] = {"action": action}
+        for channel in self.channels:
+            payload[channel] = symbols
+        await self._ws.send(json.dumps(payload))
+
+    # -- stream --------------------------------------------------------------
+
     async def run(self) -> None:
         backoff = 1
+        reconnect = False
         while True:
             try:
-                async with websockets.connect(self.endpoint, ping_interval=20, ping_timeout=20) as ws:
+                async with websockets.connect(
+                    self.endpoint, ping_interval=20, ping_timeout=20
+                ) as ws:
                     await self._authenticate(ws)
-                    await self._subscribe(ws)
+                    self._ws = ws
+                    self.active = set()
+                    await self.sync()
+                    if reconnect:
+                        await self.backfill_gaps()
+                    reconnect = True
+                    self.connected = True
                     backoff = 1
                     async for raw in ws:
-                        await self._handle_message(raw)
+                        if self.handle_frame(raw):
+                            await self.hub.drain()
             except asyncio.CancelledError:
                 raise
-            except Exception:
+            except Exception as exc:
+                logger.warning("Alpaca stream error (%s): %s", self.shard or "main", exc)
+                feed_reconnects.labels("alpaca").inc()
+                self.stats["reconnects"] += 1
                 await asyncio.sleep(min(backoff, 30))
                 backoff *= 2
+            finally:
+                self._ws = None
+                self.connected = False
+
+    async def backfill_gaps(self, now_ms: Optional[int] = None) -> int:
+        """Merge the bars each subscribed symbol missed since its last one; returns the count.
+
+        Runs before the read loop resumes, so backfilled bars reach the hub
+        ahead of anything newer buffered on the socket.
+        """
+        if self.history is None:
+            return 0
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        symbols = None if WILDCARD in self.active else self.active
+        gaps = self.gaps.gaps(now_ms, symbols)
+        if not gaps:
+            return 0
+        merged = await backfill(self.hub, self.history, self.timeframe, gaps)
+        for gap in gaps:
+            if merged.get(gap.symbol):
+                self.gaps.seen(gap.symbol, gap.end_ms - self.gaps.step_ms)
+        total = sum(merged.values())
+        self.stats["backfilled"] += total
+        logger.info("Backfilled %d bars for %d symbols after reconnect", total, len(merged))
+        return total
 
     async def _authenticate(self, ws) -> None:
         await ws.send(json.dumps({"action": "auth", "key": self.key, "secret": self.secret}))
         await ws.recv()  # consume auth response
 
-    async def _subscribe(self, ws) -> None:
-        payload = {"action": "subscribe", "bars": self.symbols}
-        await ws.send(json.dumps(payload))
-
-    async def _handle_message(self, raw: str) -> None:
+    def handle_frame(self, raw: str | bytes) -> int:
+        """Decode one frame and hand all its updates to the hub at once; returns the count."""
+        received_s = time.time()
         try:
-            messages = json.loads(raw)
-        except json.JSONDecodeError:
-            return
+            messages = _loads(raw)
+        except ValueError:
+            return 0
+        if not isinstance(messages, list):
+            messages = [messages]
 
-        for msg in messages if isinstance(messages, list) else [messages]:
-            if msg.get("T") != "b":
-                continue
+        step_ms = TF_STEP_SEC.get(self.timeframe, 60) * 1000
+        updates: List[BarUpdate | TradeUpdate] = []
+        quotes = 0
+        newest = 0
+        for msg in messages:
+            kind = msg.get("T")
             try:
-                ts = datetime.fromisoformat(msg["t"].replace("Z", "+00:00"))
-            except (KeyError, ValueError):
+                if kind == "b" or kind == "u":  # bar, or a late correction of one
+                    ts = parse_timestamp_ms(msg["t"])
+                    self.gaps.seen(msg["S"], ts)
+                    tick = {
+                        "ts": ts,
+                        "o": msg["o"],
+                        "h": msg["h"],
+                        "l": msg["l"],
+                        "c": msg["c"],
+                        "v": msg.get("v", 0),
+                    }
+                    # Alpaca minute bars are emitted once the minute has closed, so the
+                    # upstream event time is the end of the bar.
+                    updates.append(BarUpdate(msg["S"], self.timeframe, tick, True, ts + step_ms))
+                    newest = max(newest, ts + step_ms)
+                elif kind == "t":
+                    ts = parse_timestamp_ms(msg["t"])
+                    self.gaps.seen(msg["S"], ts)
+                    updates.append(TradeUpdate(msg["S"], ts, msg["p"], msg.get("s", 0)))
+                    newest = max(newest, ts)
+                elif kind == "q":
+                    bid, ask = msg.get("bp") or 0, msg.get("ap") or 0
+                    if bid > 0 and ask > 0:
+                        # Kept out of the bars: a quote midpoint is not a traded price.
+                        ts = parse_timestamp_ms(msg["t"])
+                        self.quotes[msg["S"]] = (float(bid), float(ask), ts)
+                        quotes += 1
+                        newest = max(newest, ts)
+                elif kind == "error":
+                    logger.warning("Alpaca error %s: %s", msg.get("code"), msg.get("msg"))
+            except (KeyError, TypeError, ValueError):
                 continue
 
-            tick = {
-                "ts": int(ts.astimezone(timezone.utc).timestamp() * 1000),
-                "o": msg.get("o"),
-                "h": msg.get("h"),
-                "l": msg.get("l"),
-                "c": msg.get("c"),
-                "v": msg.get("v", 0),
-            }
-            symbol = msg.get("S") or self.symbols[0]
-            await self.hub.publish_tick(symbol, self.timeframe, tick)
+        self.stats["frames"] += 1
+        self.stats["messages"] += len(updates) + quotes
+        if newest:
+            self.lag_ms = received_s * 1000 - newest
+        if updates:
+            self.hub.publish_batch(updates, received_s=received_s)
+        return len(updates)
@@ -0,0 +1,179 @@
+"""Replay recorded or synthetic 1m bars into a Hub at a configurable speed-up.
+
+Used for load testing without Alpaca: ``synthetic_ticks`` random-walks any
+number of symbols with several intrabar updates per minute, and
+``load_recorded`` reads CSV/JSONL bar dumps (``symbol,time,open,high,low,
+close,volume``, the shape ``db_timescale.fetch_ohlc`` returns plus a symbol).
+:class:`ReplayFeed` paces either source by its simulated timestamps.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import csv
+import json
+import logging
+import time
+from itertools import count, groupby
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from .rollup import BASE_STEP_MS, BASE_TF
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayTick(NamedTuple):
+    """One update to publish: at simulated time ``at_ms``, ``tick`` for ``symbol``."""
+
+    at_ms: int
+    symbol: str
+    tick: Dict[str, Any]
+    final: bool
+
+
+def synthetic_symbols(n: int) -> List[str]:
+    """``n`` distinct ticker-like names (``S0000``, ``S0001``, ...)."""
+    width = max(4, len(str(max(0, n - 1))))
+    return [f"S{i:0{width}d}" for i in range(n)]
+
+
+def synthetic_ticks(
+    symbols: Sequence[str],
+    start_ms: Optional[int] = None,
+    minutes: Optional[int] = None,
+    updates_per_bar: int = 4,
+    seed: int = 0,
+    price: float = 100.0,
+) -> Iterator[ReplayTick]:
+    """Random-walk 1m bars for ``symbols``; every bar is revised ``updates_per_bar`` times.
+
+    Each minute emits ``updates_per_bar`` rounds over all symbols, the last one
+    ``final``. Runs forever when ``minutes`` is None. The walk is vectorized
+    per round, so thousands of symbols cost a few NumPy calls per round.
+    """
+    if not symbols:
+        return
+    rng = np.random.default_rng(seed)
+    updates = max(1, int(updates_per_bar))
+    if start_ms is None:
+        start_ms = int(time.time() * 1000)
+    start_ms = start_ms // BASE_STEP_MS * BASE_STEP_MS
+    n = len(symbols)
+    close = np.full(n, float(price))
+    minute_iter = count() if minutes is None else range(minutes)
+    for minute in minute_iter:
+        bar_ms = start_ms + minute * BASE_STEP_MS
+        o = close.copy()
+        h = close.copy()
+        low = close.copy()
+        v = np.zeros(n)
+        for u in range(updates):
+            close = np.maximum(0.01, close * (1 + rng.normal(0, 0.001, n)))
+            h = np.maximum(h, close)
+            low = np.minimum(low, close)
+            v += rng.integers(1, 500, n)
+            at_ms = bar_ms + (u + 1) * BASE_STEP_MS // updates
+            final = u == updates - 1
+            rows = zip(symbols, o.tolist(), h.tolist(), low.tolist(), close.tolist(), v.tolist())
+            for symbol, bo, bh, bl, bc, bv in rows:
+                tick = {"ts": bar_ms, "o": bo, "h": bh, "l": bl, "c": bc, "v": bv}
+                yield ReplayTick(at_ms, symbol, tick, final)
+
+
+def _tick_from_row(row: Dict[str, Any]) -> ReplayTick:
+    ts = int(float(row.get("time", row.get("ts"))))
+    if ts < 10**11:  # epoch seconds
+        ts *= 1000
+
+    def value(long: str, short: str) -> Optional[float]:
+        raw = row.get(long, row.get(short))
+        return None if raw is None or raw == "" else float(raw)
+
+    # Missing prices are filled so the bar stays valid (l <= o, c <= h).
+    o, h, low, c = value("open", "o"), value("high", "h"), value("low", "l"), value("close", "c")
+    c = c if c is not None else o if o is not None else 0.0
+    o = o if o is not None else c
+    tick = {
+        "ts": ts,
+        "o": o,
+        "h": h if h is not None else max(o, c),
+        "l": low if low is not None else min(o, c),
+        "c": c,
+        "v": value("volume", "v") or 0.0,
+    }
+    # A recorded row is a finished bar; it is "received" when its minute ends.
+    return ReplayTick(ts + BASE_STEP_MS, str(row["symbol"]).upper(), tick, True)
+
+
+def load_recorded(path: str | Path) -> List[ReplayTick]:
+    """Read 1m bars from ``.csv`` (with a header) or ``.jsonl``, ordered by time."""
+    path = Path(path)
+    with path.open(newline="") as fh:
+        if path.suffix.lower() in {".jsonl", ".ndjson"}:
+            rows: Iterable[Dict[str, Any]] = (json.loads(line) for line in fh if line.strip())
+        else:
+            rows = csv.DictReader(fh)
+        ticks = [_tick_from_row(row) for row in rows]
+    ticks.sort(key=lambda t: t.at_ms)
+    return ticks
+
+
+class ReplayFeed:
+    """Publish ``ticks`` into ``hub`` at ``speed`` times their simulated pace.
+
+    Ticks sharing a simulated timestamp are published as one burst (as a
+    real minute boundary would be). ``speed <= 0`` replays as fast as the
+    event loop allows, yielding between bursts so client senders keep up.
+    """
+
+    def __init__(self, hub, ticks: Iterable[ReplayTick], speed: float = 1.0) -> None:
+        self.hub = hub
+        self.ticks = ticks
+        self.speed = speed
+        self.stats: Dict[str, float] = {"ticks": 0, "bursts": 0, "lag_s": 0.0}
+
+    async def run(self) -> Dict[str, float]:
+        wall0 = time.monotonic()
+        sim0: Optional[int] = None
+        for at_ms, burst in groupby(self.ticks, key=lambda t: t.at_ms):
+            if sim0 is None:
+                sim0 = at_ms
+            if self.speed > 0:
+                due = wall0 + (at_ms - sim0) / 1000 / self.speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    # Behind schedule: the hub (or this process) cannot keep up.
+                    self.stats["lag_s"] = max(self.stats["lag_s"], -delay)
+                    await asyncio.sleep(0)
+            else:
+                await asyncio.sleep(0)
+            received = time.time()
+            for tick in burst:
+                await self.hub.publish_tick(
+                    tick.symbol, BASE_TF, tick.tick, final=tick.final, received_s=received
+                )
+                self.stats["ticks"] += 1
+            self.stats["bursts"] += 1
+            await self.hub.drain()
+        return self.stats
+
+
+async def replay_feed(
+    hub,
+    path: Optional[str] = None,
+    symbols: int = 1000,
+    speed: float = 60.0,
+    updates_per_bar: int = 4,
+) -> None:
+    """Feed task for ``start_feeds``: a recorded file if given, else endless synthetic bars."""
+    if path:
+        ticks: Iterable[ReplayTick] = load_recorded(path)
+    else:
+        ticks = synthetic_ticks(synthetic_symbols(symbols), updates_per_bar=updates_per_bar)
+    stats = await ReplayFeed(hub, ticks, speed=speed).run()
+    logger.info("Replay finished: %s", stats)
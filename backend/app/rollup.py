@@ -0,0 +1,199 @@
+"""Incremental multi-timeframe rollup of 1m bars / trades into session-anchored bars."""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from .sessions import TF_STEP_SEC, bucket_bounds_ms
+
+BASE_TF = "1m"
+BASE_STEP_MS = TF_STEP_SEC[BASE_TF] * 1000
+
+OHLCV = Tuple[float, float, float, float, float]
+
+
+def _merge(left: Optional[OHLCV], right: OHLCV) -> OHLCV:
+    if left is None:
+        return right
+    return (left[0], max(left[1], right[1]), min(left[2], right[2]), right[3], left[4] + right[4])
+
+
+@dataclass
+class BarEvent:
+    """One bar update (or close) for a ``(symbol, tf)`` produced by the rollup."""
+
+    symbol: str
+    tf: str
+    start_ms: int
+    o: float
+    h: float
+    l: float  # noqa: E741 - matches the wire format
+    c: float
+    v: float
+    closed: bool
+    # (upstream event time, received time) in epoch seconds, for latency metrics;
+    # upstream is 0.0 when the feed does not provide one.
+    timing: Optional[Tuple[float, float]] = field(default=None, compare=False, repr=False)
+    # Backfilled after a feed outage: subscribers get it in one ``gapfill`` frame.
+    gapfill: bool = field(default=False, compare=False, repr=False)
+
+
+class _Partial:
+    """Open bar for one ``(symbol, tf)``: folded minutes plus the most recent ones.
+
+    Minutes within ``window_ms`` of the newest stay separate, so a revised or
+    final 1m bar (same start) replaces its earlier trade-built contribution
+    without rescanning the bucket; older minutes are folded into ``base``.
+    """
+
+    __slots__ = ("start_ms", "end_ms", "base", "recent", "folded_through", "closed")
+
+    def __init__(self, start_ms: int, end_ms: int) -> None:
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.base: Optional[OHLCV] = None
+        # minute start -> (bar, final), ascending.
+        self.recent: Dict[int, Tuple[OHLCV, bool]] = {}
+        self.folded_through = -1
+        self.closed = False
+
+    @property
+    def empty(self) -> bool:
+        return self.base is None and not self.recent
+
+    def apply(self, minute_start: int, bar: OHLCV, final: bool, window_ms: int) -> bool:
+        if minute_start <= self.folded_through:
+            return False  # too late to replace a minute already folded in
+        current = self.recent.get(minute_start)
+        if current is not None and current[1] and not final:
+            return False  # trades never override a completed minute bar
+        newest = max(self.recent) if self.recent else -1
+        self.recent[minute_start] = (bar, final)
+        if minute_start < newest:
+            self.recent = dict(sorted(self.recent.items()))
+        newest = max(newest, minute_start)
+        while self.recent:
+            first = next(iter(self.recent))
+            if first > newest - window_ms:
+                break
+            self.base = _merge(self.base, self.recent.pop(first)[0])
+            self.folded_through = first
+        return True
+
+    def event(self, symbol: str, tf: str, closed: bool) -> BarEvent:
+        merged = self.base
+        for bar, _ in self.recent.values():
+            merged = _merge(merged, bar)
+        o, h, low, c, v = merged  # type: ignore[misc]
+        return BarEvent(symbol, tf, self.start_ms, o, h, low, c, v, closed)
+
+
+def bucket_bounds(ts_ms: int, tf: str) -> Tuple[int, int]:
+    """Return the session-anchored ``[start, end)`` bucket (epoch ms) containing ``ts_ms``.
+
+    The last intraday bucket of a session is cut short at the close.
+    """
+    return bucket_bounds_ms(ts_ms, tf)
+
+
+class BarRollup:
+    """Consumes 1m bars or trades once and maintains every timeframe's open bar.
+
+    Work per input is O(len(timeframes)); bucket bounds are memoised per
+    minute since every symbol shares them. A final 1m bar arriving after
+    trades of the next minute (Alpaca sends it a few seconds late) still
+    replaces its minute's trade-built contribution for ``revision_minutes``,
+    including in the bucket that just closed; that bucket's corrected bar is
+    emitted as a ``gapfill`` event, since subscribers have moved past it.
+    """
+
+    def __init__(
+        self, timeframes: Optional[Iterable[str]] = None, revision_minutes: int = 3
+    ) -> None:
+        self.timeframes: List[str] = list(timeframes or TF_STEP_SEC)
+        unknown = [tf for tf in self.timeframes if tf not in TF_STEP_SEC]
+        if unknown:
+            raise ValueError(f"Unsupported timeframes: {unknown}")
+        self.window_ms = max(1, revision_minutes) * BASE_STEP_MS
+        self.partials: Dict[Tuple[str, str], _Partial] = {}
+        # The bucket each partial replaced, kept for late final bars of its last minutes.
+        self.previous: Dict[Tuple[str, str], _Partial] = {}
+        self._trade_minute: Dict[str, Tuple[int, OHLCV]] = {}
+        self._bounds_minute = -1
+        self._bounds: Dict[str, Tuple[int, int]] = {}
+
+    def _bounds_for(self, minute_start: int) -> Dict[str, Tuple[int, int]]:
+        if minute_start != self._bounds_minute:
+            self._bounds = {tf: bucket_bounds(minute_start, tf) for tf in self.timeframes}
+            self._bounds_minute = minute_start
+        return self._bounds
+
+    def on_bar(self, symbol: str, tick: Mapping[str, float], final: bool = False) -> List[BarEvent]:
+        """Fold a 1m bar (``ts`` epoch ms, o/h/l/c/v) into every timeframe.
+
+        ``final`` marks a completed minute (e.g. an Alpaca minute bar): buckets
+        ending with that minute are closed straight away.
+        """
+        minute_start = int(tick["ts"]) // BASE_STEP_MS * BASE_STEP_MS
+        bar = (
+            float(tick["o"]),
+            float(tick["h"]),
+            float(tick["l"]),
+            float(tick["c"]),
+            float(tick.get("v", 0) or 0),
+        )
+        return self._apply(symbol, minute_start, bar, final)
+
+    def on_trade(self, symbol: str, ts_ms: int, price: float, size: float = 0) -> List[BarEvent]:
+        """Fold a single trade into the open minute and every timeframe."""
+        minute_start = int(ts_ms) // BASE_STEP_MS * BASE_STEP_MS
+        price = float(price)
+        current = self._trade_minute.get(symbol)
+        if current is None or current[0] != minute_start:
+            if current is not None and minute_start < current[0]:
+                return []
+            bar: OHLCV = (price, price, price, price, float(size))
+        else:
+            o, h, low, _, v = current[1]
+            bar = (o, max(h, price), min(low, price), price, v + float(size))
+        self._trade_minute[symbol] = (minute_start, bar)
+        return self._apply(symbol, minute_start, bar, final=False)
+
+    def flush(self, now_ms: int) -> List[BarEvent]:
+        """Close open bars whose bucket has ended (for symbols that went quiet)."""
+        events = []
+        for (symbol, tf), partial in self.partials.items():
+            if not partial.closed and not partial.empty and partial.end_ms <= now_ms:
+                partial.closed = True
+                events.append(partial.event(symbol, tf, closed=True))
+        return events
+
+    def _apply(self, symbol: str, minute_start: int, bar: OHLCV, final: bool) -> List[BarEvent]:
+        events: List[BarEvent] = []
+        minute_end = minute_start + BASE_STEP_MS
+        for tf, (start_ms, end_ms) in self._bounds_for(minute_start).items():
+            key = (symbol, tf)
+            partial = self.partials.get(key)
+            revision = False
+            if partial is None or partial.start_ms != start_ms:
+                previous = self.previous.get(key)
+                if previous is not None and previous.start_ms == start_ms:
+                    partial, revision = previous, True
+                elif partial is not None and start_ms < partial.start_ms:
+                    continue  # late data for a bucket already replaced
+                else:
+                    if partial is not None:
+                        if not partial.closed and not partial.empty:
+                            events.append(partial.event(symbol, tf, closed=True))
+                        partial.closed = True
+                        self.previous[key] = partial
+                    partial = self.partials[key] = _Partial(start_ms, end_ms)
+            if not partial.apply(minute_start, bar, final, self.window_ms):
+                continue
+            closed = partial.closed or (final and minute_end >= partial.end_ms)
+            partial.closed = closed
+            event = partial.event(symbol, tf, closed=closed)
+            event.gapfill = revision
+            events.append(event)
+        return events
@@ -2,24 +2,67 @@
 
 from __future__ import annotations
 
-import hashlib
+import asyncio
+import functools
 import json
 import logging
+import time
+import uuid
+import zlib
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, List, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
 import redis.asyncio as aioredis
 from fastapi import APIRouter, HTTPException, Query
 
+from ..calendar_index import CalendarSync, EventIndex
 from ..clients.forexfactory import fetch_calendar
 from ..core.settings import settings
+from ..metrics import REGISTRY
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/v1", tags=["calendar"])
 
 _redis_client: Optional[aioredis.Redis] = None
-_last_good_cache: Dict[str, List[Dict[str, Any]]] = {}
+# Upstream loads in progress per partition run; concurrent misses await the same one.
+_inflight: Dict[str, "asyncio.Future[Any]"] = {}
+# Background revalidations of stale partitions, referenced until they finish.
+_revalidating: "set[asyncio.Future[Any]]" = set()
+# Rolling window kept in memory by ``start_index_sync``; queries inside it skip the caches.
+_index = EventIndex()
+_sync: Optional[CalendarSync] = None
+_sync_task: Optional["asyncio.Task[None]"] = None
+# Sync intervals the index may go without a successful sync and still answer.
+_INDEX_MAX_MISSED_SYNCS = 3
+
+calendar_coalesced = REGISTRY.counter(
+    "calendar_coalesced_requests",
+    "Calendar cache misses served by another request's upstream call.",
+    ["scope"],
+)
+_COALESCED_LOCAL = calendar_coalesced.labels("local")
+_COALESCED_REDIS = calendar_coalesced.labels("redis")
+
+calendar_cache = REGISTRY.counter(
+    "calendar_cache_lookups",
+    "Calendar lookups: index answers, local or redis hits, stale (refreshing) and misses.",
+    ["result"],
+)
+_CACHE_LOCAL = calendar_cache.labels("local")
+_CACHE_REDIS = calendar_cache.labels("redis")
+_CACHE_STALE = calendar_cache.labels("stale")
+_CACHE_MISS = calendar_cache.labels("miss")
+_CACHE_INDEX = calendar_cache.labels("index")
+
+# Compare-and-delete, so a lock that expired and was taken over is left alone.
+_UNLOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+  return redis.call("del", KEYS[1])
+end
+return 0
+"""
 
 
 class CircuitBreaker:
@@ -61,7 +104,56 @@ class CircuitBreaker:
         self.open_until = None
 
 
+class BoundedCache:
+    """In-process LRU of partition events with the wall time each was stored.
+
+    Entries outlive the Redis TTL (until evicted), so the circuit-breaker
+    fallback keeps a last good copy without growing without bound.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def entry(self, key: str) -> Optional[Tuple[float, List[Dict[str, Any]]]]:
+        found = self._entries.get(key)
+        if found is not None:
+            self._entries.move_to_end(key)
+        return found
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        found = self.entry(key)
+        return None if found is None else found[1]
+
+    def age(self, key: str) -> Optional[float]:
+        found = self._entries.get(key)
+        return None if found is None else time.time() - found[0]
+
+    def put(
+        self,
+        key: str,
+        value: List[Dict[str, Any]],
+        stored_at: Optional[float] = None,
+    ) -> None:
+        self._entries[key] = (time.time() if stored_at is None else stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
 _breaker = CircuitBreaker()
+_last_good_cache = BoundedCache(settings.CALENDAR_LOCAL_CACHE_SIZE)
+
+
+def _servable_s() -> int:
+    """How old an entry may be and still be served (stale ones trigger a refresh)."""
+    return settings.CALENDAR_CACHE_TTL_S + settings.CALENDAR_STALE_TTL_S
 
 
 async def _redis() -> Optional[aioredis.Redis]:
@@ -73,8 +165,7 @@ async def _redis() -> Optional[aioredis.Redis]:
     try:
         _redis_client = aioredis.from_url(
             settings.REDIS_URL,
-            encoding="utf-8",
-            decode_responses=True,
+            decode_responses=False,  # values are zlib-compressed JSON
         )
     except Exception as exc:  # pragma: no cover - network config issues
         logger.warning("Failed to connect to redis: %s", exc)
@@ -83,6 +174,11 @@ async def _redis() -> Optional[aioredis.Redis]:
 
 
 async def _cache_get(key: str) -> Optional[List[Dict[str, Any]]]:
+    """Fresh or stale-but-servable events for ``key``: in-process LRU first, then Redis."""
+    local = _last_good_cache.entry(key)
+    if local is not None and time.time() - local[0] < _servable_s():
+        _CACHE_LOCAL.inc()
+        return local[1]
     redis = await _redis()
     if not redis:
         return None
@@ -94,10 +190,12 @@ async def _cache_get(key: str) -> Optional[List[Dict[str, Any]]]:
     if cached is None:
         return None
     try:
-        data = json.loads(cached)
-    except json.JSONDecodeError:
+        envelope = json.loads(zlib.decompress(cached))
+        stored_at, data = float(envelope["t"]), envelope["v"]
+    except (zlib.error, ValueError, KeyError, TypeError):
         return None
-    _last_good_cache[key] = data
+    _CACHE_REDIS.inc()
+    _last_good_cache.put(key, data, stored_at)
     return data
 
 
@@ -105,71 +203,330 @@ async def _cache_set(key: str, value: List[Dict[str, Any]]) -> None:
     redis = await _redis()
     if not redis:
         return
+    envelope = json.dumps({"t": time.time(), "v": value}, separators=(",", ":"))
     try:
         await redis.set(
             key,
-            json.dumps(value),
-            ex=settings.CALENDAR_CACHE_TTL_S,
+            zlib.compress(envelope.encode("utf-8")),
+            ex=_servable_s(),
         )
     except Exception as exc:  # pragma: no cover - redis intermittent errors
         logger.warning("Redis SET failed: %s", exc)
 
 
-def _cache_key(
+Events = List[Dict[str, Any]]
+
+_DAY_S = 86_400
+_IMPACT_ORDER = {"low": 0, "medium": 1, "high": 2}
+
+
+def _partition_span_s() -> int:
+    return max(1, settings.CALENDAR_PARTITION_DAYS) * _DAY_S
+
+
+def _partition_offset_s() -> int:
+    # Weekly partitions start on Monday (the epoch was a Thursday).
+    return 3 * _DAY_S if settings.CALENDAR_PARTITION_DAYS == 7 else 0
+
+
+def _partition_of(ts: int) -> int:
+    return (ts + _partition_offset_s()) // _partition_span_s()
+
+
+def _partition_bounds(index: int) -> Tuple[int, int]:
+    """``[start, end)`` epoch seconds of partition ``index``."""
+    start = index * _partition_span_s() - _partition_offset_s()
+    return start, start + _partition_span_s()
+
+
+def _partition_key(index: int) -> str:
+    start, _ = _partition_bounds(index)
+    day = datetime.fromtimestamp(start, tz=timezone.utc).strftime("%Y-%m-%d")
+    return f"cal:ff:{settings.CALENDAR_PARTITION_DAYS}d:{day}"
+
+
+def _runs(indices: List[int]) -> List[List[int]]:
+    """Group sorted partition indices into contiguous runs (one upstream call each)."""
+    runs: List[List[int]] = []
+    for index in indices:
+        if runs and runs[-1][-1] == index - 1:
+            runs[-1].append(index)
+        else:
+            runs.append([index])
+    return runs
+
+
+def _countries(countries: Optional[str]) -> Optional[List[str]]:
+    return [c.strip().upper() for c in countries.split(",") if c.strip()] if countries else None
+
+
+def _filter(
+    events: Events,
     start: int,
     end: int,
     countries: Optional[str],
     min_impact: Optional[str],
-) -> str:
-    key_parts = ["ff", str(start), str(end), countries or "", min_impact or ""]
-    digest = hashlib.md5("|".join(key_parts).encode()).hexdigest()
-    return f"cal:{digest}"
+) -> Events:
+    listed = _countries(countries)
+    wanted = set(listed) if listed is not None else None
+    floor = _IMPACT_ORDER.get(min_impact or "", 0)
+    return [
+        e
+        for e in events
+        if start <= e["ts"] <= end
+        and (wanted is None or str(e.get("country") or "").upper() in wanted)
+        and (not min_impact or _IMPACT_ORDER.get(e.get("impact"), 0) >= floor)
+    ]
 
 
-@router.get("/calendar")
-async def calendar(
-    start: int = Query(..., description="epoch seconds UTC"),
-    end: int = Query(..., description="epoch seconds UTC"),
-    countries: Optional[str] = Query(
-        None,
-        description="CSV of country codes, e.g. US,EU,GB",
-    ),
-    min_impact: Optional[str] = Query(None, regex="^(low|medium|high)$"),
-):
-    cache_key = _cache_key(start, end, countries, min_impact)
+async def _single_flight(
+    key: str,
+    load: Callable[[], Awaitable[Any]],
+) -> Any:
+    """Run ``load`` once for all concurrent callers with the same ``key``.
+
+    The load runs as its own task, so a caller that disconnects does not
+    cancel it for the others.
+    """
+    pending = _inflight.get(key)
+    if pending is not None:
+        _COALESCED_LOCAL.inc()
+        return await asyncio.shield(pending)
+    task = asyncio.ensure_future(load())
+    _inflight[key] = task
+    task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+
+async def _with_redis_lock(
+    key: str,
+    load: Callable[[], Awaitable[Any]],
+    poll: Callable[[], Awaitable[Optional[Any]]],
+) -> Any:
+    """Cross-worker single flight: one worker loads while the others ``poll`` the cache.
+
+    Waiters give up after ``CALENDAR_LOCK_WAIT_S`` and load themselves; any
+    Redis error falls back to loading directly.
+    """
+    redis = await _redis()
+    if redis is None:
+        return await load()
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+    try:
+        acquired = await redis.set(
+            lock_key, token, nx=True, px=int(settings.CALENDAR_LOCK_TTL_S * 1000)
+        )
+    except Exception as exc:  # pragma: no cover - redis intermittent errors
+        logger.warning("Redis lock failed: %s", exc)
+        return await load()
+    if acquired:
+        try:
+            return await load()
+        finally:
+            try:
+                await redis.eval(_UNLOCK_SCRIPT, 1, lock_key, token)
+            except Exception as exc:  # pragma: no cover - redis intermittent errors
+                logger.warning("Redis unlock failed: %s", exc)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.CALENDAR_LOCK_WAIT_S
+    while loop.time() < deadline:
+        await asyncio.sleep(0.05)
+        ready = await poll()
+        if ready is not None:
+            _COALESCED_REDIS.inc()
+            return ready
+    return await load()
+
+
+async def _cached_partitions(indices: List[int]) -> Dict[int, Events]:
+    parts: Dict[int, Events] = {}
+    for index in indices:
+        cached = await _cache_get(_partition_key(index))
+        if cached is not None:
+            parts[index] = cached
+    return parts
+
+
+def _stale(indices: List[int]) -> List[int]:
+    """Partitions past ``CALENDAR_CACHE_TTL_S`` (served anyway while they refresh)."""
+    stale = []
+    for index in indices:
+        age = _last_good_cache.age(_partition_key(index))
+        if age is not None and age >= settings.CALENDAR_CACHE_TTL_S:
+            stale.append(index)
+    return stale
+
+
+def _run_flight(run: List[int]) -> Tuple[str, Callable[[], Awaitable[Dict[int, Events]]]]:
+    """Single-flight key and loader for a contiguous run of partitions."""
+    key = f"{_partition_key(run[0])}+{len(run)}"
+    load: Callable[[], Awaitable[Dict[int, Events]]] = functools.partial(_load_run, run)
+    if settings.CALENDAR_REDIS_LOCK:
+        load = functools.partial(_with_redis_lock, key, load, functools.partial(_poll_run, run))
+    return key, load
+
+
+def _revalidate(run: List[int]) -> None:
+    """Refresh ``run`` in the background; joins a load already in flight for it."""
+    task = asyncio.ensure_future(_single_flight(*_run_flight(run)))
+    _revalidating.add(task)
+
+    def done(fut: "asyncio.Future[Any]") -> None:
+        _revalidating.discard(fut)
+        if not fut.cancelled() and fut.exception() is not None:
+            logger.warning("Calendar revalidation failed: %s", fut.exception())
+
+    task.add_done_callback(done)
+
 
-    cached = await _cache_get(cache_key)
-    if cached is not None:
-        return cached
+async def _poll_run(run: List[int]) -> Optional[Dict[int, Events]]:
+    parts = await _cached_partitions(run)
+    return parts if len(parts) == len(run) else None
+
+
+async def _load_run(run: List[int]) -> Dict[int, Events]:
+    """Fetch a contiguous run of partitions upstream (unfiltered) and cache each one."""
+    fallback = {i: _last_good_cache.get(_partition_key(i)) for i in run}
+    have_fallback = all(events is not None for events in fallback.values())
 
     if not _breaker.allow_request():
-        fallback = _last_good_cache.get(cache_key)
-        if fallback is not None:
-            return fallback
+        if have_fallback:
+            return fallback  # type: ignore[return-value]
         raise HTTPException(
             status_code=503,
             detail="Calendar temporarily unavailable",
         )
 
+    run_start, _ = _partition_bounds(run[0])
+    _, run_end = _partition_bounds(run[-1])
     try:
-        result = await fetch_calendar(
-            start,
-            end,
-            countries.split(",") if countries else None,
-            min_impact,
-        )
+        result = await fetch_calendar(run_start, run_end - 1, None, None)
     except Exception as exc:
         _breaker.record_failure()
         logger.warning("Calendar upstream error: %s", exc)
-        fallback = _last_good_cache.get(cache_key)
-        if fallback is not None:
-            return fallback
+        if have_fallback:
+            return fallback  # type: ignore[return-value]
         raise HTTPException(
             status_code=502,
             detail="Calendar upstream error",
         )
 
     _breaker.record_success()
-    _last_good_cache[cache_key] = result
-    await _cache_set(cache_key, result)
-    return result
+    parts: Dict[int, Events] = {i: [] for i in run}
+    for event in result:
+        index = _partition_of(int(event["ts"]))
+        if index in parts:
+            parts[index].append(event)
+    for index, events in parts.items():
+        key = _partition_key(index)
+        _last_good_cache.put(key, events)
+        await _cache_set(key, events)
+    return parts
+
+
+async def _index_source(
+    start: int,
+    end: int,
+    countries: Optional[List[str]],
+    min_impact: Optional[str],
+) -> Events:
+    """Upstream fetch for the index sync, honouring (and feeding) the circuit breaker."""
+    if not _breaker.allow_request():
+        raise RuntimeError("calendar circuit breaker is open")
+    try:
+        events = await fetch_calendar(start, end, countries, min_impact)
+    except Exception:
+        _breaker.record_failure()
+        raise
+    _breaker.record_success()
+    return events
+
+
+def start_index_sync(push: bool = False) -> Optional[CalendarSync]:
+    """Start keeping the rolling event window in memory (no-op if disabled or running).
+
+    It runs from startup when the index is enabled, otherwise only once
+    ``/ws`` calendar pushes are wanted (``push``) and enabled.
+    """
+    global _sync, _sync_task
+    wanted = settings.CALENDAR_INDEX or (push and settings.CALENDAR_PUSH)
+    if not wanted or _sync_task is not None:
+        return _sync
+    day = 86_400
+    _sync = CalendarSync(
+        _index,
+        _index_source,
+        back_s=settings.CALENDAR_INDEX_BACK_DAYS * day,
+        ahead_s=settings.CALENDAR_INDEX_AHEAD_DAYS * day,
+        hot_s=settings.CALENDAR_INDEX_HOT_S,
+        interval_s=settings.CALENDAR_INDEX_SYNC_S,
+        full_every=settings.CALENDAR_INDEX_FULL_EVERY,
+    )
+    REGISTRY.register_collector(_sync.collect_metrics)
+    _sync_task = asyncio.create_task(_sync.run())
+    return _sync
+
+
+def _index_fresh() -> bool:
+    """Whether the index synced recently enough to answer queries on its own.
+
+    A sync that keeps failing (upstream down, breaker open) leaves the index
+    frozen; after a few missed intervals queries go back through the
+    partition caches, which revalidate on their own schedule.
+    """
+    if _sync is None or _sync.last_sync is None:
+        return False
+    return time.time() - _sync.last_sync <= _INDEX_MAX_MISSED_SYNCS * _sync.interval_s
+
+
+async def stop_index_sync() -> None:
+    global _sync_task
+    if _sync_task is None:
+        return
+    _sync_task.cancel()
+    await asyncio.gather(_sync_task, return_exceptions=True)
+    _sync_task = None
+
+
+@router.get("/calendar")
+async def calendar(
+    start: int = Query(..., description="epoch seconds UTC"),
+    end: int = Query(..., description="epoch seconds UTC"),
+    countries: Optional[str] = Query(
+        None,
+        description="CSV of country codes, e.g. US,EU,GB",
+    ),
+    min_impact: Optional[str] = Query(None, regex="^(low|medium|high)$"),
+):
+    """Events in ``[start, end]``, assembled from cached day (or week) partitions.
+
+    Partitions hold every event of their span unfiltered, so any window and
+    filter combination reuses them; only missing partitions go upstream, one
+    call per contiguous run. Stale partitions are served as they are and
+    refreshed in the background. Windows inside the synced index never get
+    that far while its sync keeps up.
+    """
+    if end < start:
+        raise HTTPException(status_code=422, detail="end must be >= start")
+    indices = list(range(_partition_of(start), _partition_of(end) + 1))
+    if len(indices) > settings.CALENDAR_MAX_PARTITIONS:
+        raise HTTPException(status_code=422, detail="Calendar window too large")
+    if settings.CALENDAR_INDEX and _index.covers(start, end) and _index_fresh():
+        _CACHE_INDEX.inc()
+        return _index.query(start, end, _countries(countries), min_impact)
+
+    parts = await _cached_partitions(indices)
+    stale = _stale(list(parts))
+    if stale:
+        _CACHE_STALE.inc(len(stale))
+        for run in _runs(stale):
+            _revalidate(run)
+    missing = [i for i in indices if i not in parts]
+    _CACHE_MISS.inc(len(missing))
+    for run in _runs(missing):
+        parts.update(await _single_flight(*_run_flight(run)))
+
+    events = [event for index in indices for event in parts[index]]
+    events.sort(key=lambda e: e["ts"])
+    return _filter(events, start, end, countries, min_impact)
@@ -0,0 +1,114 @@
+"""Server-side SuperTrend-AI endpoint with per-parameter incremental caching."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Literal, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Query
+
+from ...indicators import IncrementalSuperTrendAI
+from ..db_timescale import fetch_ohlc
+from ..live_indicators import build_supertrend_ai
+from ..sessions import align_bucket_start_ms
+
+router = APIRouter(prefix="/api", tags=["indicators"])
+
+TF = Literal["1m", "5m", "10m", "15m", "1h", "4h", "1d"]
+Cluster = Literal["Best", "Average", "Worst"]
+
+CACHE_MAX_ENTRIES = int(os.getenv("INDICATOR_CACHE_MAX_ENTRIES", "256"))
+
+
+class _Entry:
+    def __init__(self, state: IncrementalSuperTrendAI) -> None:
+        self.state = state
+        self.lock = asyncio.Lock()
+
+
+_cache: "OrderedDict[Tuple[Any, ...], _Entry]" = OrderedDict()
+
+
+def _entry(key: Tuple[Any, ...], params: Dict[str, Any]) -> _Entry:
+    entry = _cache.get(key)
+    if entry is None:
+        entry = _cache[key] = _Entry(build_supertrend_ai(params))
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    else:
+        _cache.move_to_end(key)
+    return entry
+
+
+def _extend(state: IncrementalSuperTrendAI, bars: list[Dict[str, Any]]) -> Dict[str, Any]:
+    # Runs in a worker thread: band/perf updates and result formatting are CPU bound.
+    state.update(bars)
+    out = state.to_dict()
+    if out["factor"] != out["factor"]:
+        out["factor"] = None  # empty history; NaN is not valid JSON
+    return out
+
+
+@router.get("/indicators/{symbol}")
+async def get_indicators(
+    symbol: str,
+    tf: TF = Query(..., description="Timeframe (1m,5m,10m,15m,1h,4h,1d)"),
+    start: int = Query(..., description="Start timestamp in UNIX milliseconds"),
+    end: Optional[int] = Query(None, description="End timestamp in UNIX ms (omit to follow live)"),
+    atr_length: int = Query(14, ge=1, le=500),
+    atr_mode: Literal["EMA", "RMA"] = Query("EMA"),
+    factor_min: float = Query(1.5, gt=0),
+    factor_max: float = Query(5.0, gt=0),
+    factor_steps: int = Query(5, ge=1, le=50),
+    k: int = Query(3, ge=1, le=3),
+    perf_alpha: float = Query(10, gt=0),
+    denom_span: float = Query(10, gt=0),
+    from_cluster: Cluster = Query("Best"),
+    use_ama: bool = Query(True),
+):
+    """Return SuperTrend-AI over closed bars, extending the cached state as bars close."""
+    symbol_upper = symbol.upper()
+    if factor_max < factor_min:
+        raise HTTPException(status_code=400, detail="'factor_max' must be >= 'factor_min'.")
+    if end is not None and end <= start:
+        raise HTTPException(status_code=400, detail="'end' must be greater than 'start'.")
+
+    live_start_ms = align_bucket_start_ms(int(time.time() * 1000), tf)
+    # Only closed bars enter the incremental state; the open bar would be revised.
+    closed_end = live_start_ms - 1 if end is None else min(end, live_start_ms - 1)
+
+    params: Dict[str, Any] = {
+        "atr_length": atr_length,
+        "atr_mode": atr_mode,
+        "factor_min": factor_min,
+        "factor_max": factor_max,
+        "factor_steps": factor_steps,
+        "k": k,
+        "perf_alpha": perf_alpha,
+        "denom_span": denom_span,
+        "from_cluster": from_cluster,
+        "use_ama": use_ama,
+    }
+    key = (symbol_upper, tf, start, end, tuple(sorted(params.items())))
+    entry = _entry(key, params)
+
+    async with entry.lock:
+        state = entry.state
+        fetch_from = start if state.last_time is None else state.last_time + 1
+        bars: list[Dict[str, Any]] = []
+        if fetch_from <= closed_end:
+            bars = await fetch_ohlc(symbol_upper, tf, fetch_from, closed_end)
+        result = await asyncio.to_thread(_extend, state, bars)
+
+    return {
+        "symbol": symbol_upper,
+        "tf": tf,
+        "params": params,
+        "bars": len(state),
+        "appended": len(bars),
+        "lastClosed": state.last_time,
+        **result,
+    }
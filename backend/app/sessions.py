@@ -0,0 +1,37 @@
+"""NYSE session helpers shared by the streaming hub and REST endpoints.
+
+Thin wrappers over :mod:`backend.common.session_calendar`; hot paths should
+use the ``*_ms`` helpers, which stay on integer epochs.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Tuple
+
+from ..common.session_calendar import NY, TF_STEP_SEC, get_calendar  # noqa: F401
+
+
+def nyse_open_close(dt_utc: datetime) -> Tuple[datetime, datetime]:
+    """Return the NYSE regular session (UTC) in force at the given UTC timestamp."""
+    open_s, close_s = get_calendar().open_close(int(dt_utc.timestamp()))
+    return (
+        datetime.fromtimestamp(open_s, tz=timezone.utc),
+        datetime.fromtimestamp(close_s, tz=timezone.utc),
+    )
+
+
+def align_bucket_start(ts_utc: datetime, tf: str) -> datetime:
+    """Align to NYSE anchor (intraday) or ET midnight for daily bars."""
+    return datetime.fromtimestamp(get_calendar().align(int(ts_utc.timestamp()), tf), tz=timezone.utc)
+
+
+def align_bucket_start_ms(ts_ms: int, tf: str) -> int:
+    """Integer-epoch :func:`align_bucket_start`."""
+    return get_calendar().align(ts_ms // 1000, tf) * 1000
+
+
+def bucket_bounds_ms(ts_ms: int, tf: str) -> Tuple[int, int]:
+    """Session-anchored ``[start, end)`` bucket (epoch ms) containing ``ts_ms``."""
+    start, end = get_calendar().bucket_bounds(ts_ms // 1000, tf)
+    return start * 1000, end * 1000
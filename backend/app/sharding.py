@@ -0,0 +1,466 @@
+"""Split a large symbol universe across several Alpaca stream connections (or processes).
+
+:class:`IngestSupervisor` owns N shards, each one :class:`AlpacaStreamClient`
+with its own WebSocket. Symbols are placed by :func:`rebalance`, which keeps
+existing placements, puts new symbols on the least loaded shard and moves
+as few symbols as needed to keep shard sizes within ``slack`` of each other.
+Hub demand for a symbol is routed to the shard that owns it.
+
+Connections in one process share the event loop, so they spread socket
+reads but not JSON decoding; ``processes=True`` runs each shard in its own
+process with its own Hub publishing through the cross-process broker
+(``HUB_BROKER=redis``), which is what lifts the single-core parsing limit.
+A child that dies is restarted with exponential backoff; with
+``PERSIST_BARS`` each child runs its own :class:`~.persistence.BarWriter`,
+since its bars never pass through the supervisor's hub.
+Per-shard message rates and lag are sampled every ``sample_s`` and exposed
+through :meth:`IngestSupervisor.report` and :meth:`IngestSupervisor.collect_metrics`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing as mp
+import queue
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from . import metrics
+from .core.settings import settings
+from .providers.alpaca_ws import AlpacaStreamClient
+from .subscriptions import WILDCARD
+
+logger = logging.getLogger(__name__)
+
+
+def rebalance(
+    current: Dict[str, int], universe: Iterable[str], shards: int, slack: int = 1
+) -> Dict[str, int]:
+    """Place every symbol of ``universe`` on one of ``shards``, moving as few as possible.
+
+    Deterministic for the same inputs. Symbols already placed on a shard that
+    still exists stay there unless that shard is more than ``slack`` symbols
+    above the smallest one.
+    """
+    wanted = sorted({s.strip().upper() for s in universe if s.strip()})
+    placed = {s: current[s] for s in wanted if current.get(s, shards) < shards}
+    members: List[List[str]] = [[] for _ in range(shards)]
+    for symbol in wanted:
+        if symbol in placed:
+            members[placed[symbol]].append(symbol)
+    for symbol in wanted:
+        if symbol not in placed:
+            target = min(range(shards), key=lambda i: len(members[i]))
+            members[target].append(symbol)
+            placed[symbol] = target
+    while True:
+        big = max(range(shards), key=lambda i: len(members[i]))
+        small = min(range(shards), key=lambda i: len(members[i]))
+        if len(members[big]) - len(members[small]) <= max(1, slack):
+            break
+        symbol = max(members[big])
+        members[big].remove(symbol)
+        members[small].append(symbol)
+        placed[symbol] = small
+    return placed
+
+
+def read_universe(path: str | Path) -> List[str]:
+    """Symbols from a file, one per line or comma separated; ``#`` starts a comment."""
+    symbols: List[str] = []
+    for line in Path(path).read_text().splitlines():
+        line = line.split("#", 1)[0]
+        symbols.extend(s.strip().upper() for s in line.split(",") if s.strip())
+    return symbols
+
+
+class _Shard(ABC):
+    """Common view of a shard for the supervisor: symbols in, counters out."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.symbols: List[str] = []
+        self.stats: Dict[str, int] = {}
+        self.lag_ms = 0.0
+        self.connected = False
+        self.restarts = 0
+        # (monotonic time, messages, frames) at the previous sample
+        self._last: Tuple[float, int, int] = (time.monotonic(), 0, 0)
+        self.rates = {"messages_per_s": 0.0, "frames_per_s": 0.0}
+
+    def sample(self, now: float) -> None:
+        self.refresh()
+        then, messages, frames = self._last
+        elapsed = max(1e-9, now - then)
+        cur_messages = self.stats.get("messages", 0)
+        cur_frames = self.stats.get("frames", 0)
+        # Counters start over when a shard process is restarted.
+        self.rates = {
+            "messages_per_s": max(0, cur_messages - messages) / elapsed,
+            "frames_per_s": max(0, cur_frames - frames) / elapsed,
+        }
+        self._last = (now, cur_messages, cur_frames)
+
+    def refresh(self) -> None:
+        return None
+
+    @abstractmethod
+    def set_symbols(self, symbols: List[str]) -> None:
+        """Make ``symbols`` the shard's always-on universe share."""
+
+    def on_demand(self, key: Tuple[str, str], added: bool) -> None:
+        return None
+
+    def take_demand(self, symbol: str) -> int:
+        """Forget local demand for ``symbol`` (it moved away); returns its reference count."""
+        return 0
+
+    def add_demand(self, symbol: str, refs: int) -> None:
+        return None
+
+    @abstractmethod
+    async def run(self) -> None:
+        """Run the shard's connection until cancelled."""
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "shard": self.name,
+            "symbols": len(self.symbols),
+            "connected": self.connected,
+            "lag_ms": round(self.lag_ms, 1),
+            **{k: round(v, 2) for k, v in self.rates.items()},
+            "messages": self.stats.get("messages", 0),
+            "reconnects": self.stats.get("reconnects", 0),
+            "restarts": self.restarts,
+        }
+
+
+class _LocalShard(_Shard):
+    """A connection in this process, publishing into the supervisor's hub."""
+
+    def __init__(self, name: str, client: AlpacaStreamClient) -> None:
+        super().__init__(name)
+        self.client = client
+        self.stats = client.stats
+
+    def refresh(self) -> None:
+        self.lag_ms = self.client.lag_ms
+        self.connected = self.client.connected
+
+    def set_symbols(self, symbols: List[str]) -> None:
+        self.symbols = symbols
+        self.client.set_symbols(symbols)
+
+    def on_demand(self, key: Tuple[str, str], added: bool) -> None:
+        self.client.on_demand(key, added)
+
+    def take_demand(self, symbol: str) -> int:
+        return self.client.refs.pop(symbol, 0)
+
+    def add_demand(self, symbol: str, refs: int) -> None:
+        self.client.refs[symbol] = self.client.refs.get(symbol, 0) + refs
+        self.client.idle_since.pop(symbol, None)
+
+    async def run(self) -> None:
+        await self.client.run()
+
+
+def _process_main(name: str, symbols: List[str], inbox, outbox, options: Dict[str, Any]) -> None:
+    """Entry point of a shard process: its own Hub publishing through the broker."""
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_process_shard(name, symbols, inbox, outbox, options))
+
+
+async def _process_shard(
+    name: str, symbols: List[str], inbox, outbox, options: Dict[str, Any]
+) -> None:
+    from .broker import make_broker
+    from .feeds import bar_close_timer
+    from .hub import Hub
+
+    hub = Hub(broker=make_broker())
+    await hub.start()
+    options = dict(options)
+    http = None
+    if options.pop("backfill", False):
+        # The parent's pooled client can't cross the process boundary.
+        from .providers.alpaca_rest import AlpacaHistory, new_client
+
+        http = new_client()
+        options["history"] = AlpacaHistory(client=http)
+    client = AlpacaStreamClient(hub, symbols, follow_demand=False, shard=name, **options)
+    tasks = []
+    if settings.PERSIST_BARS:
+        # Bars published here go straight to the broker, so this process
+        # persists its own share of them.
+        from .db_timescale import get_pool
+        from .persistence import BarWriter
+
+        writer = BarWriter(get_pool)
+        hub.add_bar_sink(writer.offer, writer.wait_for_room)
+        tasks.append(asyncio.create_task(writer.run()))
+
+    async def commands() -> None:
+        while True:
+            message = await asyncio.to_thread(inbox.get)
+            if message is None:
+                return
+            client.set_symbols(message)
+
+    async def report() -> None:
+        while True:
+            await asyncio.sleep(1.0)
+            outbox.put((name, dict(client.stats), client.lag_ms, client.connected))
+
+    tasks += [
+        asyncio.create_task(client.run()),
+        asyncio.create_task(bar_close_timer(hub)),
+        asyncio.create_task(report()),
+    ]
+    try:
+        await commands()
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Lets the writer flush what it still holds.
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await hub.close()
+        if http is not None:
+            await http.aclose()
+
+
+class _ProcessShard(_Shard):
+    """A connection in a child process; symbols and counters cross via queues.
+
+    A child that exits is started again (with the current symbols) after
+    ``restart_min_s``, doubling up to ``restart_max_s`` while it keeps dying;
+    a child that stayed up for ``restart_max_s`` resets the backoff.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ctx,
+        outbox,
+        options: Dict[str, Any],
+        restart_min_s: float = 1.0,
+        restart_max_s: float = 60.0,
+        poll_s: float = 1.0,
+    ) -> None:
+        super().__init__(name)
+        self.ctx = ctx
+        self.inbox = ctx.Queue()
+        self.outbox = outbox
+        self.options = options
+        self.restart_min_s = restart_min_s
+        self.restart_max_s = restart_max_s
+        self.poll_s = poll_s
+        self.process: Optional[mp.process.BaseProcess] = None
+
+    def set_symbols(self, symbols: List[str]) -> None:
+        self.symbols = symbols
+        if self.process is not None:
+            self.inbox.put(symbols)
+
+    def _start(self) -> None:
+        # A fresh inbox: updates queued for a dead child are already in ``symbols``.
+        self.inbox = self.ctx.Queue()
+        self.process = self.ctx.Process(
+            target=_process_main,
+            args=(self.name, self.symbols, self.inbox, self.outbox, self.options),
+            name=f"ingest-{self.name}",
+            daemon=True,
+        )
+        self.process.start()
+
+    async def run(self) -> None:
+        delay = self.restart_min_s
+        while True:
+            started = time.monotonic()
+            self._start()
+            try:
+                while self.process.is_alive():
+                    await asyncio.sleep(self.poll_s)
+            finally:
+                if self.process.is_alive():
+                    self.inbox.put(None)
+                    await asyncio.to_thread(self.process.join, 5.0)
+                    if self.process.is_alive():
+                        self.process.terminate()
+            self.connected = False
+            if time.monotonic() - started >= self.restart_max_s:
+                delay = self.restart_min_s
+            self.restarts += 1
+            logger.warning(
+                "Ingest shard %s exited with %s; restart %d in %.1fs",
+                self.name,
+                self.process.exitcode,
+                self.restarts,
+                delay,
+            )
+            await asyncio.sleep(delay)
+            delay = min(self.restart_max_s, delay * 2)
+
+
+class IngestSupervisor:
+    """Run ``shards`` Alpaca connections over one symbol universe and keep them balanced.
+
+    ``client_options`` are passed to every :class:`AlpacaStreamClient`
+    (timeframe, channels, debounce_s, ...). With ``follow_demand`` (in-process
+    shards only) hub subscriptions outside the universe are added to the shard
+    that owns the symbol; wildcard demand goes to the first shard.
+    """
+
+    def __init__(
+        self,
+        hub,
+        symbols: Iterable[str] = (),
+        shards: int = 2,
+        processes: bool = False,
+        follow_demand: bool = True,
+        sample_s: float = 5.0,
+        slack: int = 1,
+        **client_options: Any,
+    ) -> None:
+        if shards < 1:
+            raise ValueError("IngestSupervisor needs at least one shard")
+        self.hub = hub
+        self.processes = processes
+        self.sample_s = sample_s
+        self.slack = slack
+        self.placement: Dict[str, int] = {}
+        self.moves = 0
+        self.shards: List[_Shard] = []
+        if processes:
+            if settings.HUB_BROKER.lower() != "redis":
+                raise ValueError("Ingest shard processes publish through HUB_BROKER=redis")
+            ctx = mp.get_context("spawn")
+            self._outbox = ctx.Queue()
+            # Children build their own backfill source around their own client.
+            options = dict(client_options, backfill=client_options.get("history") is not None)
+            options.pop("history", None)
+            for i in range(shards):
+                self.shards.append(_ProcessShard(f"shard-{i}", ctx, self._outbox, options))
+        else:
+            for i in range(shards):
+                name = f"shard-{i}"
+                client = AlpacaStreamClient(
+                    hub, (), follow_demand=False, shard=name, **client_options
+                )
+                self.shards.append(_LocalShard(name, client))
+            if follow_demand:
+                hub.add_demand_listener(self.on_demand)
+        self.set_universe(symbols)
+
+    def shard_for(self, symbol: str) -> int:
+        """Owning shard of ``symbol``; symbols outside the universe are placed on the fly."""
+        index = self.placement.get(symbol)
+        if index is None:
+            if symbol == WILDCARD:
+                return 0
+            # Demand-only symbols keep a stable home without reshuffling the universe.
+            loads = [0] * len(self.shards)
+            for i in self.placement.values():
+                loads[i] += 1
+            index = min(range(len(self.shards)), key=lambda i: loads[i])
+            self.placement[symbol] = index
+        return index
+
+    def on_demand(self, key: Tuple[str, str], added: bool) -> None:
+        self.shards[self.shard_for(key[0])].on_demand(key, added)
+
+    def set_universe(self, symbols: Iterable[str]) -> int:
+        """Rebalance onto a new universe; returns how many existing symbols changed shard."""
+        universe = [s for s in symbols if s.strip()]
+        previous = {s: i for s, i in self.placement.items()}
+        placement = rebalance(previous, universe, len(self.shards), self.slack)
+        moved = 0
+        for symbol, index in placement.items():
+            if symbol in previous and previous[symbol] != index:
+                moved += 1
+                refs = self.shards[previous[symbol]].take_demand(symbol)
+                if refs:
+                    self.shards[index].add_demand(symbol, refs)
+        # Keep homes of demand-only symbols that are not part of the universe.
+        for symbol, index in previous.items():
+            placement.setdefault(symbol, index)
+        self.placement = placement
+        universe_set = {s.strip().upper() for s in universe}
+        members: List[List[str]] = [[] for _ in self.shards]
+        for symbol, index in placement.items():
+            if symbol in universe_set:
+                members[index].append(symbol)
+        for shard, owned in zip(self.shards, members):
+            owned.sort()
+            if owned != shard.symbols:
+                shard.set_symbols(owned)
+        self.moves += moved
+        return moved
+
+    async def watch_universe(self, path: str | Path, interval_s: float = 30.0) -> None:
+        """Re-read ``path`` every ``interval_s`` and rebalance when its contents change."""
+        path = Path(path)
+        seen: Optional[float] = None
+        while True:
+            try:
+                mtime = path.stat().st_mtime
+                if mtime != seen:
+                    seen = mtime
+                    moved = self.set_universe(read_universe(path))
+                    logger.info("Ingest universe reloaded from %s (%d moved)", path, moved)
+            except OSError as exc:
+                logger.warning("Ingest universe %s unreadable: %s", path, exc)
+            await asyncio.sleep(interval_s)
+
+    def sample(self) -> None:
+        if self.processes:
+            while True:
+                try:
+                    name, stats, lag_ms, connected = self._outbox.get_nowait()
+                except queue.Empty:
+                    break
+                for shard in self.shards:
+                    if shard.name == name:
+                        shard.stats, shard.lag_ms, shard.connected = stats, lag_ms, connected
+        now = time.monotonic()
+        for shard in self.shards:
+            shard.sample(now)
+
+    async def run(self) -> None:
+        tasks = [asyncio.create_task(shard.run()) for shard in self.shards]
+        try:
+            while True:
+                await asyncio.sleep(self.sample_s)
+                self.sample()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def report(self) -> List[Dict[str, Any]]:
+        return [shard.report() for shard in self.shards]
+
+    def collect_metrics(self) -> List[metrics.Family]:
+        families: List[metrics.Family] = []
+        series = [
+            ("ingest_shard_symbols", "Universe symbols owned by each ingest shard.", "symbols"),
+            ("ingest_shard_connected", "Whether each ingest shard's stream is up.", "connected"),
+            ("ingest_shard_lag_ms", "Receive minus upstream time, newest update.", "lag_ms"),
+            ("ingest_shard_messages_per_second", "Updates decoded per second.", "messages_per_s"),
+            ("ingest_shard_frames_per_second", "WebSocket frames read per second.", "frames_per_s"),
+        ]
+        reports = self.report()
+        for name, help, field in series:
+            samples = [((("shard", r["shard"]),), float(r[field])) for r in reports]
+            families.append((name, "gauge", help, samples))
+        families.append(
+            ("ingest_shard_moves", "counter", "Symbols moved between shards.", [((), self.moves)])
+        )
+        restarts = [((("shard", r["shard"]),), float(r["restarts"])) for r in reports]
+        families.append(
+            ("ingest_shard_restarts", "counter", "Shard processes restarted.", restarts)
+        )
+        return families
@@ -0,0 +1,170 @@
+"""Per-(symbol, tf) sequence numbers and replay logs for resumable /ws streams."""
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Callable, Deque, List, Optional, Tuple
+
+from .core.settings import settings
+from .rollup import BarEvent
+
+Key = Tuple[str, str]
+
+
+class Stream:
+    """Sequence state of one ``(symbol, tf)`` stream as seen by this hub.
+
+    ``seq`` increases by one for every bar update or close fanned out on the
+    stream, and ``log`` keeps the last events by sequence number so a client
+    that reconnects with its last ``seq`` gets only what it missed. Bar
+    history for snapshots lives in the hub's :class:`BarStore`.
+    """
+
+    __slots__ = ("seq", "log", "active", "subscribed")
+
+    def __init__(self, replay: int, seq: int = 0) -> None:
+        self.seq = seq
+        self.log: Deque[Tuple[int, BarEvent]] = deque(maxlen=max(1, replay))
+        # Monotonic time the stream last had subscribers (or was last checked
+        # while it still had them).
+        self.active = 0.0
+        self.subscribed = False
+
+    def record(self, event: BarEvent) -> int:
+        self.seq += 1
+        self.log.append((self.seq, event))
+        return self.seq
+
+    def reset(self) -> None:
+        """Forget the log after a gap; the bumped ``seq`` fails every older resume."""
+        self.seq += 1
+        self.log.clear()
+
+    def since(self, seq: int) -> Optional[List[Tuple[int, BarEvent]]]:
+        """Events after ``seq``, or ``None`` if some of them already left the log."""
+        if seq >= self.seq:
+            return [] if seq == self.seq else None
+        if not self.log or self.log[0][0] > seq + 1:
+            return None
+        skip = seq + 1 - self.log[0][0]
+        return list(islice(self.log, skip, None))
+
+
+class StreamStore:
+    """Streams that have subscribers, or had them within the resume window.
+
+    Events are logged only for those: a stream is created when it gains
+    subscribers and evicted ``idle_s`` after the last one left (see
+    :meth:`release`); quiet streams that are still subscribed stay. When
+    all logs together exceed ``budget`` events, the logs of the least
+    recently active streams are cleared (their ``seq`` carries on, so older
+    resumes fall back to a snapshot). Recreated streams start numbering
+    above ``floor``, past every evicted stream's last ``seq``, so a resume
+    against the old numbering can never replay the wrong events.
+    """
+
+    def __init__(
+        self,
+        replay: Optional[int] = None,
+        budget: Optional[int] = None,
+        idle_s: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.replay = replay or settings.WS_REPLAY_EVENTS
+        self.budget = budget or settings.WS_REPLAY_BUDGET_EVENTS
+        self.idle_s = settings.WS_REPLAY_IDLE_S if idle_s is None else idle_s
+        self.clock = clock
+        # Least recently active first.
+        self.streams: "OrderedDict[Key, Stream]" = OrderedDict()
+        self.events = 0
+        self.floor = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.streams)
+
+    def get(self, symbol: str, tf: str) -> Optional[Stream]:
+        return self.streams.get((symbol, tf))
+
+    def open(self, symbol: str, tf: str) -> Stream:
+        """The stream of a key that is gaining subscribers, created if needed."""
+        key = (symbol, tf)
+        stream = self.streams.get(key)
+        if stream is None:
+            stream = self.streams[key] = Stream(self.replay, self.floor)
+        stream.active = self.clock()
+        stream.subscribed = True
+        self.streams.move_to_end(key)
+        return stream
+
+    def release(self, symbol: str, tf: str) -> None:
+        """The key lost its last subscriber: its resume window starts now."""
+        key = (symbol, tf)
+        stream = self.streams.get(key)
+        if stream is not None and stream.subscribed:
+            stream.subscribed = False
+            stream.active = self.clock()
+            self.streams.move_to_end(key)
+
+    def missed(self, symbol: str, tf: str, seq: int) -> Optional[List[Tuple[int, BarEvent]]]:
+        """Events after ``seq`` for a resume, or ``None`` if a snapshot is needed."""
+        stream = self.streams.get((symbol, tf))
+        if stream is None:
+            return [] if seq == 0 and self.floor == 0 else None
+        return stream.since(seq)
+
+    def invalidate(self, symbol: str, tf: str) -> None:
+        stream = self.streams.get((symbol, tf))
+        if stream is not None:
+            self.events -= len(stream.log)
+            stream.reset()
+
+    def record(self, event: BarEvent, subscribed: bool = True) -> int:
+        """Number and log ``event``; 0 if its stream is not kept (nobody to resume it)."""
+        key = (event.symbol, event.tf)
+        now = self.clock()
+        if subscribed:
+            stream = self.open(*key)
+        else:
+            stream = self.streams.get(key)
+            if stream is None:
+                return 0
+            if stream.subscribed:
+                self.release(*key)
+            elif now - stream.active > self.idle_s:
+                self._evict(key)
+                return 0
+        before = len(stream.log)
+        seq = stream.record(event)
+        self.events += len(stream.log) - before
+        self._sweep(now)
+        return seq
+
+    def _evict(self, key: Key) -> None:
+        stream = self.streams.pop(key)
+        self.events -= len(stream.log)
+        self.floor = max(self.floor, stream.seq + 1)
+        self.evictions += 1
+
+    def _sweep(self, now: float) -> None:
+        while self.streams:
+            key, stream = next(iter(self.streams.items()))
+            if now - stream.active <= self.idle_s:
+                break
+            if stream.subscribed:
+                # Quiet but still watched: check again one window from now.
+                stream.active = now
+                self.streams.move_to_end(key)
+                continue
+            self._evict(key)
+        if self.events <= self.budget:
+            return
+        # Clear down to 90% so the scan does not repeat on every event.
+        target = self.budget * 9 // 10
+        for stream in self.streams.values():
+            if self.events <= target:
+                break
+            self.events -= len(stream.log)
+            stream.log.clear()
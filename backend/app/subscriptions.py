@@ -0,0 +1,182 @@
+"""Indexed (symbol, tf) subscription registry used by the WebSocket hub."""
+
+from __future__ import annotations
+
+import uuid
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from .calendar_index import IMPACT_ORDER
+
+WILDCARD = "*"
+
+Key = Tuple[str, str]
+
+
+@dataclass
+class Subscription:
+    id: str
+    conn: Hashable
+    tf: str
+    symbols: List[str] = field(default_factory=list)
+    # Max open-bar updates per second for this subscription (None = unlimited).
+    max_rate: Optional[float] = None
+
+    @property
+    def keys(self) -> Iterator[Key]:
+        return ((symbol, self.tf) for symbol in self.symbols)
+
+
+@dataclass(frozen=True)
+class CalendarSubscription:
+    """Calendar event updates for one connection, filtered like ``/v1/calendar``."""
+
+    id: str
+    countries: Optional[FrozenSet[str]] = None
+    min_impact: Optional[str] = None
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        if self.countries is not None:
+            if str(event.get("country") or "").upper() not in self.countries:
+                return False
+        if self.min_impact:
+            floor = IMPACT_ORDER[self.min_impact]
+            return IMPACT_ORDER.get(event.get("impact") or "", 0) >= floor
+        return True
+
+
+class SubscriptionRegistry:
+    """Forward ``(symbol, tf) -> conn -> ids`` and reverse ``conn -> id -> sub`` indexes.
+
+    Every mutation touches only the keys of the subscription involved, so
+    subscribe, unsubscribe-by-id and disconnect are O(1) per subscribed
+    symbol regardless of how many other clients exist. ``"*"`` as a symbol
+    subscribes to every symbol of that timeframe.
+
+    ``on_key_added``/``on_key_removed`` fire when a key gains its first or
+    loses its last subscriber, which is what upstream demand tracking needs.
+    """
+
+    def __init__(self) -> None:
+        self.forward: Dict[Key, Dict[Hashable, Set[str]]] = {}
+        self.reverse: Dict[Hashable, Dict[str, Subscription]] = {}
+        self.on_key_added: Optional[Callable[[Key], None]] = None
+        self.on_key_removed: Optional[Callable[[Key], None]] = None
+
+    def __len__(self) -> int:
+        return sum(len(subs) for subs in self.reverse.values())
+
+    def add(
+        self,
+        conn: Hashable,
+        symbols: Iterable[str],
+        tf: str,
+        sub_id: Optional[str] = None,
+        max_rate: Optional[float] = None,
+    ) -> Subscription:
+        sub_id = sub_id or uuid.uuid4().hex[:12]
+        owned = self.reverse.setdefault(conn, {})
+        unique = list(dict.fromkeys(s.strip().upper() for s in symbols if s and s.strip()))
+        sub = Subscription(id=sub_id, conn=conn, tf=tf, symbols=unique, max_rate=max_rate)
+        # Re-using an id replaces the previous subscription; only the keys that
+        # differ are linked or unlinked, so shared keys never blink to zero.
+        previous = owned.get(sub_id)
+        kept = set(previous.keys) if previous is not None else set()
+        owned[sub_id] = sub
+        for key in sub.keys:
+            if key not in kept:
+                self._link(conn, sub_id, key)
+        if previous is not None:
+            new_keys = set(sub.keys)
+            for key in previous.keys:
+                if key not in new_keys:
+                    self._unlink(conn, sub_id, key)
+        return sub
+
+    def get(self, conn: Hashable, sub_id: str) -> Optional[Subscription]:
+        return self.reverse.get(conn, {}).get(sub_id)
+
+    def remove(self, conn: Hashable, sub_id: str) -> Optional[Subscription]:
+        owned = self.reverse.get(conn)
+        if not owned:
+            return None
+        sub = owned.pop(sub_id, None)
+        if not owned:
+            self.reverse.pop(conn, None)
+        if sub is None:
+            return None
+        for key in sub.keys:
+            self._unlink(conn, sub_id, key)
+        return sub
+
+    def _link(self, conn: Hashable, sub_id: str, key: Key) -> None:
+        conns = self.forward.get(key)
+        if conns is None:
+            conns = self.forward[key] = {}
+            if self.on_key_added is not None:
+                self.on_key_added(key)
+        conns.setdefault(conn, set()).add(sub_id)
+
+    def _unlink(self, conn: Hashable, sub_id: str, key: Key) -> None:
+        conns = self.forward.get(key)
+        if conns is None:
+            return
+        ids = conns.get(conn)
+        if ids is not None:
+            ids.discard(sub_id)
+            if not ids:
+                del conns[conn]
+        if not conns:
+            del self.forward[key]
+            if self.on_key_removed is not None:
+                self.on_key_removed(key)
+
+    def remove_conn(self, conn: Hashable) -> List[Subscription]:
+        removed = []
+        for sub_id in list(self.reverse.get(conn, {})):
+            sub = self.remove(conn, sub_id)
+            if sub is not None:
+                removed.append(sub)
+        return removed
+
+    def subscriptions(self, conn: Hashable) -> List[Subscription]:
+        return list(self.reverse.get(conn, {}).values())
+
+    def min_interval(self, conn: Hashable, key: Key) -> float:
+        """Seconds between open-bar updates for ``conn`` on ``key`` (0 = unlimited)."""
+        ids = self.forward.get(key, {}).get(conn)
+        if not ids:
+            return 0.0
+        owned = self.reverse[conn]
+        rates = [owned[sub_id].max_rate for sub_id in ids]
+        if any(rate is None for rate in rates):
+            return 0.0
+        return 1.0 / max(rates)
+
+    def subscribers(self, symbol: str, tf: str) -> Set[Hashable]:
+        """Return connections interested in ``(symbol, tf)``, wildcard included."""
+        exact = self.forward.get((symbol, tf))
+        wildcard = self.forward.get((WILDCARD, tf))
+        if wildcard is None:
+            return set(exact) if exact else set()
+        if exact is None:
+            return set(wildcard)
+        return set(exact).union(wildcard)
+
+    def has_subscribers(self, symbol: str, tf: str) -> bool:
+        return (symbol, tf) in self.forward or (WILDCARD, tf) in self.forward
+
+    def active_keys(self) -> List[Key]:
+        return list(self.forward)
@@ -0,0 +1,75 @@
+"""Hashed timer wheel: one asyncio task drives many short, coarse-grained timers."""
+
+from __future__ import annotations
+
+import asyncio
+import math
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class TimerWheel:
+    """Schedule ``callback(item)`` after a delay with ``tick_s`` resolution.
+
+    Scheduling and firing are O(1) per timer, and there is a single task for
+    the whole wheel rather than one sleeper per timer. Delays longer than one
+    revolution are handled with a per-entry rounds counter.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[Any], None],
+        tick_s: float = 0.01,
+        slots: int = 512,
+    ) -> None:
+        self.callback = callback
+        self.tick_s = tick_s
+        self.slots: List[List[Tuple[int, Any]]] = [[] for _ in range(slots)]
+        self.cursor = 0
+        self.pending = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, delay_s: float, item: Any) -> None:
+        ticks = max(1, math.ceil(delay_s / self.tick_s))
+        rounds, offset = divmod(ticks, len(self.slots))
+        if offset == 0:
+            rounds, offset = rounds - 1, len(self.slots)
+        slot = (self.cursor + offset) % len(self.slots)
+        self.slots[slot].append((rounds, item))
+        self.pending += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def advance(self, ticks: int = 1) -> None:
+        """Move the wheel forward, firing due timers (called by the driver task)."""
+        for _ in range(ticks):
+            self.cursor = (self.cursor + 1) % len(self.slots)
+            bucket = self.slots[self.cursor]
+            if not bucket:
+                continue
+            keep: List[Tuple[int, Any]] = []
+            due: List[Any] = []
+            for rounds, item in bucket:
+                if rounds:
+                    keep.append((rounds - 1, item))
+                else:
+                    due.append(item)
+            self.slots[self.cursor] = keep
+            self.pending -= len(due)
+            for item in due:
+                self.callback(item)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        last = loop.time()
+        while self.pending:
+            await asyncio.sleep(self.tick_s)
+            now = loop.time()
+            ticks = int((now - last) / self.tick_s)
+            if ticks:
+                last += ticks * self.tick_s
+                self.advance(ticks)
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1 @@
+"""Helpers shared by the backend FastAPI apps."""
@@ -0,0 +1,111 @@
+"""Conditional GET helpers (ETag / Last-Modified) for the OHLC history endpoints."""
+
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Mapping, Optional, Tuple
+
+from fastapi import Response
+
+NO_CACHE = "no-cache"
+
+
+@dataclass(frozen=True)
+class Validator:
+    """Cheap cache validator derived from the request window, not the rows."""
+
+    etag: str
+    last_modified_s: int
+    cache_control: str = NO_CACHE
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            "ETag": self.etag,
+            "Last-Modified": formatdate(self.last_modified_s, usegmt=True),
+            "Cache-Control": self.cache_control,
+        }
+
+    def apply(self, response: Response) -> None:
+        response.headers.update(self.headers())
+
+
+def make_etag(*parts: object) -> str:
+    """Hash the validator inputs into a strong ETag value."""
+    digest = hashlib.blake2b("|".join(str(p) for p in parts).encode(), digest_size=12)
+    return f'"{digest.hexdigest()}"'
+
+
+def historical_cache_control(max_age_s: int) -> str:
+    return f"public, max-age={max_age_s}"
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # Weak comparison per RFC 9110 13.1.2: W/ prefixes are ignored for GET.
+    target = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+
+def is_not_modified(headers: Mapping[str, str], validator: Validator) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since against ``validator``."""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence; If-Modified-Since is ignored when present.
+        return _etag_matches(if_none_match, validator.etag)
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            return False
+        return validator.last_modified_s <= int(since.timestamp())
+    return False
+
+
+def not_modified_response(headers: Mapping[str, str], validator: Validator) -> Optional[Response]:
+    """Return a 304 response when the client copy is still current, else ``None``."""
+    if not is_not_modified(headers, validator):
+        return None
+    return Response(status_code=304, headers=validator.headers())
+
+
+class LiveHeadVersions:
+    """Per-(symbol, tf) version counter bumped whenever the live bar changes."""
+
+    def __init__(self) -> None:
+        self._versions: Dict[Tuple[str, str], Tuple[int, int]] = {}
+
+    def bump(self, symbol: str, tf: str, updated_ms: int) -> None:
+        key = (symbol.upper(), tf)
+        version, _ = self._versions.get(key, (0, 0))
+        self._versions[key] = (version + 1, updated_ms)
+
+    def get(self, symbol: str, tf: str) -> Optional[Tuple[int, int]]:
+        """Return ``(version, updated_ms)`` or ``None`` if no live feed has been seen."""
+        return self._versions.get((symbol.upper(), tf))
+
+
+live_heads = LiveHeadVersions()
+
+__all__ = [
+    "NO_CACHE",
+    "LiveHeadVersions",
+    "Validator",
+    "historical_cache_control",
+    "is_not_modified",
+    "live_heads",
+    "make_etag",
+    "not_modified_response",
+]
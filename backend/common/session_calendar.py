@@ -0,0 +1,343 @@
+"""NYSE session calendar precomputed as epoch arrays for allocation-free bucket alignment.
+
+Session opens/closes (epoch seconds) are built once for a range of years,
+from ``exchange_calendars`` when it is installed and from static NYSE rules
+otherwise. Lookups index day tables by ``ts // 86400`` so aligning a tick is
+O(1) integer arithmetic with no datetime or tz objects involved.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NY = ZoneInfo("America/New_York")
+
+TF_STEP_SEC = {
+    "1m": 60,
+    "5m": 300,
+    "10m": 600,
+    "15m": 900,
+    "1h": 3600,
+    "4h": 14400,
+    "1d": 86400,
+}
+
+DAY_S = 86_400
+REGULAR_OPEN = time(9, 30)
+REGULAR_CLOSE = time(16, 0)
+EARLY_CLOSE = time(13, 0)
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Unscheduled full-day closures that the static rules cannot derive.
+SPECIAL_CLOSURES = {
+    date(2001, 9, 11),
+    date(2001, 9, 12),
+    date(2001, 9, 13),
+    date(2001, 9, 14),
+    date(2004, 6, 11),  # President Reagan
+    date(2007, 1, 2),  # President Ford
+    date(2012, 10, 29),  # Hurricane Sandy
+    date(2012, 10, 30),
+    date(2018, 12, 5),  # President G.H.W. Bush
+    date(2025, 1, 9),  # President Carter
+}
+
+Session = Tuple[date, int, int]
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    first = date(year, month, 1)
+    return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+
+
+def _last_weekday(year: int, month: int, weekday: int) -> date:
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year: int) -> date:
+    """Gregorian Easter Sunday (anonymous algorithm)."""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7  # noqa: E741
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _observed(day: date) -> date:
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+def nyse_holidays(year: int) -> Set[date]:
+    """Full-day NYSE closures for ``year`` from the standing holiday rules."""
+    days = {
+        _nth_weekday(year, 1, 0, 3),  # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),  # Washington's Birthday
+        _easter(year) - timedelta(days=2),  # Good Friday
+        _last_weekday(year, 5, 0),  # Memorial Day
+        _observed(date(year, 7, 4)),
+        _nth_weekday(year, 9, 0, 1),  # Labor Day
+        _nth_weekday(year, 11, 3, 4),  # Thanksgiving
+        _observed(date(year, 12, 25)),
+    }
+    # New Year's Day falling on a Saturday is not observed on the Friday before.
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        days.add(_observed(new_year))
+    if year >= 2022:
+        days.add(_observed(date(year, 6, 19)))  # Juneteenth
+    days.update(d for d in SPECIAL_CLOSURES if d.year == year)
+    return days
+
+
+def nyse_early_closes(year: int) -> Set[date]:
+    """13:00 ET closes: eve of Independence Day and Christmas, day after Thanksgiving."""
+    days = {_nth_weekday(year, 11, 3, 4) + timedelta(days=1)}
+    for eve in (date(year, 7, 3), date(year, 12, 24)):
+        if eve.weekday() < 4:
+            days.add(eve)
+    return days
+
+
+def _epoch_s(day: date, at: time) -> int:
+    return int(datetime.combine(day, at, tzinfo=NY).timestamp())
+
+
+def static_sessions(start: date, end: date) -> List[Session]:
+    """``(date, open_s, close_s)`` for every session in ``[start, end]`` from static rules."""
+    closed: Set[date] = set()
+    early: Set[date] = set()
+    for year in range(start.year, end.year + 1):
+        closed |= nyse_holidays(year)
+        early |= nyse_early_closes(year)
+    sessions: List[Session] = []
+    day = start
+    while day <= end:
+        if day.weekday() < 5 and day not in closed:
+            close = EARLY_CLOSE if day in early else REGULAR_CLOSE
+            sessions.append((day, _epoch_s(day, REGULAR_OPEN), _epoch_s(day, close)))
+        day += timedelta(days=1)
+    return sessions
+
+
+def exchange_calendar_sessions(start: date, end: date) -> Optional[List[Session]]:
+    """Sessions from ``exchange_calendars`` (XNYS), or ``None`` when unavailable."""
+    try:
+        import exchange_calendars as xc
+
+        schedule = xc.get_calendar("XNYS", start=start.isoformat(), end=end.isoformat()).schedule
+    except Exception:
+        return None
+    return [
+        (label.date(), int(row.open.timestamp()), int(row.close.timestamp()))
+        for label, row in zip(schedule.index, schedule.itertuples())
+    ]
+
+
+class SessionCalendar:
+    """Session opens/closes plus per-day lookup tables covering ``[first_day, last_day]``.
+
+    ``day_session[d]`` is the index of the session on day ``d`` (-1 if none)
+    and ``prev_session[d]`` the last session strictly before it. Because a
+    NYSE open always falls on the same UTC date as its ET date, the session
+    in force at ``ts`` is found from ``ts // 86400`` with one comparison.
+    """
+
+    def __init__(
+        self,
+        sessions: Sequence[Session],
+        first_day: date,
+        last_day: date,
+        source: str = "static",
+    ) -> None:
+        self.source = source
+        self.first_day = first_day
+        self.last_day = last_day
+        self.dates: List[date] = [s[0] for s in sessions]
+        self.opens = np.array([s[1] for s in sessions], dtype=np.int64)
+        self.closes = np.array([s[2] for s in sessions], dtype=np.int64)
+        self._day0 = first_day.toordinal() - _EPOCH_ORDINAL
+        ndays = last_day.toordinal() - first_day.toordinal() + 1
+
+        day_session = np.full(ndays, -1, dtype=np.int64)
+        for i, day in enumerate(self.dates):
+            offset = day.toordinal() - first_day.toordinal()
+            if 0 <= offset < ndays:
+                day_session[offset] = i
+        has = day_session >= 0
+        last_seen = np.maximum.accumulate(np.where(has, day_session, -1))
+        prev_session = np.empty(ndays, dtype=np.int64)
+        prev_session[0] = -1
+        prev_session[1:] = last_seen[:-1]
+        self.day_session = day_session
+        self.prev_session = prev_session
+
+        # ET midnight of every calendar day, with one extra day on each side.
+        self.midnights = np.array(
+            [
+                int(datetime.combine(first_day + timedelta(days=k - 1), time(0), tzinfo=NY).timestamp())
+                for k in range(ndays + 2)
+            ],
+            dtype=np.int64,
+        )
+
+        # Plain lists for the scalar path: list indexing beats numpy scalar access.
+        self._opens = self.opens.tolist()
+        self._closes = self.closes.tolist()
+        self._day_session = day_session.tolist()
+        self._prev_session = prev_session.tolist()
+        self._midnights = self.midnights.tolist()
+        self._ndays = ndays
+        self._by_date = {day: i for i, day in enumerate(self.dates)}
+
+    @classmethod
+    def build(
+        cls,
+        start_year: int,
+        end_year: int,
+        source: str = "auto",
+    ) -> "SessionCalendar":
+        """Precompute sessions for ``[start_year, end_year]`` (``auto``, ``exchange`` or ``static``)."""
+        first, last = date(start_year, 1, 1), date(end_year, 12, 31)
+        sessions = None
+        if source in {"auto", "exchange"}:
+            sessions = exchange_calendar_sessions(first, last)
+            if sessions is None and source == "exchange":
+                raise RuntimeError("exchange_calendars is not installed")
+        if sessions is not None:
+            return cls(sessions, first, last, source="exchange_calendars")
+        return cls(static_sessions(first, last), first, last, source="static")
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    # -- scalar lookups ---------------------------------------------------
+
+    def _day(self, ts_s: int) -> int:
+        d = ts_s // DAY_S - self._day0
+        if not 0 <= d < self._ndays:
+            raise ValueError(f"timestamp {ts_s} is outside the session calendar range")
+        return d
+
+    def session_index(self, ts_s: int) -> int:
+        """Index of the session whose open is the latest one at or before ``ts_s``."""
+        d = self._day(ts_s)
+        i = self._day_session[d]
+        if i < 0 or ts_s < self._opens[i]:
+            i = self._prev_session[d]
+            if i < 0:
+                raise ValueError(f"no session before {ts_s} in the session calendar")
+        return i
+
+    def open_close(self, ts_s: int) -> Tuple[int, int]:
+        """``(open_s, close_s)`` of the session in force at ``ts_s`` (latest open <= ts)."""
+        i = self.session_index(ts_s)
+        return self._opens[i], self._closes[i]
+
+    def session_open_close(self, day: date) -> Optional[Tuple[int, int]]:
+        i = self._by_date.get(day)
+        if i is None:
+            return None
+        return self._opens[i], self._closes[i]
+
+    def is_session(self, day: date) -> bool:
+        return day in self._by_date
+
+    def sessions_between(self, start: date, end: date) -> List[date]:
+        return [day for day in self.dates if start <= day <= end]
+
+    def et_midnight(self, ts_s: int) -> int:
+        k = self._day(ts_s) + 1
+        midnight = self._midnights[k]
+        return midnight if ts_s >= midnight else self._midnights[k - 1]
+
+    def align(self, ts_s: int, tf: str) -> int:
+        """Bucket start (epoch s): session-anchored intraday, ET midnight for ``1d``."""
+        if tf == "1d":
+            return self.et_midnight(ts_s)
+        step = TF_STEP_SEC[tf]
+        anchor = self._opens[self.session_index(ts_s)]
+        return anchor + (ts_s - anchor) // step * step
+
+    def bucket_bounds(self, ts_s: int, tf: str) -> Tuple[int, int]:
+        """``[start, end)`` of the bucket holding ``ts_s``; the last intraday bucket ends at the close."""
+        if tf == "1d":
+            k = self._day(ts_s) + 1
+            if ts_s < self._midnights[k]:
+                k -= 1
+            return self._midnights[k], self._midnights[k + 1]
+        step = TF_STEP_SEC[tf]
+        i = self.session_index(ts_s)
+        anchor, close = self._opens[i], self._closes[i]
+        start = anchor + (ts_s - anchor) // step * step
+        end = start + step
+        if start < close < end:
+            end = close
+        return start, end
+
+    # -- vectorized lookups -----------------------------------------------
+
+    def _days(self, ts: np.ndarray) -> np.ndarray:
+        d = ts // DAY_S - self._day0
+        if d.size and (d.min() < 0 or d.max() >= self._ndays):
+            raise ValueError("timestamps fall outside the session calendar range")
+        return d
+
+    def session_indices(self, ts_s: Iterable[int] | np.ndarray) -> np.ndarray:
+        ts = np.asarray(ts_s, dtype=np.int64)
+        d = self._days(ts)
+        same_day = self.day_session[d]
+        started = (same_day >= 0) & (ts >= self.opens[np.maximum(same_day, 0)])
+        idx = np.where(started, same_day, self.prev_session[d])
+        if idx.size and idx.min() < 0:
+            raise ValueError("timestamps fall before the first session in the calendar")
+        return idx
+
+    def align_many(self, ts_s: Iterable[int] | np.ndarray, tf: str) -> np.ndarray:
+        """Vectorized :meth:`align` over an array of epoch seconds."""
+        ts = np.asarray(ts_s, dtype=np.int64)
+        if tf == "1d":
+            k = self._days(ts) + 1
+            midnight = self.midnights[k]
+            return np.where(ts >= midnight, midnight, self.midnights[k - 1])
+        step = TF_STEP_SEC[tf]
+        anchor = self.opens[self.session_indices(ts)]
+        return anchor + (ts - anchor) // step * step
+
+
+_calendar: Optional[SessionCalendar] = None
+
+
+def get_calendar() -> SessionCalendar:
+    """Process-wide calendar, built on first use.
+
+    Covers ``SESSION_CALENDAR_START_YEAR`` (default 2000) through two years
+    past the current one; ``SESSION_CALENDAR_SOURCE`` picks ``auto``,
+    ``exchange`` or ``static``.
+    """
+    global _calendar
+    if _calendar is None:
+        start_year = int(os.getenv("SESSION_CALENDAR_START_YEAR", "2000"))
+        end_year = datetime.now(NY).year + 2
+        source = os.getenv("SESSION_CALENDAR_SOURCE", "auto").lower()
+        _calendar = SessionCalendar.build(start_year, end_year, source)
+        logger.debug("Session calendar built from %s: %d sessions", _calendar.source, len(_calendar))
+    return _calendar
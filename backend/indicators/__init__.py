@@ -1,4 +1,5 @@
 from .engine import IndicatorEngine
+from .incremental import IncrementalSuperTrendAI
 from .supertrend_ai import SuperTrendAI
 
-__all__ = ['IndicatorEngine', 'SuperTrendAI']
+__all__ = ['IndicatorEngine', 'IncrementalSuperTrendAI', 'SuperTrendAI']
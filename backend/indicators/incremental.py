@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Mapping, Sequence
+
+import numpy as np
+
+from .supertrend_ai import EPS, SuperTrendAI, SuperTrendAIResult, _alpha_from, _linspace, _to_python_value
+
+
+def _ewm_step(prev: float, value: float, alpha: float) -> float:
+  # Same recurrence (and rounding) as pandas' ``ewm(adjust=False).mean()``.
+  if prev != prev:
+    return value
+  if value != value or prev == value:
+    return prev
+  old_wt = 1.0 - alpha
+  return (old_wt * prev + alpha * value) / (old_wt + alpha)
+
+
+class IncrementalSuperTrendAI:
+  """SuperTrend-AI that keeps per-factor state so closed bars can be appended cheaply.
+
+  Feeding the same bars in one call or in several produces the same output as
+  ``IndicatorEngine`` ATR followed by ``SuperTrendAI.calculate`` on the full frame.
+  """
+
+  def __init__(
+    self,
+    model: SuperTrendAI | None = None,
+    atr_length: int = 14,
+    atr_mode: str = 'EMA',
+    factor_min: float = 1.5,
+    factor_max: float = 5.0,
+    factor_steps: int = 5,
+    k_clusters: int = 3,
+  ) -> None:
+    if atr_length <= 0:
+      raise ValueError('ATR length must be positive')
+    self.model = model or SuperTrendAI()
+    self.atr_alpha = 2.0 / (atr_length + 1.0) if atr_mode.upper() == 'EMA' else 1.0 / float(atr_length)
+    self.perf_alpha = _alpha_from(self.model.perf_alpha)
+    self.denom_alpha = _alpha_from(self.model.denom_span)
+    self.k_clusters = max(1, int(k_clusters))
+    self.candidates = _linspace(factor_min, factor_max, max(1, int(factor_steps)))
+
+    width = len(self.candidates)
+    self.time: list[int] = []
+    self.close: list[float] = []
+    self._lines = np.empty((0, width))
+    self._dirs = np.empty((0, width), dtype=int)
+    self._upper = np.full(width, np.nan)
+    self._lower = np.full(width, np.nan)
+    self._trend = np.zeros(width, dtype=int)
+    self._perf = np.zeros(width)
+    self._atr = np.nan
+    self._denom = np.nan
+    self._result: SuperTrendAIResult | None = None
+
+  @property
+  def last_time(self) -> int | None:
+    return self.time[-1] if self.time else None
+
+  def __len__(self) -> int:
+    return len(self.time)
+
+  def update(self, bars: Sequence[Mapping[str, Any]]) -> int:
+    """Append bars newer than ``last_time`` (dicts with time/high/low/close); return the count."""
+    last = self.last_time
+    fresh = sorted(
+      (bar for bar in bars if last is None or int(bar['time']) > last),
+      key=lambda bar: int(bar['time']),
+    )
+    if not fresh:
+      return 0
+
+    width = len(self.candidates)
+    lines = np.full((len(fresh), width), np.nan)
+    dirs = np.zeros((len(fresh), width), dtype=int)
+    prev_line = self._lines[-1] if len(self._lines) else np.full(width, np.nan)
+    for row, bar in enumerate(fresh):
+      high = float(bar['high'])
+      low = float(bar['low'])
+      close = float(bar['close'])
+      prev_close = self.close[-1] if self.close else close
+      tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
+      self._atr = _ewm_step(self._atr, tr, self.atr_alpha)
+
+      if self.close:
+        self._denom = _ewm_step(self._denom, abs(close - prev_close), self.denom_alpha)
+        anchor = np.where(np.isfinite(prev_line), prev_line, prev_close)
+        bias = np.sign(prev_close - anchor)
+        delta = close - prev_close
+        instant = np.where(bias == 0, delta, delta * bias)
+        self._perf = self._perf + self.perf_alpha * (instant - self._perf)
+
+      if np.isfinite(self._atr):
+        basis = (high + low) / 2.0
+        up0 = basis + self.candidates * self._atr
+        lo0 = basis - self.candidates * self._atr
+        up = np.where(np.isfinite(self._upper), np.minimum(up0, self._upper), up0)
+        lo = np.where(np.isfinite(self._lower), np.maximum(lo0, self._lower), lo0)
+        self._upper = up
+        self._lower = lo
+        above = close > up
+        below = close < lo
+        bull = np.where(below & ~above, -1, 1)
+        bear = np.where(above & ~below, 1, -1)
+        self._trend = np.where(self._trend >= 0, bull, bear)
+        dirs[row] = self._trend
+        lines[row] = np.where(self._trend == 1, lo, up)
+
+      prev_line = lines[row]
+      self.time.append(int(bar['time']))
+      self.close.append(close)
+
+    self._lines = np.concatenate([self._lines, lines])
+    self._dirs = np.concatenate([self._dirs, dirs])
+    self._result = None
+    return len(fresh)
+
+  def _choose(self) -> tuple[Dict[str, Any], int]:
+    model = self.model
+    perfs = self._perf.tolist()
+    groups = model._group_clusters(model._kmeans(perfs, self.k_clusters), perfs)
+    scored = sorted(groups, key=lambda row: row['mean'])
+    if model.from_cluster == 'Worst':
+      chosen = scored[0]
+    elif model.from_cluster == 'Average':
+      chosen = scored[len(scored) // 2]
+    else:
+      chosen = scored[-1]
+    return chosen, model._select_factor_index(chosen, perfs, model.from_cluster)
+
+  def result(self) -> SuperTrendAIResult:
+    if self._result is not None:
+      return self._result
+    if not self.time:
+      return SuperTrendAIResult(raw_supertrend=[], ama_supertrend=[], direction=[], signals=[], factor=float('nan'))
+
+    model = self.model
+    chosen, idx = self._choose()
+    time = np.asarray(self.time, dtype=int)
+    close = np.asarray(self.close, dtype=float)
+    line = self._lines[:, idx]
+    direction = self._dirs[:, idx]
+    self._result = SuperTrendAIResult(
+      raw_supertrend=model._format_line(time, line),
+      ama_supertrend=model._compute_ama(time, line, close, chosen['mean']) if model.use_ama else None,
+      direction=direction.astype(int).tolist(),
+      signals=model._signals(time, line, direction),
+      factor=float(round(self.candidates[idx], 6)),
+    )
+    return self._result
+
+  def latest(self) -> Dict[str, Any] | None:
+    """The newest point of :meth:`result` (line, AMA, direction, signal) in O(factors)."""
+    if not self.time:
+      return None
+    chosen, idx = self._choose()
+    line = self._lines[:, idx]
+    direction = self._dirs[:, idx]
+    value = line[-1]
+    ama = None
+    if self.model.use_ama and np.isfinite(value):
+      denom = self._denom if np.isfinite(self._denom) else 1.0
+      alpha = min(0.9, max(0.02, max(0.0, chosen['mean']) / (denom + EPS)))
+      prev = line[-2] if len(line) > 1 and np.isfinite(line[-2]) else value
+      ama = float(prev + alpha * (value - prev))
+    signal = None
+    if len(direction) > 1 and direction[-1] != direction[-2] and direction[-2] != 0:
+      signal = {'time': self.time[-1], 'price': _to_python_value(value), 'dir': 1 if direction[-1] > 0 else -1}
+    return {
+      'time': self.time[-1],
+      'value': _to_python_value(value),
+      'ama': ama,
+      'direction': int(direction[-1]),
+      'signal': signal,
+      'factor': float(round(self.candidates[idx], 6)),
+    }
+
+  def trim(self, keep: int) -> None:
+    """Drop all but the newest ``keep`` bars; later updates are unaffected."""
+    drop = len(self.time) - max(1, keep)
+    if drop <= 0:
+      return
+    del self.time[:drop]
+    del self.close[:drop]
+    self._lines = self._lines[drop:]
+    self._dirs = self._dirs[drop:]
+    self._result = None
+
+  def to_dict(self) -> Dict[str, Any]:
+    return dict(self.result().__dict__)
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import pytest
+
+from backend.app.gapfill import StaticHistory
+from backend.app.hub import Hub
+from backend.app.providers.alpaca_ws import AlpacaStreamClient, parse_timestamp_ms
+
+UTC = timezone.utc
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("2024-03-10T14:30:00Z", datetime(2024, 3, 10, 14, 30, tzinfo=UTC)),
+        ("2024-02-29T23:59:59.999999999Z", datetime(2024, 2, 29, 23, 59, 59, 999000, tzinfo=UTC)),
+        ("1999-12-31T09:30:00.5Z", datetime(1999, 12, 31, 9, 30, 0, 500000, tzinfo=UTC)),
+        (
+            "2021-02-22T10:51:00.123-05:00",
+            datetime(2021, 2, 22, 10, 51, 0, 123000, tzinfo=timezone(timedelta(hours=-5))),
+        ),
+    ],
+)
+def test_parse_timestamp_ms_matches_datetime(value: str, expected: datetime) -> None:
+    assert parse_timestamp_ms(value) == int(expected.timestamp() * 1000)
+
+
+class FakeUpstream:
+    def __init__(self) -> None:
+        self.sent: List[dict] = []
+
+    async def send(self, data: str) -> None:
+        self.sent.append(json.loads(data))
+
+
+@pytest.fixture
+def alpaca_env(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("ALPACA_KEY_ID", "key")
+    monkeypatch.setenv("ALPACA_SECRET_KEY", "secret")
+
+
+@pytest.mark.asyncio
+async def test_upstream_subscriptions_follow_hub_demand(alpaca_env: None) -> None:
+    hub = Hub(queue_size=8)
+    hub.subscribe("early", "MSFT", "1m")
+    client = AlpacaStreamClient(hub, ["SPY"], debounce_s=0.01, linger_s=0.0)
+    upstream = client._ws = FakeUpstream()
+    await client.sync()
+    both = ["MSFT", "SPY"]
+    assert upstream.sent == [{"action": "subscribe", "bars": both, "trades": both}]
+
+    # Two timeframes of one symbol are one upstream subscription, sent once after the debounce.
+    hub.subscribe("a", ["AAPL", "TSLA"], "1m", "x")
+    hub.subscribe("b", "AAPL", "5m", "y")
+    await asyncio.sleep(0.05)
+    both = ["AAPL", "TSLA"]
+    assert upstream.sent[1:] == [{"action": "subscribe", "bars": both, "trades": both}]
+
+    hub.unsubscribe("a", "x")
+    await asyncio.sleep(0.05)
+    assert upstream.sent[2:] == [{"action": "unsubscribe", "bars": ["TSLA"], "trades": ["TSLA"]}]
+    assert client.refs == {"MSFT": 1, "AAPL": 1}
+
+
+@pytest.mark.asyncio
+async def test_frame_is_published_as_one_batch(alpaca_env: None) -> None:
+    hub = Hub(queue_size=8)
+    client = AlpacaStreamClient(hub, ["AAPL"], channels=["bars", "trades", "quotes"])
+    frame = json.dumps(
+        [
+            {"T": "t", "S": "AAPL", "p": 10.0, "s": 5, "t": "2024-03-11T14:30:01.5Z"},
+            {"T": "q", "S": "AAPL", "bp": 10.2, "ap": 10.4, "t": "2024-03-11T14:30:02Z"},
+            {"T": "t", "S": "AAPL", "p": 9.5, "s": 1, "t": "2024-03-11T14:30:03Z"},
+            {"T": "subscription", "trades": ["AAPL"]},
+            {"T": "t", "S": "AAPL", "t": "not a time"},
+        ]
+    )
+    batches: List[int] = []
+    publish = hub.publish_batch
+
+    def counting(updates, **kw):
+        batches.append(len(updates))
+        return publish(updates, **kw)
+
+    hub.publish_batch = counting
+
+    assert client.handle_frame(frame) == 2
+    assert batches == [2]
+    (bar,) = hub.bars.last("AAPL", "1m").tolist()
+    assert bar[1:] == (10.0, 10.0, 9.5, 9.5, 6.0)  # the quote mid stays out of the bar
+    assert client.quotes["AAPL"] == (10.2, 10.4, parse_timestamp_ms("2024-03-11T14:30:02Z"))
+
+
+@pytest.mark.asyncio
+async def test_late_final_bar_replaces_trades_of_its_minute(alpaca_env: None) -> None:
+    hub = Hub(queue_size=8)
+    client = AlpacaStreamClient(hub, ["AAPL"])
+    writes: List[tuple] = []
+    hub.add_bar_sink(lambda e: writes.append((e.tf, e.start_ms, e.h, e.v, e.closed)))
+    t0 = parse_timestamp_ms("2024-03-11T14:30:00Z")
+    trade = {"T": "t", "S": "AAPL", "s": 1}
+    client.handle_frame(json.dumps([{**trade, "p": 10.0, "t": "2024-03-11T14:30:10Z"}]))
+    # The next minute's first trade arrives before Alpaca's bar for 14:30.
+    client.handle_frame(json.dumps([{**trade, "p": 10.1, "t": "2024-03-11T14:31:00.2Z"}]))
+    final = {"T": "b", "S": "AAPL", "o": 9.9, "h": 10.6, "l": 9.8, "c": 10.05, "v": 900}
+    client.handle_frame(json.dumps([{**final, "t": "2024-03-11T14:30:00Z"}]))
+
+    assert ("1m", t0, 10.6, 900.0, True) in writes
+    rows = hub.bars.last("AAPL", "1m").tolist()
+    assert [r[0] for r in rows] == [t0, t0 + 60_000]
+    assert rows[0][1:] == (9.9, 10.6, 9.8, 10.05, 900.0)
+    (five,) = hub.bars.last("AAPL", "5m").tolist()
+    assert five[1:] == (9.9, 10.6, 9.8, 10.1, 901.0)  # still open, now built on the bar
+
+
+@pytest.mark.asyncio
+async def test_reconnect_backfills_only_the_missed_bars(alpaca_env: None) -> None:
+    t0 = parse_timestamp_ms("2024-03-11T14:30:00Z")
+    history = StaticHistory(
+        {
+            "AAPL": [
+                {"time": t0 + i * 60_000, "open": 1, "high": 2, "low": 1, "close": 2, "volume": 5}
+                for i in range(-5, 10)
+            ]
+        }
+    )
+    hub = Hub(queue_size=8)
+    client = AlpacaStreamClient(hub, ["AAPL"], history=history)
+    bar = {"T": "b", "S": "AAPL", "o": 1, "h": 1, "l": 1, "c": 1, "v": 1}
+    client.handle_frame(json.dumps([{**bar, "t": "2024-03-11T14:30:00Z"}]))
+    client.active = {"AAPL"}
+
+    # Reconnected 4.5 minutes later: 14:30 (cut short) to 14:33 are refetched.
+    assert await client.backfill_gaps(now_ms=t0 + 270_000) == 4
+    assert history.calls == [("AAPL", t0, t0 + 240_000)]
+    assert hub.bars.last("AAPL", "1m")["ts"].tolist() == [t0 + i * 60_000 for i in range(4)]
+    assert hub.bars.last("AAPL", "1m")["c"].tolist() == [2.0] * 4
+
+    # Nothing left to fill until another whole bar is missed.
+    assert await client.backfill_gaps(now_ms=t0 + 290_000) == 0
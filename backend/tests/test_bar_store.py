@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import numpy as np
+
+from backend.app.bar_store import BarStore, RingBuffer
+
+
+def test_ring_buffer_wraps_and_last_is_a_view() -> None:
+    buf = RingBuffer(max_capacity=8, initial=2)
+    for i in range(11):
+        buf.append(i, i, i, i, i, i)
+    buf.update_last(10, 10, 12, 9, 11, 5)
+
+    assert (len(buf), buf.capacity, buf.last_ts) == (8, 8, 10)
+    tail = buf.last(5)
+    assert np.shares_memory(tail, buf.data)
+    assert tail["ts"].tolist() == [6, 7, 8, 9, 10]
+    assert tail[-1].tolist() == (10, 10.0, 12.0, 9.0, 11.0, 5.0)
+    assert buf.last()["ts"].tolist() == list(range(3, 11))
+
+
+def test_store_upserts_by_bucket_and_evicts_least_recent() -> None:
+    one = RingBuffer(4).nbytes
+    store = BarStore(capacity=4, max_bytes=2 * one)
+    store.upsert("AAPL", "1m", 60, 1, 1, 1, 1, 1)
+    store.upsert("AAPL", "1m", 60, 1, 2, 1, 2, 3, closed=True)
+    store.upsert("AAPL", "1m", 0, 9, 9, 9, 9, 9)  # older bucket: ignored
+    store.upsert("MSFT", "1m", 60, 1, 1, 1, 1, 1)
+    assert store.last("AAPL", "1m").tolist() == [(60, 1.0, 2.0, 1.0, 2.0, 3.0)]
+    assert store.get("AAPL", "1m").last_closed
+
+    store.upsert("TSLA", "1m", 60, 1, 1, 1, 1, 1)
+    assert store.get("AAPL", "1m") is None
+    assert store.stats()["evictions"] == 1
+    assert store.nbytes <= store.max_bytes
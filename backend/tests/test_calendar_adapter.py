@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 from typing import Any, Dict, List, Optional
 
 import pytest
@@ -150,3 +151,188 @@ def test_calendar_router_uses_cache(monkeypatch: pytest.MonkeyPatch) -> None:
     assert resp2.status_code == 200
     assert resp2.json() == payload
     assert fetch_calls["count"] == 1  # served from cache
+
+
+class _FlakyClient:
+    def __init__(self, data: List[Dict[str, Any]], failures: int) -> None:
+        self.data = data
+        self.failures = failures
+        self.calls = 0
+
+    async def get(self, url: str, params: Dict[str, Any], headers: Dict[str, Any]):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise forexfactory.httpx.ConnectError("connection reset")
+        return _DummyResponse(self.data)
+
+
+@pytest.mark.asyncio
+async def test_fetch_calendar_retries_transient_errors_on_injected_client(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(forexfactory.random, "uniform", lambda a, b: 0.0)
+    payload = [{"id": "1", "time": 1_700_000_000, "title": "CPI", "impact": "High"}]
+
+    client = _FlakyClient(payload, failures=2)
+    result = await forexfactory.fetch_calendar(1_700_000_000, 1_700_003_600, client=client)
+    assert client.calls == 3 and [e["id"] for e in result] == ["1"]
+
+    hopeless = _FlakyClient(payload, failures=10)
+    with pytest.raises(forexfactory.httpx.ConnectError):
+        await forexfactory.fetch_calendar(1_700_000_000, 1_700_003_600, client=hopeless)
+    assert hopeless.calls == forexfactory.settings.CALENDAR_HTTP_RETRIES + 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_upstream_call(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    payload = [{"id": "evt-1", "source": "forexfactory", "ts": 1700000000}]
+    release = asyncio.Event()
+    fetch_calls = {"count": 0}
+
+    async def no_cache(key: str) -> None:
+        return None
+
+    async def skip_set(key: str, value: List[Dict[str, Any]]) -> None:
+        return None
+
+    async def slow_fetch(*args: Any, **kwargs: Any) -> List[Dict[str, Any]]:
+        fetch_calls["count"] += 1
+        await release.wait()
+        return payload
+
+    monkeypatch.setattr(calendar_router, "_cache_get", no_cache)
+    monkeypatch.setattr(calendar_router, "_cache_set", skip_set)
+    monkeypatch.setattr(calendar_router, "fetch_calendar", slow_fetch)
+    calendar_router._breaker.reset()
+    coalesced = calendar_router.calendar_coalesced.labels("local")
+    before = coalesced.value
+
+    requests = [
+        asyncio.ensure_future(calendar_router.calendar(1700000000, 1700003600, None, None))
+        for _ in range(5)
+    ]
+    other = asyncio.ensure_future(calendar_router.calendar(1700000000, 1700007200, None, None))
+    await asyncio.sleep(0)
+    requests[0].cancel()  # a disconnecting caller does not cancel the shared load
+    release.set()
+
+    results = await asyncio.gather(*requests[1:], other)
+    assert all(r == payload for r in results)
+    assert fetch_calls["count"] == 2  # one per distinct cache key
+    assert coalesced.value - before == 4
+    assert calendar_router._inflight == {}
+
+
+def test_calendar_assembles_day_partitions_and_filters_after_lookup(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    day = 1_699_920_000  # 2023-11-14 00:00 UTC
+    upstream = [
+        {"id": "a", "ts": day + 3_600, "country": "US", "impact": "high"},
+        {"id": "b", "ts": day + 7_200, "country": "EU", "impact": "low"},
+        {"id": "c", "ts": day + 86_400 + 3_600, "country": "US", "impact": "medium"},
+    ]
+    cache_store: Dict[str, List[Dict[str, Any]]] = {}
+    fetches: List[tuple] = []
+
+    async def fake_cache_get(key: str) -> Optional[List[Dict[str, Any]]]:
+        return cache_store.get(key)
+
+    async def fake_cache_set(key: str, value: List[Dict[str, Any]]) -> None:
+        cache_store[key] = value
+
+    async def fake_fetch(start: int, end: int, countries, min_impact) -> List[Dict[str, Any]]:
+        fetches.append((start, end, countries, min_impact))
+        return [e for e in upstream if start <= e["ts"] <= end]
+
+    monkeypatch.setattr(calendar_router, "_cache_get", fake_cache_get)
+    monkeypatch.setattr(calendar_router, "_cache_set", fake_cache_set)
+    monkeypatch.setattr(calendar_router, "fetch_calendar", fake_fetch)
+    calendar_router._breaker.reset()
+    app = FastAPI()
+    app.include_router(calendar_router.router)
+    client = TestClient(app)
+
+    def ids(**params: Any) -> List[str]:
+        resp = client.get("/v1/calendar", params=params)
+        assert resp.status_code == 200
+        return [e["id"] for e in resp.json()]
+
+    # Sliding windows within one day share its partition; filters apply afterwards.
+    assert ids(start=day, end=day + 5_000) == ["a"]
+    assert ids(start=day + 60, end=day + 9_000) == ["a", "b"]
+    assert ids(start=day, end=day + 9_000, countries="eu") == ["b"]
+    assert ids(start=day, end=day + 9_000, min_impact="medium") == ["a"]
+    assert fetches == [(day, day + 86_399, None, None)]
+
+    # A window reaching into the next day only fetches that day.
+    assert ids(start=day + 3_000, end=day + 90_000) == ["a", "b", "c"]
+    assert fetches[1:] == [(day + 86_400, day + 2 * 86_400 - 1, None, None)]
+    assert len(cache_store) == 2
+
+
+class _FakeRedis:
+    def __init__(self) -> None:
+        self.store: Dict[str, bytes] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.store.get(key)
+
+    async def set(self, key: str, value: bytes, ex: Optional[int] = None) -> None:
+        assert isinstance(value, bytes)
+        self.store[key] = value
+
+
+@pytest.mark.asyncio
+async def test_stale_partitions_are_served_then_refreshed_in_background(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    day = 1_699_920_000
+    key = calendar_router._partition_key(calendar_router._partition_of(day))
+    versions = [[{"id": "a", "ts": day + 60, "actual": None}]]
+    fetches: List[tuple] = []
+    redis = _FakeRedis()
+
+    async def fake_redis() -> _FakeRedis:
+        return redis
+
+    async def fake_fetch(start: int, end: int, countries, min_impact) -> List[Dict[str, Any]]:
+        fetches.append((start, end))
+        return versions[-1]
+
+    monkeypatch.setattr(calendar_router, "_redis", fake_redis)
+    monkeypatch.setattr(calendar_router, "fetch_calendar", fake_fetch)
+    calendar_router._breaker.reset()
+    calendar_router._last_good_cache.clear()
+
+    assert await calendar_router.calendar(day, day + 3_600, None, None) == versions[0]
+    assert len(fetches) == 1 and len(redis.store[key]) > 0
+    assert not redis.store[key].startswith(b"{")  # compressed on the wire
+
+    # A fresh worker (empty LRU) is answered by Redis.
+    calendar_router._last_good_cache.clear()
+    assert await calendar_router.calendar(day, day + 3_600, None, None) == versions[0]
+    assert len(fetches) == 1
+
+    # Past the TTL the old copy is returned at once and refreshed behind it.
+    old = calendar_router.time.time()
+    backdated = old - calendar_router.settings.CALENDAR_CACHE_TTL_S - 1
+    calendar_router._last_good_cache.put(key, versions[0], backdated)
+    versions.append([{"id": "a", "ts": day + 60, "actual": "3.1%"}])
+    assert await calendar_router.calendar(day, day + 3_600, None, None) == versions[0]
+    await asyncio.gather(*calendar_router._revalidating)
+    assert len(fetches) == 2
+    stored_at, events = calendar_router._last_good_cache.entry(key)  # type: ignore[misc]
+    assert stored_at >= old and events == versions[1]
+    assert await calendar_router.calendar(day, day + 3_600, None, None) == versions[1]
+
+
+def test_bounded_cache_evicts_least_recently_used() -> None:
+    cache = calendar_router.BoundedCache(2)
+    cache.put("a", [])
+    cache.put("b", [])
+    assert cache.get("a") == []  # touch: "b" is now the oldest
+    cache.put("c", [])
+    assert len(cache) == 2 and cache.get("b") is None and cache.get("a") == []
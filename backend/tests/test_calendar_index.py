@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from backend.app.calendar_index import CalendarSync, EventIndex
+from backend.app.routers import calendar as calendar_router
+
+NOW = 1_700_000_000
+DAY = 86_400
+
+
+def _event(event_id: str, ts: int, country: str = "US", impact: str = "high", **extra: Any):
+    return {"id": event_id, "ts": ts, "country": country, "impact": impact, **extra}
+
+
+class Upstream:
+    def __init__(self, events: List[Dict[str, Any]]) -> None:
+        self.events = events
+        self.calls: List[tuple] = []
+
+    async def __call__(
+        self, start: int, end: int, countries: Optional[List[str]], min_impact: Optional[str]
+    ) -> List[Dict[str, Any]]:
+        self.calls.append((start, end))
+        return [dict(e) for e in self.events if start <= e["ts"] <= end]
+
+
+def test_index_queries_match_the_router_filter() -> None:
+    events = [
+        _event("a", NOW, "US", "high"),
+        _event("b", NOW + 60, "EU", "low"),
+        _event("c", NOW + 120, "GB", "medium"),
+        _event("d", NOW + 120, "US", "unknown"),
+        _event("e", NOW + 500, "EU", "high"),
+    ]
+    index = EventIndex()
+    assert index.apply(events, NOW - DAY, NOW + DAY) == (events, [])
+    assert index.covers(NOW, NOW + 1_000) and not index.covers(NOW - 2 * DAY, NOW)
+
+    for start, end in [(NOW, NOW + 500), (NOW + 1, NOW + 120), (NOW + 121, NOW + 499)]:
+        for countries in [None, "us", "eu,gb", " , "]:
+            for min_impact in [None, "low", "medium", "high"]:
+                expected = calendar_router._filter(events, start, end, countries, min_impact)
+                got = index.query(start, end, calendar_router._countries(countries), min_impact)
+                assert [e["id"] for e in got] == [e["id"] for e in expected]
+
+
+@pytest.mark.asyncio
+async def test_sync_fetches_deltas_and_reports_only_changes() -> None:
+    upstream = Upstream(
+        [_event("cpi", NOW + 3_600), _event("nfp", NOW + 5 * DAY), _event("old", NOW - 3 * DAY)]
+    )
+    index = EventIndex()
+    sync = CalendarSync(index, upstream, back_s=2 * DAY, ahead_s=7 * DAY, hot_s=3_600 * 6)
+    reported: List[List[Dict[str, Any]]] = []
+    sync.add_listener(lambda changed, removed: reported.append(changed))
+
+    first = await sync.sync_once(NOW)
+    assert [e["id"] for e in first] == ["cpi", "nfp"]
+    assert upstream.calls == [(NOW - 2 * DAY, NOW + 7 * DAY)]
+
+    # Nothing changed upstream: the hot span is refetched, nothing is reported.
+    assert await sync.sync_once(NOW) == []
+    assert upstream.calls[1] == (NOW - 6 * 3_600, NOW + 6 * 3_600)
+    assert reported == []  # the first pass is only the baseline
+
+    # An actual lands and a new day enters the window an hour later.
+    upstream.events[0]["actual"] = "3.2%"
+    upstream.events.append(_event("gdp", NOW + 7 * DAY + 1_800))
+    changed = await sync.sync_once(NOW + 3_600)
+    assert [e["id"] for e in changed] == ["cpi", "gdp"] and reported == [changed]
+    assert upstream.calls[-1] == (NOW + 7 * DAY + 1, NOW + 7 * DAY + 3_600)
+    assert index.coverage == (NOW + 3_600 - 2 * DAY, NOW + 7 * DAY + 3_600)
+    assert index.query(NOW, NOW + 3_600)[0]["actual"] == "3.2%"
+
+    # Withdrawn upstream: gone from the index and reported as removed.
+    withdrawn: List[Dict[str, Any]] = []
+    sync.add_listener(lambda changed, removed: withdrawn.extend(removed))
+    del upstream.events[0]
+    assert await sync.sync_once(NOW + 3_600) == []
+    assert [e["id"] for e in withdrawn] == ["cpi"] and index.query(NOW, NOW + 3_600) == []
+
+
+@pytest.mark.asyncio
+async def test_router_answers_from_index_and_falls_back_outside_it(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    upstream = Upstream([_event("cpi", NOW + 60, "US", "high"), _event("x", NOW - 10 * DAY)])
+
+    async def no_cache(key: str) -> None:
+        return None
+
+    async def skip_set(key: str, value: List[Dict[str, Any]]) -> None:
+        return None
+
+    monkeypatch.setattr(calendar_router, "_cache_get", no_cache)
+    monkeypatch.setattr(calendar_router, "_cache_set", skip_set)
+    monkeypatch.setattr(calendar_router, "fetch_calendar", upstream)
+    monkeypatch.setattr(calendar_router, "_index", EventIndex())
+    calendar_router._breaker.reset()
+
+    sync = CalendarSync(calendar_router._index, calendar_router._index_source, back_s=DAY)
+    monkeypatch.setattr(calendar_router, "_sync", sync)
+    await sync.sync_once(NOW)
+    calls = len(upstream.calls)
+
+    assert await calendar_router.calendar(NOW, NOW + DAY, "us", "medium") == upstream.events[:1]
+    assert len(upstream.calls) == calls
+
+    outside = await calendar_router.calendar(NOW - 10 * DAY, NOW - 10 * DAY + 60, None, None)
+    assert [e["id"] for e in outside] == ["x"] and len(upstream.calls) == calls + 1
+
+    # A sync that has stopped succeeding no longer answers: the caches (here
+    # straight upstream) see the actual the frozen index would have missed.
+    upstream.events[0]["actual"] = "3.2%"
+    sync.last_sync -= 4 * sync.interval_s
+    stale = await calendar_router.calendar(NOW, NOW + DAY, "us", "medium")
+    assert stale[0]["actual"] == "3.2%" and len(upstream.calls) == calls + 2
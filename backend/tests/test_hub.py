@@ -0,0 +1,525 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from typing import List
+
+import pytest
+
+from backend.app.broker import InMemoryBroker, InMemoryBus
+from backend.app.calendar_index import CalendarSync, EventIndex
+from backend.app.hub import Hub
+from backend.app.protocol import BAR_STRUCT, decode_binary
+
+TICK = {"ts": 1_700_000_000_000, "o": 1.0, "h": 2.0, "l": 0.5, "c": 1.5, "v": 10}
+
+
+class FakeWebSocket:
+    def __init__(self, blocked: bool = False) -> None:
+        self.sent: List[str] = []
+        self.binary: List[bytes] = []
+        self.closed_code: int | None = None
+        self.gate = asyncio.Event()
+        if not blocked:
+            self.gate.set()
+
+    async def accept(self) -> None:
+        return None
+
+    async def send_text(self, data: str) -> None:
+        await self.gate.wait()
+        self.sent.append(data)
+
+    async def send_bytes(self, data: bytes) -> None:
+        await self.gate.wait()
+        self.binary.append(data)
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed_code = code
+
+
+async def _drain() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_block_fast_client() -> None:
+    hub = Hub(queue_size=2, policy="drop_oldest")
+    fast, slow = FakeWebSocket(), FakeWebSocket(blocked=True)
+    for ws in (fast, slow):
+        await hub.connect(ws)
+        hub.subscribe(ws, "AAPL", "1m")
+
+    for i in range(5):
+        await hub.publish_tick("AAPL", "1m", {**TICK, "c": float(i)})
+        await _drain()
+
+    bars = [json.loads(m) for m in fast.sent if json.loads(m)["type"] == "bar"]
+    assert [b["c"] for b in bars] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert hub.clients[slow].depth == 2
+    assert hub.stats["dropped"] == 3
+
+    slow.gate.set()
+    await _drain()
+    assert json.loads(slow.sent[0])["type"] == "hello"
+    slow_bars = [json.loads(m) for m in slow.sent if json.loads(m)["type"] == "bar"]
+    assert [b["c"] for b in slow_bars] == [3.0, 4.0]
+
+
+@pytest.mark.asyncio
+async def test_conflate_keeps_latest_open_bar() -> None:
+    hub = Hub(queue_size=8, policy="conflate")
+    ws = FakeWebSocket(blocked=True)
+    await hub.connect(ws)
+    hub.subscribe(ws, "AAPL", "1m")
+    for i in range(4):
+        await hub.publish_tick("AAPL", "1m", {**TICK, "c": float(i)})
+    assert hub.clients[ws].depth == 2  # hello + one conflated bar
+    assert hub.stats["conflated"] == 3
+
+    ws.gate.set()
+    await _drain()
+    assert json.loads(ws.sent[-1])["c"] == 3.0
+
+
+@pytest.mark.asyncio
+async def test_conflate_never_moves_an_update_ahead_of_a_close() -> None:
+    hub = Hub(queue_size=3, policy="conflate")
+    ws = FakeWebSocket(blocked=True)
+    await hub.connect(ws)
+    hub.subscribe(ws, "AAPL", "5m")
+    start = 1_700_058_600_000
+    await hub.publish_tick("AAPL", "5m", {**TICK, "ts": start})
+    await hub.publish_tick("AAPL", "5m", {**TICK, "ts": start, "c": 1.8}, final=True)
+    await hub.publish_tick("AAPL", "5m", {**TICK, "ts": start + 300_000})
+    await hub.publish_tick("AAPL", "5m", {**TICK, "ts": start + 300_000, "c": 1.9})
+    # Full: the first update made room; the next bucket's two updates conflated.
+    assert hub.clients[ws].depth == 3 and hub.stats["conflated"] == 1
+
+    ws.gate.set()
+    await _drain()
+    bars = [m for m in map(json.loads, ws.sent) if m["type"] == "bar"]
+    assert [(b["tsStart"], b["barClose"], b["seq"]) for b in bars] == [
+        (start, True, 2),
+        (start + 300_000, False, 4),
+    ]
+    assert bars[-1]["c"] == 1.9
+
+
+@pytest.mark.asyncio
+async def test_disconnect_policy_drops_slow_client() -> None:
+    hub = Hub(queue_size=1, policy="disconnect")
+    ws = FakeWebSocket(blocked=True)
+    await hub.connect(ws)
+    hub.subscribe(ws, "AAPL", "1m")
+    await hub.publish_tick("AAPL", "1m", TICK)
+    await _drain()
+    assert ws not in hub.clients
+    assert ws.closed_code == 1013
+    assert hub.stats["slow_disconnects"] == 1
+
+
+@pytest.mark.asyncio
+async def test_unsubscribe_by_id_and_wildcard() -> None:
+    hub = Hub(queue_size=8)
+    a, b = FakeWebSocket(), FakeWebSocket()
+    await hub.connect(a)
+    await hub.connect(b)
+    sub_multi = hub.subscribe(a, ["aapl", "MSFT"], "1m", "watch")
+    sub_single = hub.subscribe(a, "AAPL", "1m", "chart")
+    hub.subscribe(b, "*", "1m")
+
+    assert sub_multi.symbols == ["AAPL", "MSFT"]
+    assert hub.registry.subscribers("AAPL", "1m") == {a, b}
+    assert hub.registry.subscribers("TSLA", "1m") == {b}
+
+    hub.unsubscribe(a, "watch")
+    assert hub.registry.subscribers("AAPL", "1m") == {a, b}  # "chart" still holds AAPL
+    assert hub.registry.subscribers("MSFT", "1m") == {b}
+    assert [s.id for s in hub.registry.subscriptions(a)] == [sub_single.id]
+
+    hub.disconnect(a)
+    assert a not in hub.registry.reverse
+    assert hub.registry.active_keys() == [("*", "1m")]
+
+    with pytest.raises(ValueError):
+        hub.subscribe(b, "AAPL", "2m")
+
+
+@pytest.mark.asyncio
+async def test_reusing_an_id_only_touches_the_keys_that_changed() -> None:
+    hub = Hub(queue_size=8)
+    a = FakeWebSocket()
+    await hub.connect(a)
+    demand: list = []
+    hub.add_demand_listener(lambda key, added: demand.append((key[0], added)))
+
+    hub.subscribe(a, ["AAPL", "MSFT"], "1m", "watch", max_rate=2)
+    assert hub.clients[a].throttle[("MSFT", "1m")] == 0.5
+    hub.subscribe(a, ["MSFT", "TSLA"], "1m", "watch")
+    assert demand == [("AAPL", True), ("MSFT", True), ("TSLA", True), ("AAPL", False)]
+    assert hub.registry.active_keys() == [("MSFT", "1m"), ("TSLA", "1m")]
+    # The replacement has no rate limit, so MSFT's is lifted.
+    assert hub.clients[a].throttle == {}
+
+    hub.unsubscribe(a, "watch")
+    assert demand[4:] == [("MSFT", False), ("TSLA", False)] and hub.registry.forward == {}
+
+
+@pytest.mark.asyncio
+async def test_broker_routes_only_subscribed_keys_to_workers() -> None:
+    bus = InMemoryBus()
+    ingest = Hub(broker=InMemoryBroker(bus))
+    worker_a = Hub(broker=InMemoryBroker(bus))
+    worker_b = Hub(broker=InMemoryBroker(bus))
+    a, b = FakeWebSocket(), FakeWebSocket()
+    await worker_a.connect(a)
+    await worker_b.connect(b)
+    worker_a.subscribe(a, "AAPL", "1m")
+    worker_b.subscribe(b, "MSFT", "5m")
+
+    await ingest.publish_tick("AAPL", "1m", TICK)
+    await ingest.publish_tick("MSFT", "1m", TICK)
+    await _drain()
+
+    assert [json.loads(m)["symbol"] for m in a.sent[1:]] == ["AAPL"]
+    assert [(json.loads(m)["symbol"], json.loads(m)["tf"]) for m in b.sent[1:]] == [("MSFT", "5m")]
+    assert worker_a.broker.interest == {("AAPL", "1m")}
+
+    worker_a.disconnect(a)
+    assert worker_a.broker.interest == set()
+
+
+@pytest.mark.asyncio
+async def test_worker_demand_reaches_the_feed_hub_through_the_broker() -> None:
+    bus = InMemoryBus()
+    ingest = Hub(broker=InMemoryBroker(bus))
+    worker_a = Hub(broker=InMemoryBroker(bus))
+    worker_b = Hub(broker=InMemoryBroker(bus))
+    a, b = FakeWebSocket(), FakeWebSocket()
+    await worker_a.connect(a)
+    await worker_b.connect(b)
+    seen: list = []
+    ingest.add_demand_listener(lambda key, added: seen.append((key, added)))
+    worker_a.subscribe(a, "AAPL", "1m")
+    assert seen == [(("AAPL", "1m"), True)]
+
+    # Each key counts once across workers and goes away with its last one.
+    sub = worker_b.subscribe(b, "AAPL", "1m")
+    worker_b.subscribe(b, "MSFT", "1m")
+    worker_a.disconnect(a)
+    assert seen[1:] == [(("MSFT", "1m"), True)]
+
+    # A worker's periodic full set repairs a lost removal...
+    worker_b.broker.publish_demand = lambda message: None
+    worker_b.unsubscribe(b, sub.id)
+    assert seen[2:] == []
+    keys = [list(key) for key in worker_b.registry.forward]
+    ingest.broker._deliver_demand({"w": worker_b.session_id, "keys": keys})
+    assert seen[2:] == [(("AAPL", "1m"), False)]
+    # ...and a worker that stops announcing is dropped.
+    expired = ingest.remote_demand.expire(time.monotonic() + 60.0)
+    assert expired == [(("MSFT", "1m"), False)]
+
+
+@pytest.mark.asyncio
+async def test_max_rate_conflates_open_bar_but_not_close() -> None:
+    hub = Hub(queue_size=16)
+    limited, free = FakeWebSocket(), FakeWebSocket()
+    await hub.connect(limited)
+    await hub.connect(free)
+    hub.subscribe(limited, "AAPL", "1m", "slow", max_rate=20)
+    hub.subscribe(free, "AAPL", "1m")
+
+    for i in range(4):
+        await hub.publish_tick("AAPL", "1m", {**TICK, "c": float(i)})
+    await _drain()
+
+    def closes(ws: FakeWebSocket) -> List[tuple]:
+        return [(m["c"], m["barClose"]) for m in map(json.loads, ws.sent) if m["type"] == "bar"]
+
+    assert closes(free) == [(0.0, False), (1.0, False), (2.0, False), (3.0, False)]
+    assert closes(limited) == [(0.0, False)]
+
+    await asyncio.sleep(0.08)
+    assert closes(limited) == [(0.0, False), (3.0, False)]
+
+    await hub.publish_tick("AAPL", "1m", {**TICK, "c": 4.0})
+    await hub.publish_tick("AAPL", "1m", {**TICK, "c": 5.0}, final=True)
+    await _drain()
+    assert closes(limited)[-1] == (5.0, True)
+    await asyncio.sleep(0.08)
+    assert closes(limited)[-1] == (5.0, True)  # held update was superseded by the close
+    await hub.close()
+
+
+def _frames(ws: FakeWebSocket, kind: str) -> List[dict]:
+    return [m for m in map(json.loads, ws.sent) if m["type"] == kind]
+
+
+@pytest.mark.asyncio
+async def test_snapshot_then_deltas_and_resume_by_seq() -> None:
+    async def loader(symbol: str, tf: str, limit: int) -> List[dict]:
+        base = TICK["ts"] // 60_000 * 60_000 - 10 * 60_000
+        return [
+            {"time": base + i * 60_000, "open": 1, "high": 1, "low": 1, "close": 1, "volume": 1}
+            for i in range(10)
+        ]
+
+    hub = Hub(queue_size=64, history_loader=loader)
+    for i in range(3):
+        await hub.publish_tick("AAPL", "1m", {**TICK, "ts": TICK["ts"] + i * 60_000}, final=True)
+
+    first = FakeWebSocket()
+    await hub.connect(first)
+    _, modes = await hub.subscribe_stream(first, "AAPL", "1m", snapshot=5)
+    await hub.publish_tick("AAPL", "1m", {**TICK, "ts": TICK["ts"] + 3 * 60_000})
+    await _drain()
+
+    assert modes == {"AAPL": "snapshot"}
+    (snap,) = _frames(first, "snapshot")
+    assert len(snap["bars"]) == 5
+    minute = TICK["ts"] // 60_000 * 60_000
+    assert [b["tsStart"] for b in snap["bars"]] == [minute + i * 60_000 for i in range(-2, 3)]
+    (delta,) = _frames(first, "bar")
+    assert delta["seq"] == snap["seq"] + 1
+    hub.disconnect(first)
+
+    for i in range(4, 6):
+        await hub.publish_tick("AAPL", "1m", {**TICK, "ts": TICK["ts"] + i * 60_000})
+
+    again = FakeWebSocket()
+    await hub.connect(again)
+    _, modes = await hub.subscribe_stream(
+        again, "AAPL", "1m", resume={"AAPL": delta["seq"]}, session_id=hub.session_id
+    )
+    await _drain()
+    assert modes == {"AAPL": "resumed"}
+    # Each new minute closes the previous one first: two events per tick.
+    assert [b["seq"] for b in _frames(again, "bar")] == list(range(delta["seq"] + 1, delta["seq"] + 5))
+
+    stale = FakeWebSocket()
+    await hub.connect(stale)
+    _, modes = await hub.subscribe_stream(stale, "AAPL", "1m", resume={"AAPL": 1}, session_id="old")
+    assert modes == {"AAPL": "snapshot"}
+
+
+@pytest.mark.asyncio
+async def test_binary_protocol_announces_symbol_ids_once() -> None:
+    hub = Hub(queue_size=16)
+    text, binary = FakeWebSocket(), FakeWebSocket()
+    await hub.connect(text)
+    await hub.connect(binary, "binary")
+    for ws in (text, binary):
+        hub.subscribe(ws, "AAPL", "1m")
+    for i in range(2):
+        await hub.publish_tick("AAPL", "1m", {**TICK, "c": float(i)})
+    await _drain()
+
+    hello = json.loads(binary.sent[0])
+    assert hello["protocol"] == "binary" and "json" in hello["protocols"]
+    (symbols,) = _frames(binary, "symbols")
+    assert len(binary.binary) == 2 and all(len(f) == BAR_STRUCT.size for f in binary.binary)
+    bar = decode_binary(binary.binary[-1])
+    assert bar["symbolId"] == symbols["symbols"]["AAPL"]
+    assert (bar["tf"], bar["c"], bar["seq"]) == ("1m", 1.0, 2)
+    assert [b["c"] for b in _frames(text, "bar")] == [0.0, 1.0]
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_never_evicts_control_frames() -> None:
+    hub = Hub(queue_size=6, policy="drop_oldest")
+    ws = FakeWebSocket(blocked=True)
+    await hub.connect(ws, "binary")
+    sub, _ = await hub.subscribe_stream(ws, ["AAPL", "MSFT", "TSLA"], "1m", "chart")
+    hub.send_json(ws, {"type": "subscribed", "id": sub.id})
+    for symbol in ("AAPL", "MSFT", "TSLA"):
+        for i in range(3):
+            await hub.publish_tick(symbol, "1m", {**TICK, "c": float(i)})
+
+    ws.gate.set()
+    await _drain()
+    types = [json.loads(m)["type"] for m in ws.sent]
+    assert types[:2] == ["hello", "subscribed"]
+    announced = {s for m in _frames(ws, "symbols") for s in m["symbols"]}
+    assert announced == {"AAPL", "MSFT", "TSLA"}
+    assert hub.stats["dropped"] > 0 and ws.binary  # only bar frames were evicted
+    ids = {decode_binary(frame)["symbolId"] for frame in ws.binary}
+    assert ids <= {hub.symbols.id(s) for s in announced}
+
+    # Once nothing but control frames fills the queue, a further bar disconnects the client.
+    tiny = Hub(queue_size=2, policy="drop_oldest")
+    slow = FakeWebSocket(blocked=True)
+    await tiny.connect(slow)
+    tiny.subscribe(slow, "AAPL", "1m")
+    tiny.send_json(slow, {"type": "subscribed", "id": "x"})
+    await tiny.publish_tick("AAPL", "1m", TICK)
+    assert slow not in tiny.clients and tiny.stats["slow_disconnects"] == 1
+
+
+@pytest.mark.asyncio
+async def test_indicator_state_is_shared_per_params_and_pushed_after_close() -> None:
+    minute = TICK["ts"] // 60_000 * 60_000
+
+    async def loader(symbol: str, tf: str, limit: int) -> List[dict]:
+        return [
+            {
+                "time": minute + i * 60_000,
+                "open": 1,
+                "high": 2 + i % 3,
+                "low": 1,
+                "close": 1.5 + i % 2,
+                "volume": 1,
+            }
+            for i in range(-40, 0)
+        ]
+
+    hub = Hub(queue_size=64, history_loader=loader)
+    spec = {"name": "supertrend_ai", "params": {"factor_steps": 3}}
+    a, b, c = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    for ws in (a, b, c):
+        await hub.connect(ws)
+    await hub.subscribe_stream(a, "AAPL", "1m", "st", indicator=spec)
+    await hub.subscribe_stream(b, "AAPL", "1m", "st", indicator=spec)
+    await hub.subscribe_stream(c, "AAPL", "1m", "st", indicator="supertrend_ai")
+    assert len(hub.indicators) == 2
+    with pytest.raises(ValueError):
+        await hub.subscribe_stream(a, "*", "1m", "all", indicator=spec)
+
+    for i in range(2):
+        await hub.publish_tick("AAPL", "1m", {**TICK, "ts": minute + i * 60_000}, final=True)
+    await _drain()
+
+    (snap,) = _frames(a, "indicatorSnapshot")
+    assert len(snap["raw_supertrend"]) == 40 and snap["params"]["factor_steps"] == 3
+    points = _frames(a, "indicator")
+    assert [p["time"] for p in points] == [minute, minute + 60_000]
+    assert points == _frames(b, "indicator")
+    assert _frames(c, "indicator")[0]["key"] != points[0]["key"]
+    # The point follows the close it was computed from.
+    kinds = [m["type"] for m in map(json.loads, a.sent)]
+    assert kinds[-2:] == ["bar", "indicator"]
+    assert hub.indicators.stats["updates"] == 4  # two states x two closes, not one per client
+
+    hub.unsubscribe(a, "st")
+    hub.disconnect(b)
+    assert len(hub.indicators) == 1
+    assert list(hub.indicators.by_conn) == [c]
+    hub.disconnect(c)
+    assert len(hub.indicators) == 0 and hub.indicators.by_conn == {}
+
+
+@pytest.mark.asyncio
+async def test_batching_collects_a_window_of_updates_into_one_frame() -> None:
+    hub = Hub(queue_size=64)
+    batched, plain, binary = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    await hub.connect(batched)
+    await hub.connect(plain)
+    await hub.connect(binary, "binary")
+    symbols = ["AAPL", "MSFT", "TSLA"]
+    for ws in (batched, plain, binary):
+        hub.subscribe(ws, symbols, "1m")
+    hub.set_batch(batched, hub.parse_batch(True))
+    hub.set_batch(binary, hub.parse_batch(20))
+    with pytest.raises(ValueError):
+        hub.parse_batch(10_000)
+    await _drain()
+
+    for symbol in symbols:
+        await hub.publish_tick(symbol, "1m", TICK)
+    await asyncio.sleep(0.05)
+
+    (batch,) = _frames(batched, "batch")
+    assert [m["symbol"] for m in batch["messages"]] == symbols
+    assert len(_frames(plain, "bar")) == 3
+    (records,) = binary.binary
+    assert len(records) == 3 * BAR_STRUCT.size
+    assert hub.stats["batches"] == 2
+
+
+@pytest.mark.asyncio
+async def test_gapfill_reaches_subscribers_as_one_frame_through_the_broker() -> None:
+    bus = InMemoryBus()
+    ingest = Hub(broker=InMemoryBroker(bus))
+    worker = Hub(broker=InMemoryBroker(bus))
+    ws = FakeWebSocket()
+    await worker.connect(ws)
+    worker.subscribe(ws, "AAPL", "1m")
+    await ingest.publish_tick("AAPL", "1m", TICK)
+    await _drain()
+
+    open_start = TICK["ts"] // 60_000 * 60_000
+    start = open_start + 60_000
+    rows = [
+        {"time": start + i * 60_000, "open": 1, "high": 3, "low": 1, "close": 2 + i, "volume": 7}
+        for i in (2, 0, 1)
+    ]
+    assert ingest.publish_gapfill("AAPL", "1m", rows) > 3  # higher timeframes roll up too
+    await _drain()
+
+    frames = [json.loads(m) for m in ws.sent[1:]]
+    assert [f["type"] for f in frames] == ["bar", "gapfill"]
+    gap = frames[1]
+    # The bar that was open when the feed dropped is closed by the first backfilled one.
+    starts = [open_start, start, start + 60_000, start + 120_000]
+    assert [b["tsStart"] for b in gap["bars"]] == starts
+    assert [b["c"] for b in gap["bars"]] == [1.5, 2, 3, 4]
+    assert all(b["barClose"] for b in gap["bars"])
+    assert gap["seq"] == worker.streams.get("AAPL", "1m").seq
+    assert worker.bars.last("AAPL", "1m")["ts"].tolist()[-1] == start + 120_000
+
+
+@pytest.mark.asyncio
+async def test_calendar_changes_are_polled_once_and_pushed_filtered() -> None:
+    now = 1_700_000_000
+    upstream = [
+        {"id": "cpi", "ts": now + 60, "country": "US", "impact": "high", "actual": None},
+        {"id": "zew", "ts": now + 90, "country": "EU", "impact": "medium", "actual": None},
+    ]
+    polls: List[tuple] = []
+
+    async def source(start: int, end: int, countries, min_impact) -> List[dict]:
+        polls.append((start, end))
+        return [dict(e) for e in upstream]
+
+    hub = Hub(queue_size=8)
+    demanded: List[bool] = []
+    hub.calendar_demand = lambda: demanded.append(True)
+    us, everything = FakeWebSocket(), FakeWebSocket()
+    await hub.connect(us)
+    await hub.connect(everything)
+    hub.subscribe_calendar(us, "us-high", "us", "high")
+    hub.subscribe_calendar(everything, "all")
+    assert demanded == [True]  # only the first subscription starts the sync
+    with pytest.raises(ValueError):
+        hub.subscribe_calendar(us, "bad", min_impact="huge")
+
+    sync = CalendarSync(EventIndex(), source, back_s=3_600, ahead_s=3_600, hot_s=600)
+    sync.add_listener(hub.publish_calendar)
+    await sync.sync_once(now)  # baseline: nothing pushed
+    upstream[0]["actual"] = "3.1%"
+    upstream[1]["actual"] = "-2.0"
+    await sync.sync_once(now)
+    await _drain()
+
+    def pushed(ws: FakeWebSocket) -> List[dict]:
+        return [m for m in map(json.loads, ws.sent) if m["type"] == "calendar"]
+
+    assert len(polls) == 2
+    assert [(m["id"], [e["id"] for e in m["events"]]) for m in pushed(us)] == [
+        ("us-high", ["cpi"])
+    ]
+    assert [e["actual"] for e in pushed(everything)[0]["events"]] == ["3.1%", "-2.0"]
+
+    # A withdrawn event reaches only the subscriptions it matched.
+    del upstream[1]
+    await sync.sync_once(now)
+    await _drain()
+    assert len(pushed(us)) == 1
+    assert pushed(everything)[-1]["events"] == [] and pushed(everything)[-1]["removed"] == ["zew"]
+
+    assert hub.unsubscribe_calendar(us, "us-high")
+    hub.disconnect(everything)
+    assert hub.calendar_subs == {} and hub.publish_calendar(upstream) == 0
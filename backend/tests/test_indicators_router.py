@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("OHLC_DB_URL", "postgresql://localhost/test")
+
+from backend.app.routers import indicators  # noqa: E402
+from backend.indicators import IncrementalSuperTrendAI, IndicatorEngine, SuperTrendAI  # noqa: E402
+
+
+def _bars(n: int) -> List[Dict[str, Any]]:
+    rng = np.random.default_rng(7)
+    close = 100 + np.cumsum(rng.normal(0, 1, n))
+    return [
+        {
+            "time": 1_700_000_000_000 + i * 60_000,
+            "open": float(close[i]),
+            "high": float(close[i] + rng.random()),
+            "low": float(close[i] - rng.random()),
+            "close": float(close[i]),
+            "volume": 100,
+        }
+        for i in range(n)
+    ]
+
+
+def test_incremental_matches_full_recompute() -> None:
+    bars = _bars(400)
+    model = SuperTrendAI(from_cluster="Average")
+    frame = IndicatorEngine().calculate(pd.DataFrame(bars), ["atr"], {"atr": {"length": 14}})
+    full = model.calculate(frame, factor_steps=7)
+
+    state = IncrementalSuperTrendAI(model, factor_steps=7)
+    state.update(bars[:150])
+    state.result()
+    state.update(bars[100:])
+    assert state.to_dict() == full.__dict__
+
+
+def test_endpoint_fetches_only_new_closed_bars(monkeypatch: pytest.MonkeyPatch) -> None:
+    bars = _bars(300)
+    available = {"upto": 200}
+    calls: List[tuple] = []
+
+    async def fake_fetch(symbol: str, tf: str, start_ms: int, end_ms: int) -> List[Dict[str, Any]]:
+        calls.append((start_ms, end_ms))
+        return [b for b in bars[: available["upto"]] if start_ms <= b["time"] <= end_ms]
+
+    monkeypatch.setattr(indicators, "fetch_ohlc", fake_fetch)
+    indicators._cache.clear()
+    app = FastAPI()
+    app.include_router(indicators.router)
+    client = TestClient(app)
+
+    params = {"tf": "1m", "start": bars[0]["time"], "factor_steps": 4}
+    first = client.get("/api/indicators/aapl", params=params).json()
+    assert first["bars"] == 200 and first["appended"] == 200
+
+    available["upto"] = 300
+    second = client.get("/api/indicators/AAPL", params=params).json()
+    assert second["appended"] == 100
+    assert calls[1][0] == bars[199]["time"] + 1
+    assert len(second["raw_supertrend"]) == 300
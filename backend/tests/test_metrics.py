@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from backend.app import metrics
+from backend.app.hub import Hub
+from backend.app.metrics import Registry
+
+
+def test_registry_renders_prometheus_text() -> None:
+    registry = Registry()
+    hist = registry.histogram("demo_latency_seconds", "Demo.", ["stage"], buckets=(0.1, 1.0))
+    hist.labels("a").observe(0.05)
+    hist.labels("a").observe(0.5)
+    registry.counter("demo_events", "Demo.").inc(3)
+    registry.register_collector(lambda: [("demo_depth", "gauge", "Demo.", [((("conn", 'x"1'),), 2)])])
+
+    text = registry.render()
+    assert '# TYPE demo_latency_seconds histogram' in text
+    assert 'demo_latency_seconds_bucket{stage="a",le="0.1"} 1' in text
+    assert 'demo_latency_seconds_bucket{stage="a",le="+Inf"} 2' in text
+    assert 'demo_latency_seconds_count{stage="a"} 2' in text
+    assert "demo_events_total 3" in text
+    assert 'demo_depth{conn="x\\"1"} 2' in text
+
+
+class _WebSocket:
+    async def accept(self) -> None:
+        return None
+
+    async def send_text(self, data: str) -> None:
+        return None
+
+
+@pytest.mark.asyncio
+async def test_hub_records_stage_latencies_and_collects_queue_depths() -> None:
+    sent_before = metrics.LATENCY_ENCODED_TO_SENT.count
+    upstream_before = metrics.LATENCY_UPSTREAM_TO_SENT.count
+    hub = Hub(queue_size=8)
+    ws = _WebSocket()
+    await hub.connect(ws)
+    hub.subscribe(ws, "AAPL", "1m")
+    tick = {"ts": 1_700_000_040_000, "o": 1, "h": 1, "l": 1, "c": 1, "v": 1}
+    await hub.publish_tick("AAPL", "1m", tick, upstream_ms=tick["ts"], received_s=tick["ts"] / 1000)
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+    assert metrics.LATENCY_ENCODED_TO_SENT.count == sent_before + 1
+    assert metrics.LATENCY_UPSTREAM_TO_SENT.count == upstream_before + 1
+    families = {name: samples for name, _, _, samples in hub.collect_metrics()}
+    assert families["hub_ws_connections"] == [((), 1)]
+    assert families["hub_events_published"][0][1] > 0
+    assert families["hub_send_queue_depth"][0][0][0][0] == "conn"
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, List
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("OHLC_DB_URL", "postgresql://localhost/test")
+
+from backend.app import api_ohlc  # noqa: E402
+from backend.common.http_cache import live_heads  # noqa: E402
+
+BAR = {"time": 1700000000000, "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "volume": 10}
+
+
+def _client(monkeypatch: pytest.MonkeyPatch, calls: Dict[str, int]) -> TestClient:
+    async def fake_fetch(symbol: str, tf: str, start_ms: int, end_ms: int) -> List[Dict[str, Any]]:
+        calls["count"] += 1
+        return [BAR]
+
+    monkeypatch.setattr(api_ohlc, "fetch_ohlc", fake_fetch)
+    app = FastAPI()
+    app.include_router(api_ohlc.router)
+    return TestClient(app)
+
+
+def test_historical_window_revalidates_without_query(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls = {"count": 0}
+    client = _client(monkeypatch, calls)
+    params = {"symbol": "aapl", "tf": "1m", "start": 1699990000000, "end": 1700000060000}
+
+    resp = client.get("/ohlc", params=params)
+    assert resp.status_code == 200
+    etag = resp.headers["etag"]
+    assert resp.headers["cache-control"].startswith("public, max-age=")
+    assert calls["count"] == 1
+
+    resp = client.get("/ohlc", params=params, headers={"If-None-Match": f"W/{etag}"})
+    assert resp.status_code == 304
+    assert resp.headers["etag"] == etag
+    assert calls["count"] == 1
+
+    resp = client.get(
+        "/ohlc",
+        params=params,
+        headers={"If-Modified-Since": resp.headers["last-modified"]},
+    )
+    assert resp.status_code == 304
+    assert calls["count"] == 1
+
+
+def test_live_window_etag_follows_live_head(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls = {"count": 0}
+    client = _client(monkeypatch, calls)
+    now_ms = 1700000000000
+    validator = api_ohlc.ohlc_validator("MSFT", "5m", now_ms - 3_600_000, now_ms + 60_000, now_ms=now_ms)
+    assert validator.cache_control == "no-cache"
+
+    live_heads.bump("MSFT", "5m", now_ms)
+    bumped = api_ohlc.ohlc_validator("MSFT", "5m", now_ms - 3_600_000, now_ms + 60_000, now_ms=now_ms)
+    assert bumped.etag != validator.etag
+
+    params = {"symbol": "MSFT", "tf": "5m", "start": 1, "end": 4_102_444_800_000}
+    first = client.get("/ohlc", params=params)
+    live_heads.bump("MSFT", "5m", now_ms + 1)
+    second = client.get("/ohlc", params=params, headers={"If-None-Match": first.headers["etag"]})
+    assert second.status_code == 200
+    assert calls["count"] == 2
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, List
+
+import pytest
+
+from backend.app.hub import Hub
+from backend.app.persistence import BarWriter, DirtyRanges
+
+T0 = 1_700_000_040_000  # a minute boundary
+
+
+class FakeConn:
+    def __init__(self, pool: "FakePool") -> None:
+        self.pool = pool
+
+    @asynccontextmanager
+    async def transaction(self):
+        staged = len(self.pool.copied)
+        try:
+            yield
+        except Exception:
+            del self.pool.copied[staged:]
+            raise
+
+    async def execute(self, sql: str, *args: Any) -> None:
+        if self.pool.down:
+            raise ConnectionError("database is down")
+        self.pool.statements.append((" ".join(sql.split()), args))
+
+    async def copy_records_to_table(self, table: str, records, columns) -> None:
+        assert table == "ohlcv_staging"
+        assert columns[:2] == ["symbol", "ts"]
+        self.pool.copied.extend(records)
+
+
+class FakePool:
+    def __init__(self) -> None:
+        self.down = False
+        self.copied: List[tuple] = []
+        self.statements: List[tuple] = []
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield FakeConn(self)
+
+
+def _bar(i: int, close: float = 1.0) -> dict:
+    return {"ts": T0 + i * 60_000, "o": 1.0, "h": 2.0, "l": 0.5, "c": close, "v": 10}
+
+
+@pytest.mark.asyncio
+async def test_closed_bars_are_copied_upserted_and_marked_dirty() -> None:
+    pool = FakePool()
+
+    async def get_pool() -> FakePool:
+        return pool
+
+    writer = BarWriter(get_pool, batch_rows=100, spool_rows=100)
+    hub = Hub(queue_size=8)
+    hub.add_bar_sink(writer.offer, writer.wait_for_room)
+
+    await hub.publish_tick("AAPL", "1m", _bar(0))  # still open: not persisted
+    await hub.publish_tick("AAPL", "1m", _bar(0, 1.5), final=True)
+    await hub.publish_tick("AAPL", "1m", _bar(0, 1.7), final=True)  # correction
+    await hub.publish_tick("MSFT", "1m", _bar(1), final=True)
+    assert len(writer) == 2
+
+    assert await writer.flush() == 2
+    assert [(r[0], r[5]) for r in pool.copied] == [("AAPL", 1.7), ("MSFT", 1.0)]
+    assert any(sql.startswith("INSERT INTO ohlcv") for sql, _ in pool.statements)
+
+    ranges = writer.dirty.ranges
+    assert ranges["ca_1m"] == (T0, T0 + 120_000)
+    assert ranges["ca_1h"][0] <= T0 and ranges["ca_1h"][1] >= T0 + 120_000
+    assert ranges["ca_1h"][1] - ranges["ca_1h"][0] == 3_600_000
+
+    pool.statements.clear()
+    assert await writer.refresh_dirty() == 6
+    refreshed = [args[0] for sql, args in pool.statements if sql.startswith("CALL")]
+    assert refreshed[0] == "ca_1m" and refreshed[-1] == "ca_1d"
+    assert not writer.dirty
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_rows_in_bounded_spool_and_retries() -> None:
+    pool = FakePool()
+
+    async def get_pool() -> FakePool:
+        return pool
+
+    writer = BarWriter(get_pool, batch_rows=2, spool_rows=3)
+    hub = Hub(queue_size=8)
+    hub.add_bar_sink(writer.offer, writer.wait_for_room)
+    pool.down = True
+
+    for i in range(2):
+        await hub.publish_tick("AAPL", "1m", _bar(i), final=True)
+    with pytest.raises(ConnectionError):
+        await writer.flush()
+    assert len(writer) == 2 and not writer.healthy
+    # An unhealthy writer never holds feeds back.
+    await asyncio.wait_for(hub.drain(), 0.1)
+
+    for i in range(2, 4):
+        await hub.publish_tick("AAPL", "1m", _bar(i, 9.0), final=True)
+    assert len(writer) == 3 and writer.stats["dropped"] == 1
+
+    pool.down = False
+    assert await writer.flush() == 3
+    assert [r[1].timestamp() * 1000 for r in pool.copied] == [
+        T0 + 60_000,
+        T0 + 120_000,
+        T0 + 180_000,
+    ]
+    assert writer.healthy and len(writer) == 0
+
+
+def test_dirty_ranges_align_to_each_bucket_and_merge() -> None:
+    dirty = DirtyRanges({"ca_5m": 300_000})
+    dirty.add(T0 + 60_000, T0 + 120_000)
+    dirty.add(T0 + 600_000, T0 + 660_000)
+    lo, hi = dirty.ranges["ca_5m"]
+    assert lo % 300_000 == 0 and hi % 300_000 == 0
+    assert lo <= T0 + 60_000 and hi >= T0 + 660_000
+
+    taken = dirty.take()
+    assert not dirty
+    dirty.restore(taken)
+    assert dirty.ranges == taken
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from backend.app.hub import Hub
+from backend.app.replay import ReplayFeed, load_recorded, synthetic_symbols, synthetic_ticks
+
+
+def test_synthetic_ticks_revise_each_bar_then_close_it() -> None:
+    symbols = synthetic_symbols(3)
+    ticks = list(synthetic_ticks(symbols, start_ms=1_700_000_030_000, minutes=2, updates_per_bar=4))
+
+    assert symbols == ["S0000", "S0001", "S0002"]
+    assert len(ticks) == 2 * 4 * 3
+    first_bar = [t for t in ticks if t.symbol == "S0001" and t.tick["ts"] == 1_699_999_980_000]
+    assert [t.final for t in first_bar] == [False, False, False, True]
+    assert all(t.tick["l"] <= t.tick["c"] <= t.tick["h"] for t in ticks)
+    assert [t.at_ms for t in ticks] == sorted(t.at_ms for t in ticks)
+    again = list(synthetic_ticks(symbols, start_ms=1_700_000_030_000, minutes=2, updates_per_bar=4))
+    assert again == ticks
+
+
+def test_load_recorded_reads_csv_and_jsonl(tmp_path: Path) -> None:
+    csv_path = tmp_path / "bars.csv"
+    csv_path.write_text(
+        "symbol,time,open,high,low,close,volume\n"
+        "msft,1700000060000,2,3,1,2.5,7\n"
+        "aapl,1700000000000,1,2,0.5,1.5,10\n"
+    )
+    jsonl_path = tmp_path / "bars.jsonl"
+    jsonl_path.write_text(json.dumps({"symbol": "AAPL", "ts": 1_700_000_000, "o": 1, "c": 2}) + "\n")
+
+    ticks = load_recorded(csv_path)
+    assert [t.symbol for t in ticks] == ["AAPL", "MSFT"]
+    assert ticks[0].tick == {"ts": 1_700_000_000_000, "o": 1, "h": 2, "l": 0.5, "c": 1.5, "v": 10}
+    assert ticks[0].at_ms == 1_700_000_060_000 and ticks[0].final
+    (tick,) = load_recorded(jsonl_path)
+    assert tick.tick == {"ts": 1_700_000_000_000, "o": 1.0, "h": 2.0, "l": 1.0, "c": 2.0, "v": 0.0}
+
+
+@pytest.mark.asyncio
+async def test_replay_feed_publishes_every_tick_into_the_hub() -> None:
+    hub = Hub(queue_size=8)
+    ticks = list(synthetic_ticks(synthetic_symbols(50), minutes=3, updates_per_bar=2))
+    stats = await ReplayFeed(hub, ticks, speed=0).run()
+
+    assert stats["ticks"] == len(ticks) and stats["bursts"] == 3 * 2
+    closes: List[int] = [len(hub.bars.last(s, "1m")) for s in synthetic_symbols(50)]
+    assert closes == [3] * 50
+    assert hub.bars.get("S0000", "1m").last_closed
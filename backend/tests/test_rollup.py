@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+from backend.app.rollup import BarRollup, bucket_bounds
+
+# 2024-03-05 09:30 America/New_York
+OPEN_MS = int(datetime(2024, 3, 5, 14, 30, tzinfo=timezone.utc).timestamp() * 1000)
+MINUTE = 60_000
+
+
+def _bar(i: int, price: float, v: float = 10) -> dict:
+    return {"ts": OPEN_MS + i * MINUTE, "o": price, "h": price + 1, "l": price - 1, "c": price, "v": v}
+
+
+def test_minute_bars_roll_up_and_close_with_bucket() -> None:
+    rollup = BarRollup(["1m", "5m", "1h"])
+    events = []
+    for i in range(5):
+        events.extend(rollup.on_bar("AAPL", _bar(i, 100 + i), final=True))
+
+    five = [e for e in events if e.tf == "5m"]
+    assert [e.closed for e in five] == [False, False, False, False, True]
+    closed = five[-1]
+    assert (closed.start_ms, closed.o, closed.h, closed.l, closed.c, closed.v) == (
+        OPEN_MS, 100, 105, 99, 104, 50
+    )
+    assert all(e.closed for e in events if e.tf == "1m")
+    assert not any(e.closed for e in events if e.tf == "1h")
+
+
+def test_revised_minute_replaces_its_contribution() -> None:
+    rollup = BarRollup(["5m"])
+    rollup.on_bar("AAPL", _bar(0, 100))
+    rollup.on_bar("AAPL", _bar(1, 110, v=5))
+    (event,) = rollup.on_bar("AAPL", _bar(1, 105, v=7))
+    assert (event.h, event.c, event.v) == (106, 105, 17)
+
+
+def test_trades_close_previous_bucket_and_flush() -> None:
+    rollup = BarRollup(["1m", "5m"])
+    rollup.on_trade("AAPL", OPEN_MS + 1_000, 100, 1)
+    rollup.on_trade("AAPL", OPEN_MS + 2_000, 101, 2)
+    events = rollup.on_trade("AAPL", OPEN_MS + MINUTE + 1_000, 99, 3)
+    closed_1m = [e for e in events if e.tf == "1m" and e.closed]
+    assert len(closed_1m) == 1 and (closed_1m[0].c, closed_1m[0].v) == (101, 3)
+    five = [e for e in events if e.tf == "5m"][0]
+    assert (five.o, five.h, five.l, five.c, five.v, five.closed) == (100, 101, 99, 99, 6, False)
+
+    flushed = rollup.flush(OPEN_MS + 5 * MINUTE)
+    assert {(e.tf, e.closed) for e in flushed} == {("1m", True), ("5m", True)}
+    assert rollup.flush(OPEN_MS + 10 * MINUTE) == []
+
+
+def test_last_bucket_is_cut_at_session_close() -> None:
+    start, end = bucket_bounds(OPEN_MS + 6 * 3_600_000, "1h")  # 15:30 ET
+    assert end - start == 30 * MINUTE
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import importlib.util
+import sys
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from backend.common.session_calendar import SessionCalendar, nyse_early_closes, nyse_holidays
+
+CAL = SessionCalendar.build(2023, 2025, source="static")
+
+
+def _s(*args: int) -> int:
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp())
+
+
+def test_static_rules_match_published_2025_schedule() -> None:
+    assert sorted(nyse_holidays(2025)) == [
+        date(2025, 1, 1),
+        date(2025, 1, 9),
+        date(2025, 1, 20),
+        date(2025, 2, 17),
+        date(2025, 4, 18),
+        date(2025, 5, 26),
+        date(2025, 6, 19),
+        date(2025, 7, 4),
+        date(2025, 9, 1),
+        date(2025, 11, 27),
+        date(2025, 12, 25),
+    ]
+    assert nyse_early_closes(2025) == {date(2025, 7, 3), date(2025, 11, 28), date(2025, 12, 24)}
+    assert CAL.session_open_close(date(2025, 11, 28)) == (_s(2025, 11, 28, 14, 30), _s(2025, 11, 28, 18, 0))
+    assert not CAL.is_session(date(2025, 11, 27))
+
+
+def test_intraday_alignment_anchors_on_previous_session_over_holidays() -> None:
+    # 2024-03-05 10:07 ET (EST) -> 10:05 bucket
+    assert CAL.align(_s(2024, 3, 5, 15, 7, 30), "5m") == _s(2024, 3, 5, 15, 5)
+    # Monday before the open still belongs to Friday's session.
+    assert CAL.open_close(_s(2024, 3, 11, 12, 0)) == (_s(2024, 3, 8, 14, 30), _s(2024, 3, 8, 21, 0))
+    # Friday after Thanksgiving closes at 13:00 ET, so the 1h bucket is cut short.
+    assert CAL.bucket_bounds(_s(2024, 11, 29, 17, 45), "1h") == (_s(2024, 11, 29, 17, 30), _s(2024, 11, 29, 18, 0))
+
+
+def test_daily_buckets_follow_et_midnight_across_dst() -> None:
+    # 2024-03-10 is the spring-forward day: 23 hours long.
+    start, end = CAL.bucket_bounds(_s(2024, 3, 10, 12, 0), "1d")
+    assert (start, end) == (_s(2024, 3, 10, 5, 0), _s(2024, 3, 11, 4, 0))
+    assert CAL.align(_s(2024, 3, 11, 3, 59), "1d") == start
+
+
+def test_vectorized_alignment_matches_scalar() -> None:
+    rng = np.random.default_rng(7)
+    ts = rng.integers(_s(2023, 1, 10), _s(2025, 12, 20), size=2_000)
+    for tf in ("1m", "15m", "4h", "1d"):
+        expected = [CAL.align(int(t), tf) for t in ts]
+        assert CAL.align_many(ts, tf).tolist() == expected
+
+
+def test_seeder_walks_back_more_than_a_year_of_sessions(monkeypatch: pytest.MonkeyPatch) -> None:
+    pytest.importorskip("asyncpg")
+    path = Path(__file__).resolve().parents[2] / "scripts" / "seed_ohlcv.py"
+    spec = importlib.util.spec_from_file_location("seed_ohlcv", path)
+    assert spec is not None and spec.loader is not None
+    seeder = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, "seed_ohlcv", seeder)  # for its dataclasses
+    spec.loader.exec_module(seeder)
+
+    sessions = seeder._most_recent_sessions(date(2025, 1, 10), 300, True)
+    assert len(sessions) == 300 and sessions[-1] == date(2025, 1, 10)
+    assert sessions[0].year == 2023
+    assert date(2024, 12, 25) not in sessions and date(2023, 12, 25) not in sessions
+    assert date(2025, 1, 9) not in sessions  # national day of mourning
+    assert all(d.weekday() < 5 for d in sessions)
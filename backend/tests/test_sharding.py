@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import multiprocessing as mp
+import sys
+from typing import Dict, List, Set
+
+import pytest
+import websockets
+
+from backend.app import sharding
+from backend.app.hub import Hub
+from backend.app.sharding import IngestSupervisor, _ProcessShard, rebalance
+
+
+def test_rebalance_keeps_placements_and_evens_out_shards() -> None:
+    first = rebalance({}, [f"S{i}" for i in range(9)], 3)
+    assert sorted(list(first.values()).count(i) for i in range(3)) == [3, 3, 3]
+
+    # Growing the universe only places the newcomers.
+    grown = rebalance(first, [f"S{i}" for i in range(12)], 3)
+    assert all(grown[s] == first[s] for s in first)
+
+    # Emptying one shard pulls symbols over until sizes are within one.
+    gone = [s for s, i in grown.items() if i == 0]
+    shrunk = rebalance(grown, [s for s in grown if s not in gone], 3)
+    sizes = [list(shrunk.values()).count(i) for i in range(3)]
+    assert max(sizes) - min(sizes) <= 1
+    assert sum(1 for s in shrunk if shrunk[s] != grown[s]) <= 2
+
+
+class FakeAlpaca:
+    """Local stand-in for the Alpaca stream: acks auth, then emits a bar per new symbol."""
+
+    def __init__(self) -> None:
+        self.subscribed: Dict[int, Set[str]] = {}
+        self.messages: List[dict] = []
+
+    async def handler(self, ws) -> None:
+        conn = id(ws)
+        self.subscribed[conn] = set()
+        await ws.recv()  # auth
+        await ws.send(json.dumps([{"T": "success", "msg": "authenticated"}]))
+        async for raw in ws:
+            msg = json.loads(raw)
+            self.messages.append(msg)
+            symbols = set(msg.get("bars", []))
+            if msg["action"] == "unsubscribe":
+                self.subscribed[conn] -= symbols
+                continue
+            self.subscribed[conn] |= symbols
+            bar = {"T": "b", "o": 1, "h": 2, "l": 1, "c": 2, "v": 5, "t": "2024-03-11T14:30:00Z"}
+            bars = [{**bar, "S": s} for s in sorted(symbols)]
+            await ws.send(json.dumps(bars))
+
+
+async def _until(predicate, timeout: float = 3.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_supervisor_shards_a_universe_over_connections(monkeypatch: pytest.MonkeyPatch):
+    fake = FakeAlpaca()
+    async with websockets.serve(fake.handler, "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        monkeypatch.setenv("ALPACA_WS", f"ws://127.0.0.1:{port}")
+        monkeypatch.setenv("ALPACA_KEY_ID", "key")
+        monkeypatch.setenv("ALPACA_SECRET_KEY", "secret")
+
+        hub = Hub(queue_size=8)
+        universe = [f"S{i}" for i in range(9)]
+        supervisor = IngestSupervisor(
+            hub, universe, shards=3, sample_s=0.05, channels=["bars"], debounce_s=0.01
+        )
+        task = asyncio.create_task(supervisor.run())
+        try:
+            await _until(lambda: all(hub.bars.get(s, "1m") is not None for s in universe))
+            sets = list(fake.subscribed.values())
+            assert len(sets) == 3 and all(len(s) == 3 for s in sets)
+            assert set().union(*sets) == set(universe)
+
+            # Demand outside the universe lands on one shard.
+            hub.subscribe("client", "EXTRA", "1m")
+            await _until(lambda: hub.bars.get("EXTRA", "1m") is not None)
+            assert sum("EXTRA" in s for s in fake.subscribed.values()) == 1
+
+            # Shrinking the universe rebalances with unsubscribes, not reconnects.
+            supervisor.set_universe(universe[:3])
+            await _until(lambda: sum(len(s) for s in fake.subscribed.values()) == 4)
+            assert any(m["action"] == "unsubscribe" for m in fake.messages)
+
+            await asyncio.sleep(0.1)
+            report = supervisor.report()
+            assert [r["shard"] for r in report] == ["shard-0", "shard-1", "shard-2"]
+            assert all(r["connected"] and r["reconnects"] == 0 for r in report)
+            assert sum(r["messages"] for r in report) == 10
+            assert {name for name, *_ in supervisor.collect_metrics()} >= {
+                "ingest_shard_lag_ms",
+                "ingest_shard_messages_per_second",
+            }
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+def _crash(name, symbols, inbox, outbox, options) -> None:
+    outbox.put((name, list(symbols)))
+    sys.exit(3)
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(sys.platform == "win32", reason="needs the fork start method")
+async def test_process_shard_restarts_dead_children_with_backoff(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(sharding, "_process_main", _crash)
+    ctx = mp.get_context("fork")
+    outbox = ctx.Queue()
+    shard = _ProcessShard(
+        "shard-0", ctx, outbox, {}, restart_min_s=0.05, restart_max_s=0.4, poll_s=0.01
+    )
+    shard.set_symbols(["AAPL"])
+    sleeps: List[float] = []
+    real_sleep = asyncio.sleep
+
+    async def recording_sleep(delay: float) -> None:
+        if delay >= 0.05:
+            sleeps.append(delay)
+        await real_sleep(delay)
+
+    monkeypatch.setattr(sharding.asyncio, "sleep", recording_sleep)
+    task = asyncio.create_task(shard.run())
+    try:
+        await _until(lambda: shard.restarts >= 3)
+        shard.set_symbols(["MSFT"])
+        await _until(lambda: shard.restarts >= 5)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    assert sleeps[:4] == [0.05, 0.1, 0.2, 0.4]
+    assert shard.process.exitcode == 3 and shard.report()["restarts"] == shard.restarts
+    started = [outbox.get(timeout=1.0) for _ in range(5)]
+    assert started[0] == ("shard-0", ["AAPL"]) and started[-1] == ("shard-0", ["MSFT"])
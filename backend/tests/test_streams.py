@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from backend.app.rollup import BarEvent
+from backend.app.streams import StreamStore
+
+
+def _event(symbol: str, i: int) -> BarEvent:
+    return BarEvent(symbol, "1m", i * 60_000, 1.0, 1.0, 1.0, 1.0, 1.0, False)
+
+
+def test_only_subscribed_streams_are_kept_and_idle_ones_are_evicted() -> None:
+    now = [0.0]
+    store = StreamStore(replay=8, budget=100, idle_s=60.0, clock=lambda: now[0])
+
+    assert store.record(_event("AAPL", 0), subscribed=False) == 0 and len(store) == 0
+
+    assert [store.record(_event("MSFT", i)) for i in range(3)] == [1, 2, 3]
+    # Inside the resume window the stream keeps logging without subscribers.
+    now[0] = 30.0
+    assert store.record(_event("MSFT", 3), subscribed=False) == 4
+    assert [s for s, _ in store.missed("MSFT", "1m", 2)] == [3, 4]
+
+    now[0] = 100.0
+    assert store.record(_event("MSFT", 4), subscribed=False) == 0
+    assert len(store) == 0 and store.events == 0 and store.evictions == 1
+    # The old numbering can't be resumed; a recreated stream starts past it.
+    assert store.missed("MSFT", "1m", 4) is None and store.missed("MSFT", "1m", 0) is None
+    assert store.open("MSFT", "1m").seq == 5
+    assert store.record(_event("MSFT", 5)) == 6
+
+
+def test_budget_clears_least_recently_active_logs_but_keeps_seq() -> None:
+    store = StreamStore(replay=10, budget=15, idle_s=60.0, clock=lambda: 0.0)
+    for i in range(10):
+        store.record(_event("AAPL", i))
+    for i in range(10):
+        store.record(_event("MSFT", i))
+
+    assert store.events <= 15
+    assert store.missed("AAPL", "1m", 5) is None and store.get("AAPL", "1m").seq == 10
+    assert [s for s, _ in store.missed("MSFT", "1m", 8)] == [9, 10]
+    assert store.record(_event("AAPL", 10)) == 11
+
+
+def test_quiet_streams_with_subscribers_are_kept() -> None:
+    now = [0.0]
+    store = StreamStore(replay=8, budget=100, idle_s=60.0, clock=lambda: now[0])
+    assert store.record(_event("AAPL", 0)) == 1
+
+    # No events for well past the window, yet nobody left: no eviction.
+    now[0] = 500.0
+    store.record(_event("MSFT", 0))
+    assert store.get("AAPL", "1m") is not None
+    assert store.record(_event("AAPL", 1)) == 2
+
+    # The window starts when the last subscriber leaves.
+    now[0] = 520.0
+    store.release("AAPL", "1m")
+    now[0] = 570.0
+    store.record(_event("MSFT", 1))
+    assert store.get("AAPL", "1m") is not None
+    now[0] = 600.0
+    store.record(_event("MSFT", 2))
+    assert store.get("AAPL", "1m") is None and store.evictions == 1
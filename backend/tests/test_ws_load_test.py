@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_load_harness_runs_end_to_end(monkeypatch: pytest.MonkeyPatch) -> None:
+    path = Path(__file__).resolve().parents[2] / "scripts" / "ws_load_test.py"
+    spec = importlib.util.spec_from_file_location("ws_load_test", path)
+    assert spec is not None and spec.loader is not None
+    harness = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, "ws_load_test", harness)  # for its dataclasses
+    spec.loader.exec_module(harness)
+
+    # More symbols than the clients pick, so some keys are never subscribed.
+    config = harness.LoadTestConfig(
+        clients=12,
+        symbols=40,
+        symbols_per_client=3,
+        wildcard_share=0.0,
+        throttled_share=0.25,
+        max_rate=2.0,
+        binary_share=0.25,
+        batch_share=0.25,
+        batch_ms=5,
+        tfs=["1m", "5m"],
+        profiles=[harness.Profile("fast", 1.0)],
+        minutes=3,
+        speed=0.0,
+        updates_per_bar=2,
+        replay_file=None,
+        queue_size=256,
+        policy="drop_oldest",
+        drain_s=2.0,
+        seed=3,
+        json_out=None,
+    )
+    report = await harness.run(config)
+
+    fast = report["profiles"]["fast"]
+    assert fast["clients"] == 12 and fast["bars_received"] > 0
+    assert fast["latency_ms"]["p50"] is not None and fast["disconnected"] == 0
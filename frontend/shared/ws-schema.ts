@@ -5,6 +5,7 @@ export type WsBarPayload = {
   sessionId: string;
   symbol: string;
   tf: TF;
+  seq: number; // per (symbol, tf) sequence number within `sessionId`
   tsStart: number; // UNIX ms representing NYSE-anchored bucket start
   o: number;
   h: number;
@@ -14,10 +15,170 @@ export type WsBarPayload = {
   barClose: boolean;
 };
 
-export type WsSubscribe = { type: "subscribe"; id: string; symbol: string; tf: TF };
+// `symbol` may be "*" for every symbol of `tf`; `symbols` subscribes several under one id.
+// `maxRate` caps open-bar updates per second (latest state wins); barClose is always sent.
+// `snapshot` asks for the last N bars first; `resume` (with the previous `sessionId`) replays
+// only the bars after each symbol's last seen `seq`, falling back to a snapshot when it cannot.
+// `indicator` also streams a server-computed indicator over closed bars (explicit symbols only).
+// `batch` (true or a window in ms) collects the connection's bar frames into one per window.
+export type WsSubscribe = {
+  type: "subscribe";
+  id?: string;
+  symbol?: string;
+  symbols?: string[];
+  tf: TF;
+  maxRate?: number;
+  snapshot?: number;
+  resume?: Record<string, number>;
+  sessionId?: string;
+  indicator?: WsIndicatorSpec;
+  batch?: boolean | number;
+};
+export type WsIndicatorSpec =
+  | "supertrend_ai"
+  | {
+      name: "supertrend_ai";
+      params?: Partial<{
+        atr_length: number;
+        atr_mode: "EMA" | "RMA";
+        factor_min: number;
+        factor_max: number;
+        factor_steps: number;
+        k: number;
+        perf_alpha: number;
+        denom_span: number;
+        from_cluster: "Best" | "Average" | "Worst";
+        use_ama: boolean;
+      }>;
+    };
+// Economic calendar updates (new events, `actual` values, revisions) as they land upstream.
+// Only changes are pushed: subscribe first, then load the window from `/v1/calendar`.
+export type WsCalendarSubscribe = {
+  type: "subscribe";
+  channel: "calendar";
+  id?: string;
+  countries?: string | string[];
+  minImpact?: "low" | "medium" | "high";
+};
 export type WsUnsubscribe = { type: "unsubscribe"; id: string };
-export type WsServerHello = { type: "hello"; sessionId: string };
-export type WsError = { type: "error"; message: string };
+export type WsProtocol = "json" | "binary" | "msgpack";
+// `timeframes[i]` is the tf with id `i` in binary frames.
+export type WsServerHello = {
+  type: "hello";
+  sessionId: string;
+  protocol: WsProtocol;
+  protocols: WsProtocol[];
+  timeframes: TF[];
+};
+// Client -> server: switch bar frames to another protocol (also `?protocol=` on connect).
+export type WsHello = { type: "hello"; protocol: WsProtocol };
+export type WsProtocolAck = { type: "protocol"; protocol: WsProtocol };
+// Sent once per symbol per connection before the first binary/msgpack frame using the id.
+export type WsSymbols = { type: "symbols"; symbols: Record<string, number> };
+export type WsSnapshotBar = Omit<WsBarPayload, "type" | "sessionId" | "symbol" | "tf" | "seq">;
+// Deltas for the stream continue with `seq + 1`.
+export type WsSnapshot = {
+  type: "snapshot";
+  sessionId: string;
+  id: string | null;
+  symbol: string;
+  tf: TF;
+  seq: number;
+  bars: WsSnapshotBar[];
+};
+// Bars the feed missed during an outage, merged in order; the stream continues with `seq + 1`.
+export type WsGapfill = {
+  type: "gapfill";
+  sessionId: string;
+  symbol: string;
+  tf: TF;
+  seq: number;
+  bars: WsSnapshotBar[];
+};
+export type WsSubscribed = {
+  type: "subscribed";
+  id: string;
+  symbols: string[];
+  tf: TF;
+  catchUp: Record<string, "resumed" | "snapshot" | "live">;
+  batchMs?: number;
+};
+export type WsCalendarSubscribed = {
+  type: "subscribed";
+  id: string;
+  channel: "calendar";
+  countries: string[] | null;
+  minImpact: "low" | "medium" | "high" | null;
+};
+export type WsCalendarEvent = {
+  id: string;
+  source: string;
+  ts: number;
+  title: string;
+  country: string;
+  currency: string;
+  impact: "low" | "medium" | "high" | "unknown";
+  actual: string | null;
+  forecast: string | null;
+  previous: string | null;
+  revised: string | null;
+  url: string | null;
+};
+// `removed` lists ids of events withdrawn upstream (omitted when none).
+export type WsCalendar = {
+  type: "calendar";
+  id: string;
+  events: WsCalendarEvent[];
+  removed?: string[];
+};
+// JSON connections with batching on; binary ones get concatenated bar records instead.
+export type WsBatch = { type: "batch"; messages: (WsBarPayload | WsIndicator)[] };
+export type WsIndicatorPoint = { time: number; value: number | null };
+// Full series over closed bars, sent once per symbol on subscribe; `key` names the shared state.
+export type WsIndicatorSnapshot = {
+  type: "indicatorSnapshot";
+  id: string | null;
+  key: string;
+  symbol: string;
+  tf: TF;
+  name: "supertrend_ai";
+  params: Record<string, number | string | boolean>;
+  raw_supertrend: WsIndicatorPoint[];
+  ama_supertrend: WsIndicatorPoint[] | null;
+  direction: number[];
+  signals: { time: number; price: number | null; dir: 1 | -1 }[];
+  factor: number | null;
+};
+// Newest point, sent right after the barClose it was computed from.
+export type WsIndicator = {
+  type: "indicator";
+  key: string;
+  symbol: string;
+  tf: TF;
+  name: "supertrend_ai";
+  time: number;
+  value: number | null;
+  ama: number | null;
+  direction: number;
+  signal: { time: number; price: number | null; dir: 1 | -1 } | null;
+  factor: number;
+};
+export type WsUnsubscribed = { type: "unsubscribed"; id: string; ok: boolean };
+export type WsError = { type: "error"; id?: string; message: string };
 
-export type WsClientMsg = WsSubscribe | WsUnsubscribe;
-export type WsServerMsg = WsServerHello | WsBarPayload | WsError;
+export type WsClientMsg = WsHello | WsSubscribe | WsCalendarSubscribe | WsUnsubscribe;
+export type WsServerMsg =
+  | WsServerHello
+  | WsProtocolAck
+  | WsSymbols
+  | WsBarPayload
+  | WsBatch
+  | WsSnapshot
+  | WsGapfill
+  | WsSubscribed
+  | WsCalendarSubscribed
+  | WsCalendar
+  | WsIndicatorSnapshot
+  | WsIndicator
+  | WsUnsubscribed
+  | WsError;
@@ -0,0 +1,49 @@
+import type { TF, WsBarPayload } from "../../../shared/ws-schema";
+
+// Layout of a "binary" protocol bar frame (little endian, 63 bytes), see backend/app/protocol.py:
+// u8 kind | u32 symbolId | u8 tfId | u64 seq | i64 tsStart | f64 o,h,l,c,v | u8 flags (bit 0 = barClose)
+const FRAME_BAR = 1;
+export const BAR_FRAME_BYTES = 63;
+
+export function decodeBinaryBar(
+  buf: ArrayBuffer,
+  symbols: Map<number, string>,
+  timeframes: TF[],
+  sessionId: string,
+): WsBarPayload | null {
+  if (buf.byteLength !== BAR_FRAME_BYTES) return null;
+  const view = new DataView(buf);
+  if (view.getUint8(0) !== FRAME_BAR) return null;
+  const symbol = symbols.get(view.getUint32(1, true));
+  const tf = timeframes[view.getUint8(5)];
+  if (!symbol || !tf) return null;
+  return {
+    type: "bar",
+    sessionId,
+    symbol,
+    tf,
+    seq: Number(view.getBigUint64(6, true)),
+    tsStart: Number(view.getBigInt64(14, true)),
+    o: view.getFloat64(22, true),
+    h: view.getFloat64(30, true),
+    l: view.getFloat64(38, true),
+    c: view.getFloat64(46, true),
+    v: view.getFloat64(54, true),
+    barClose: (view.getUint8(62) & 1) === 1,
+  };
+}
+
+// Batched connections receive several records back to back in one message.
+export function decodeBinaryBars(
+  buf: ArrayBuffer,
+  symbols: Map<number, string>,
+  timeframes: TF[],
+  sessionId: string,
+): WsBarPayload[] {
+  const out: WsBarPayload[] = [];
+  for (let offset = 0; offset + BAR_FRAME_BYTES <= buf.byteLength; offset += BAR_FRAME_BYTES) {
+    const bar = decodeBinaryBar(buf.slice(offset, offset + BAR_FRAME_BYTES), symbols, timeframes, sessionId);
+    if (bar) out.push(bar);
+  }
+  return out;
+}
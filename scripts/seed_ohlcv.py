@@ -9,29 +9,33 @@ import argparse
 import asyncio
 import os
 import random
+import sys
 from dataclasses import dataclass
+from functools import lru_cache
 from datetime import date, datetime, time, timedelta, timezone
 from math import floor
+from pathlib import Path
 from typing import Any, List, Sequence, Tuple
 from zoneinfo import ZoneInfo
 
 import asyncpg
 
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from backend.common.session_calendar import SessionCalendar  # noqa: E402
+
 NY_TZ = ZoneInfo("America/New_York")
 SESSION_START = time(9, 30)
 SESSION_END = time(16, 0)
 CA_TARGETS = ["ca_1m", "ca_5m", "ca_15m", "ca_1h", "ca_4h", "ca_1d"]
 
-# Minimal holiday list for local tests (extend as needed)
-HOLIDAYS = {
-    "2024-11-28",  # Thanksgiving
-    "2024-12-25",  # Christmas
-}
 
-# Early close map (ET). Values are HH:MM tuples for the session end time.
-EARLY_CLOSES: dict[str, tuple[int, int]] = {
-    "2024-11-29": (13, 0),  # Day after Thanksgiving
-}
+@lru_cache(maxsize=4)
+def _static_calendar(year: int) -> SessionCalendar:
+    """Holidays and early closes from the shared static NYSE rules."""
+    return SessionCalendar.build(year - 1, year, source="static")
 
 
 @dataclass(frozen=True)
@@ -92,7 +96,7 @@ def parse_args() -> SeederConfig:
     parser.add_argument(
         "--holiday-aware",
         action="store_true",
-        help="Skip a small set of known NYSE holidays when seeding.",
+        help="Skip NYSE holidays (static rules) when seeding.",
     )
     parser.add_argument(
         "--batch-size",
@@ -164,7 +168,8 @@ def _most_recent_sessions(
     sessions: List[date] = []
     cursor = end_date
     while len(sessions) < count:
-        if holiday_aware and cursor.isoformat() in HOLIDAYS:
+        # Each calendar covers two years, so look up the one for the cursor's year.
+        if holiday_aware and not _static_calendar(cursor.year).is_session(cursor):
             cursor -= timedelta(days=1)
             continue
         if cursor.weekday() < 5:  # Monday = 0
@@ -175,16 +180,11 @@ def _most_recent_sessions(
 
 
 def _session_minutes(session_date: date) -> List[datetime]:
-    close_hour, close_minute = EARLY_CLOSES.get(
-        session_date.isoformat(),
-        (SESSION_END.hour, SESSION_END.minute),
-    )
     start = datetime.combine(session_date, SESSION_START, tzinfo=NY_TZ)
-    end = datetime.combine(
-        session_date,
-        time(close_hour, close_minute),
-        tzinfo=NY_TZ,
-    )
+    end = datetime.combine(session_date, SESSION_END, tzinfo=NY_TZ)
+    bounds = _static_calendar(session_date.year).session_open_close(session_date)
+    if bounds is not None:
+        end = datetime.fromtimestamp(bounds[1], tz=NY_TZ)
     minutes: List[datetime] = []
     current = start
     while current < end:
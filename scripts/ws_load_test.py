@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Load-test the WebSocket hub in-process: replay synthetic bars for many symbols
+into a Hub while thousands of simulated clients consume them, then report
+delivery latency percentiles and drop rates per slow-consumer profile.
+
+Runs locally without Alpaca, Redis or a database, e.g.
+
+    python scripts/ws_load_test.py --clients 2000 --symbols 2000 --minutes 5 --speed 60
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from backend.app.hub import ClientConnection, Hub  # noqa: E402
+from backend.app.protocol import BAR_STRUCT, BINARY, JSON, decode_binary  # noqa: E402
+from backend.app.replay import (  # noqa: E402
+    ReplayFeed,
+    load_recorded,
+    synthetic_symbols,
+    synthetic_ticks,
+)
+from backend.app.rollup import BarEvent  # noqa: E402
+
+
+@dataclass(frozen=True)
+class Profile:
+    """How a simulated client consumes frames."""
+
+    name: str
+    share: float
+    delay_ms: float = 0.0  # per frame
+    stall_s: float = 0.0  # stop reading for this long ...
+    stall_every_s: float = 0.0  # ... this often
+
+
+@dataclass(frozen=True)
+class LoadTestConfig:
+    clients: int
+    symbols: int
+    symbols_per_client: int
+    wildcard_share: float
+    throttled_share: float
+    max_rate: float
+    binary_share: float
+    batch_share: float
+    batch_ms: int
+    tfs: Sequence[str]
+    profiles: Sequence[Profile]
+    minutes: int
+    speed: float
+    updates_per_bar: int
+    replay_file: Optional[str]
+    queue_size: int
+    policy: str
+    drain_s: float
+    seed: int
+    json_out: Optional[str]
+
+
+def _parse_profiles(
+    spec: str, slow_ms: float, stall_s: float, stall_every_s: float
+) -> List[Profile]:
+    profiles = []
+    for part in spec.split(","):
+        name, _, share = part.partition("=")
+        name = name.strip()
+        if name == "fast":
+            profiles.append(Profile(name, float(share)))
+        elif name == "slow":
+            profiles.append(Profile(name, float(share), delay_ms=slow_ms))
+        elif name == "stalled":
+            profiles.append(
+                Profile(name, float(share), stall_s=stall_s, stall_every_s=stall_every_s)
+            )
+        else:
+            raise SystemExit(f"unknown profile '{name}' (use fast, slow, stalled)")
+    return profiles
+
+
+def parse_args() -> LoadTestConfig:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--symbols", type=int, default=1000)
+    parser.add_argument("--symbols-per-client", type=int, default=20)
+    parser.add_argument("--wildcard-share", type=float, default=0.01, help="clients on '*'")
+    parser.add_argument("--throttled-share", type=float, default=0.2, help="clients using maxRate")
+    parser.add_argument("--max-rate", type=float, default=2.0, help="maxRate of throttled clients")
+    parser.add_argument("--binary-share", type=float, default=0.0, help="clients on binary")
+    parser.add_argument("--batch-share", type=float, default=0.0, help="clients batching")
+    parser.add_argument("--batch-ms", type=int, default=25, help="batch window of those clients")
+    parser.add_argument("--tfs", default="1m,5m", help="timeframes clients pick from")
+    parser.add_argument(
+        "--profiles",
+        default="fast=0.9,slow=0.08,stalled=0.02",
+        help="slow-consumer mix as name=share (fast, slow, stalled)",
+    )
+    parser.add_argument("--slow-ms", type=float, default=5.0, help="per-frame delay (slow)")
+    parser.add_argument("--stall-s", type=float, default=2.0, help="pause length (stalled)")
+    parser.add_argument("--stall-every-s", type=float, default=3.0)
+    parser.add_argument("--minutes", type=int, default=5, help="simulated minutes to replay")
+    parser.add_argument("--speed", type=float, default=60.0, help="replay speed-up (<= 0: unpaced)")
+    parser.add_argument("--updates-per-bar", type=int, default=4)
+    parser.add_argument("--replay-file", help="CSV/JSONL 1m bars instead of synthetic ones")
+    parser.add_argument("--queue-size", type=int, default=256)
+    parser.add_argument(
+        "--policy", default="drop_oldest", choices=["drop_oldest", "conflate", "disconnect"]
+    )
+    parser.add_argument("--drain-s", type=float, default=5.0, help="max wait for queues to empty")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", dest="json_out", help="also write the report to this file")
+    args = parser.parse_args()
+    return LoadTestConfig(
+        clients=args.clients,
+        symbols=args.symbols,
+        symbols_per_client=args.symbols_per_client,
+        wildcard_share=args.wildcard_share,
+        throttled_share=args.throttled_share,
+        max_rate=args.max_rate,
+        binary_share=args.binary_share,
+        batch_share=args.batch_share,
+        batch_ms=args.batch_ms,
+        tfs=[tf.strip() for tf in args.tfs.split(",") if tf.strip()],
+        profiles=_parse_profiles(args.profiles, args.slow_ms, args.stall_s, args.stall_every_s),
+        minutes=args.minutes,
+        speed=args.speed,
+        updates_per_bar=args.updates_per_bar,
+        replay_file=args.replay_file,
+        queue_size=args.queue_size,
+        policy=args.policy,
+        drain_s=args.drain_s,
+        seed=args.seed,
+        json_out=args.json_out,
+    )
+
+
+class InstrumentedHub(Hub):
+    """Hub that remembers when each ``(symbol, tf, seq)`` was fanned out."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.fanned_out: Dict[Tuple[str, str], Dict[int, float]] = {}
+
+    def fan_out(self, event: BarEvent) -> None:
+        started = time.perf_counter()
+        super().fan_out(event)
+        # Only keys with subscribers (or within their resume window) are numbered.
+        stream = self.streams.get(event.symbol, event.tf)
+        if stream is not None:
+            self.fanned_out.setdefault((event.symbol, event.tf), {})[stream.seq] = started
+
+
+@dataclass
+class ClientResult:
+    profile: str
+    frames: int = 0
+    bars: int = 0
+    gaps: int = 0  # seq numbers skipped: dropped, conflated or held back by maxRate
+    latencies: List[float] = field(default_factory=list)
+    closed_code: Optional[int] = None
+
+
+class SimulatedClient:
+    """Stand-in for a Starlette WebSocket that measures what the hub sends it."""
+
+    def __init__(self, hub: InstrumentedHub, profile: Profile, rng: random.Random) -> None:
+        self.hub = hub
+        self.profile = profile
+        self.result = ClientResult(profile.name)
+        self.last_seq: Dict[Tuple[str, str], int] = {}
+        self.symbol_ids: Dict[int, str] = {}
+        # Desynchronise stalls so clients do not all pause together.
+        self.next_stall = time.monotonic() + rng.uniform(0, profile.stall_every_s or 1.0)
+
+    async def accept(self) -> None:
+        return None
+
+    async def close(self, code: int = 1000) -> None:
+        self.result.closed_code = code
+
+    async def send_text(self, data: str) -> None:
+        message = json.loads(data)
+        if message["type"] == "bar":
+            self._on_bar(message["symbol"], message["tf"], message["seq"])
+        elif message["type"] == "batch":
+            for bar in message["messages"]:
+                if bar["type"] == "bar":
+                    self._on_bar(bar["symbol"], bar["tf"], bar["seq"])
+        elif message["type"] == "symbols":
+            self.symbol_ids.update({sid: sym for sym, sid in message["symbols"].items()})
+        await self._consume()
+
+    async def send_bytes(self, data: bytes) -> None:
+        size = BAR_STRUCT.size
+        for offset in range(0, len(data), size):  # several records when batching
+            bar = decode_binary(data[offset : offset + size])
+            self._on_bar(self.symbol_ids.get(bar["symbolId"], ""), bar["tf"], bar["seq"])
+        await self._consume()
+
+    def _on_bar(self, symbol: str, tf: str, seq: int) -> None:
+        now = time.perf_counter()
+        result = self.result
+        result.bars += 1
+        fanned = self.hub.fanned_out.get((symbol, tf), {}).get(seq)
+        if fanned is not None:
+            result.latencies.append(now - fanned)
+        last = self.last_seq.get((symbol, tf))
+        if last is not None and seq > last + 1:
+            result.gaps += seq - last - 1
+        self.last_seq[(symbol, tf)] = seq
+
+    async def _consume(self) -> None:
+        self.result.frames += 1
+        profile = self.profile
+        if profile.delay_ms:
+            await asyncio.sleep(profile.delay_ms / 1000)
+        if profile.stall_s and time.monotonic() >= self.next_stall:
+            await asyncio.sleep(profile.stall_s)
+            self.next_stall = time.monotonic() + profile.stall_every_s
+        else:
+            await asyncio.sleep(0)
+
+
+def _pick_profile(profiles: Sequence[Profile], rng: random.Random) -> Profile:
+    return rng.choices(profiles, weights=[p.share for p in profiles])[0]
+
+
+async def run(config: LoadTestConfig) -> Dict[str, Any]:
+    rng = random.Random(config.seed)
+    hub = InstrumentedHub(queue_size=config.queue_size, policy=config.policy)
+    if config.replay_file:
+        ticks = load_recorded(config.replay_file)
+        universe = sorted({t.symbol for t in ticks})
+    else:
+        universe = synthetic_symbols(config.symbols)
+        ticks = synthetic_ticks(
+            universe,
+            minutes=config.minutes,
+            updates_per_bar=config.updates_per_bar,
+            seed=config.seed,
+        )
+
+    clients: List[Tuple[SimulatedClient, ClientConnection]] = []
+    for _ in range(config.clients):
+        ws = SimulatedClient(hub, _pick_profile(config.profiles, rng), rng)
+        await hub.connect(ws, BINARY if rng.random() < config.binary_share else JSON)
+        clients.append((ws, hub.clients[ws]))
+        tf = rng.choice(list(config.tfs))
+        if rng.random() < config.wildcard_share:
+            symbols: Any = "*"
+        else:
+            symbols = rng.sample(universe, min(config.symbols_per_client, len(universe)))
+        max_rate = config.max_rate if rng.random() < config.throttled_share else None
+        hub.subscribe(ws, symbols, tf, max_rate=max_rate)
+        if rng.random() < config.batch_share:
+            hub.set_batch(ws, hub.parse_batch(config.batch_ms))
+
+    started = time.perf_counter()
+    replay = await ReplayFeed(hub, ticks, speed=config.speed).run()
+    hub.flush_bars(now_ms=2**62)  # close whatever the replay left open
+    replay_s = time.perf_counter() - started
+
+    deadline = time.monotonic() + config.drain_s
+    while hub._depth_total() and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    hub.wheel.stop()
+    for ws in list(hub.clients):
+        hub.disconnect(ws)
+
+    return _report(config, hub, clients, replay, replay_s)
+
+
+def _percentiles_ms(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p90": None, "p99": None, "max": None}
+    arr = np.asarray(values) * 1000
+    p50, p90, p99 = np.percentile(arr, [50, 90, 99]).tolist()
+    top = float(arr.max())
+    return {"p50": round(p50, 3), "p90": round(p90, 3), "p99": round(p99, 3), "max": round(top, 3)}
+
+
+def _report(
+    config: LoadTestConfig,
+    hub: InstrumentedHub,
+    clients: List[Tuple[SimulatedClient, ClientConnection]],
+    replay: Dict[str, float],
+    replay_s: float,
+) -> Dict[str, Any]:
+    by_profile: Dict[str, Dict[str, Any]] = {}
+    for profile in config.profiles:
+        members = [(ws.result, conn) for ws, conn in clients if ws.profile.name == profile.name]
+        if not members:
+            continue
+        latencies = [lat for result, _ in members for lat in result.latencies]
+        bars = sum(result.bars for result, _ in members)
+        dropped = sum(conn.dropped for _, conn in members)
+        conflated = sum(conn.conflated for _, conn in members)
+        by_profile[profile.name] = {
+            "clients": len(members),
+            "bars_received": bars,
+            "latency_ms": _percentiles_ms(latencies),
+            "dropped": dropped,
+            "conflated": conflated,
+            "drop_rate": round(dropped / (bars + dropped), 6) if bars + dropped else 0.0,
+            "seq_gaps": sum(result.gaps for result, _ in members),
+            "disconnected": sum(1 for result, _ in members if result.closed_code is not None),
+        }
+    all_latencies = [lat for ws, _ in clients for lat in ws.result.latencies]
+    return {
+        "config": {k: v for k, v in asdict(config).items() if k != "profiles"}
+        | {"profiles": [asdict(p) for p in config.profiles]},
+        "replay": {**replay, "wall_s": round(replay_s, 3)},
+        "hub": dict(hub.stats),
+        "latency_ms": _percentiles_ms(all_latencies),
+        "profiles": by_profile,
+    }
+
+
+def _print(report: Dict[str, Any]) -> None:
+    replay, stats = report["replay"], report["hub"]
+    print(
+        f"replayed {int(replay['ticks'])} ticks in {replay['wall_s']}s "
+        f"(max lag {replay['lag_s']:.3f}s); hub published {stats['published']} events, "
+        f"enqueued {stats['enqueued']} frames"
+    )
+    print(f"all clients latency ms: {report['latency_ms']}")
+    header = f"{'profile':<9}{'clients':>8}{'bars':>11}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>10}"
+    print(header + f"{'drop%':>9}{'confl':>9}{'gaps':>9}{'disc':>6}")
+    for name, row in report["profiles"].items():
+        lat = row["latency_ms"]
+        cells = [
+            lat[k] if lat[k] is not None else float("nan") for k in ("p50", "p90", "p99", "max")
+        ]
+        print(
+            f"{name:<9}{row['clients']:>8}{row['bars_received']:>11}"
+            + "".join(f"{c:>9.2f}" for c in cells[:3])
+            + f"{cells[3]:>10.2f}{row['drop_rate'] * 100:>9.3f}{row['conflated']:>9}"
+            + f"{row['seq_gaps']:>9}{row['disconnected']:>6}"
+        )
+
+
+def main() -> None:
+    config = parse_args()
+    report = asyncio.run(run(config))
+    _print(report)
+    if config.json_out:
+        Path(config.json_out).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()